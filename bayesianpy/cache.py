@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class LruCache:
+    """
+    A thread-safe, bounded least-recently-used cache. Entries are evicted once there are more than max_size
+    of them, or once the sum of their weights goes above max_weight (if specified). If ttl (seconds) is
+    specified, entries expire that long after they were put. on_evict(key, value) is called (outside of the
+    lock) for every entry that is evicted, expires, is replaced by a new value or is invalidated, e.g. to close
+    them.
+    """
+
+    def __init__(self, max_size: int=128, max_weight: int=None, weigher: Callable[[object], int]=None,
+                 ttl: float=None, on_evict: Callable[[Hashable, object], None]=None):
+        if max_size is not None and max_size < 1:
+            raise ValueError("max_size should be at least 1 (or None for no limit)")
+
+        self._max_size = max_size
+        self._max_weight = max_weight
+        self._weigher = weigher
+        self._entries = OrderedDict()
+        self._weights = {}
+        self._expiries = {}
+        self._ttl = ttl
+        self._on_evict = on_evict
+        self._weight = 0
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def resize(self, max_size: int=None, max_weight: int=None):
+        with self._lock:
+            if max_size is not None:
+                self._max_size = max_size
+            if max_weight is not None:
+                self._max_weight = max_weight
+            evicted = self._evict()
+
+        self._notify(evicted)
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self._misses += 1
+                return default
+
+            expired = self._expire(key)
+            if len(expired) == 0:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+
+            self._misses += 1
+
+        self._notify(expired)
+        return default
+
+    def put(self, key: Hashable, value, weight: int=None):
+        if weight is None:
+            weight = self._weigher(value) if self._weigher is not None else 0
+
+        with self._lock:
+            replaced = []
+            if key in self._entries:
+                if self._entries[key] is not value:
+                    replaced.append((key, self._entries[key]))
+                self._remove(key)
+
+            self._entries[key] = value
+            self._weights[key] = weight
+            self._weight += weight
+            if self._ttl is not None:
+                self._expiries[key] = time.monotonic() + self._ttl
+            evicted = replaced + self._evict()
+
+        self._notify(evicted)
+        return value
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], object], weight: int=None):
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+
+        # not holding the lock while the (probably slow) factory runs, the worst case is that two threads
+        # create the same value and the last one wins.
+        return self.put(key, factory(), weight=weight)
+
+    def invalidate(self, key: Hashable=None):
+        with self._lock:
+            if key is None:
+                removed = list(self._entries.items())
+                self._entries.clear()
+                self._weights.clear()
+                self._expiries.clear()
+                self._weight = 0
+            elif key in self._entries:
+                removed = [(key, self._entries[key])]
+                self._remove(key)
+            else:
+                removed = []
+
+        self._notify(removed)
+
+    def _expire(self, key: Hashable) -> list:
+        # removes the entry if its ttl has passed (called holding the lock).
+        if self._ttl is None or self._expiries[key] >= time.monotonic():
+            return []
+
+        expired = [(key, self._entries[key])]
+        self._remove(key)
+        self._expirations += 1
+        return expired
+
+    def _remove(self, key: Hashable):
+        del self._entries[key]
+        self._weight -= self._weights.pop(key)
+        self._expiries.pop(key, None)
+
+    def _evict(self) -> list:
+        evicted = []
+        while len(self._entries) > 0 and \
+                ((self._max_size is not None and len(self._entries) > self._max_size) or
+                     (self._max_weight is not None and self._weight > self._max_weight and len(self._entries) > 1)):
+            key, value = self._entries.popitem(last=False)
+            self._weight -= self._weights.pop(key)
+            self._expiries.pop(key, None)
+            self._evictions += 1
+            evicted.append((key, value))
+
+        return evicted
+
+    def _notify(self, evicted: list):
+        if self._on_evict is None:
+            return
+
+        for key, value in evicted:
+            self._on_evict(key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {'size': len(self._entries), 'weight': self._weight, 'hits': self._hits,
+                    'misses': self._misses, 'evictions': self._evictions, 'expirations': self._expirations,
+                    'hit_ratio': self._hits / total if total > 0 else 0.0}
+
+    def __contains__(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return False
+
+            expired = self._expire(key)
+
+        self._notify(expired)
+        return len(expired) == 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
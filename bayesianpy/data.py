@@ -1,9 +1,9 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import numpy as np
 import logging
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 import uuid
 import shutil
 from bayesianpy.jni import bayesServer, bayesServerAnalysis, bayesServerDiscovery, jp
@@ -15,17 +15,29 @@ import bayesianpy.distributed as dk
 from collections import defaultdict
 import bayesianpy.utils
 import bayesianpy.reader
+import hashlib
+import sqlite3
+import time
+import json
+import dask
 
 class DataFrameReader:
     def __init__(self, df):
         self._df = df
         self._row = None
         self._columns = df.columns.tolist()
+        # the df index of the row is at position 0 of each tuple
+        self._positions = {column: i + 1 for i, column in enumerate(self._columns)}
         self.reset()
         self.row_index = 0
         self._writer = DataFrameWriter(df)
 
     def __getattr__(self, key):
+        # only called for missing attributes; private ones (e.g. on a copy made without __init__) aren't columns,
+        # and looking them up as columns would recurse through self._positions.
+        if key.startswith('_'):
+            raise AttributeError(key)
+
         return self.__getitem__(key)
 
     def read(self) -> bool:
@@ -37,7 +49,8 @@ class DataFrameReader:
         return self._columns
 
     def reset(self) -> None:
-        self._iterator = self._df.itertuples()
+        self._iterator = self._df.itertuples(name=None)
+        self.row_index = 0
 
     def get_index(self):
         return self._row[0]
@@ -57,7 +70,8 @@ class DataFrameReader:
 
     def writer(self) -> 'DataFrameWriter':
         if self._row is not None:
-            return self._writer.with_index(self.get_index())
+            # the reader knows the position of the row already, so there's no need to look up the label.
+            return self._writer.at_position(self.row_index - 1)
         else:
             return self._writer
 
@@ -65,17 +79,15 @@ class DataFrameReader:
         self.writer().set_value(column, value)
 
     def __getitem__(self, key) -> object:
-        # the df index of the row is at index 0
-        try:
-            if type(key) is list:
-                print(key)
-                ix = [self._columns.index(key) + 1 for k in key]
-            else:
-                ix = self._columns.index(key) + 1
-            return self._row[ix]
-        except BaseException as e:
+        if type(key) is list:
+            return [self.__getitem__(k) for k in key]
+
+        position = self._positions.get(key)
+        if position is None or self._row is None:
             return None
 
+        return self._row[position]
+
     def __next__(self) -> 'DataFrameReader':
         if self.read():
             return self
@@ -86,47 +98,102 @@ class DataFrameReader:
         return self
 
 class DataFrameWriter:
+    """
+    Collects new columns for df, one typed array per column. Values are written by index label (with_index,
+    then set_value), by row position (at_position), or in bulk with set_values.
+    """
 
     def __init__(self, df):
         self._columns = {}
-        self._row_indices = set()
+        self._dtypes = {}
         self._df = df
+        self._index = pd.Index(df.index)
+        self._current_position = None
 
-    def with_index(self, index):
+    def positions(self, labels) -> np.ndarray:
+        """
+        Converts index labels to row positions, in one lookup.
+        """
+        positions = self._index.get_indexer(labels)
+        if (positions < 0).any():
+            raise IndexError("Labels {} are not in the index".format(
+                list(np.asarray(labels)[positions < 0][:10])))
 
-        if not bayesianpy.data.DataFrame.is_int(self._df.index.dtype):
-            raise IndexError("Index has to be of type int to use the Writer")
+        return positions
 
-        if index not in self._row_indices:
-            self._row_indices.add(index)
+    def with_index(self, index):
+        self._current_position = self._index.get_loc(index)
+        return self
 
-        self._current_row_index = index
+    def at_position(self, position: int):
+        self._current_position = position
         return self
 
+    def add_column(self, column, dtype=None, fill_value=None):
+        """
+        Allocates a column up front.
+        :param dtype: a numpy dtype, or a pandas extension dtype (e.g. 'Int64', 'boolean', 'category')
+        which the column is converted to in as_dataframe
+        :param fill_value: the value of rows that are never written, which defaults to the missing value
+        of the dtype
+        """
+        try:
+            np_dtype = np.dtype(dtype) if dtype is not None else np.dtype(np.float64)
+            self._dtypes.pop(column, None)
+        except TypeError:
+            # an extension dtype, which is stored as objects (or floats, if numeric) until the end.
+            pd_dtype = pd.api.types.pandas_dtype(dtype)
+            np_dtype = np.dtype(np.float64) if pd.api.types.is_numeric_dtype(pd_dtype) \
+                and not pd.api.types.is_bool_dtype(pd_dtype) else np.dtype(object)
+            self._dtypes[column] = pd_dtype
+
+        if fill_value is None:
+            fill_value = np.nan if np_dtype.kind in ('f', 'c', 'O') else np_dtype.type(0)
+            if np_dtype.kind == 'O' and column not in self._dtypes:
+                fill_value = ""
+
+        values = np.empty(len(self._index), dtype=np_dtype)
+        values[:] = fill_value
+        self._columns[column] = values
+        return values
+
+    def _allocate(self, column, value):
+        if isinstance(value, str):
+            return self.add_column(column, dtype=object, fill_value="")
+        elif isinstance(value, (bool, np.bool_)):
+            return self.add_column(column, dtype=bool, fill_value=False)
+        else:
+            return self.add_column(column, dtype=np.float64)
+
     def set_value(self, column, value):
-        if column not in self._columns:
-            if isinstance(value, str):
-                self._columns.update({
-                    column: np.empty((1, len(self._df)), dtype="object")
-                })
-                self._columns[column][:] = ""
-            elif isinstance(value, bool):
-                self._columns.update({
-                    column: np.empty((1, len(self._df)), dtype="bool")
-                })
-                self._columns[column][:] = False
-            else:
-                self._columns.update({
-                    column: np.empty((1, len(self._df)))
-                })
-                self._columns[column][:] = np.NAN
+        if self._current_position is None:
+            raise IndexError("Call with_index or at_position before setting a value")
+
+        values = self._columns.get(column)
+        if values is None:
+            values = self._allocate(column, value)
+
+        values[self._current_position] = value
+
+    def set_values(self, column, positions, values):
+        """
+        Writes values to the rows at positions (see positions() for converting labels).
+        """
+        values = np.asarray(values)
+        column_values = self._columns.get(column)
+        if column_values is None:
+            column_values = self.add_column(column, dtype=np.result_type(values.dtype, np.float64)) \
+                if values.dtype.kind in ('i', 'u', 'f', 'c') \
+                else self._allocate(column, values.flat[0] if values.size > 0 else np.nan)
 
-        self._columns[column][0, self._current_row_index] = value
+        column_values[positions] = values
 
     def as_dataframe(self):
-        self._columns['ix'] = np.array(self._df.index)
-        df = pd.DataFrame({key: col.flatten() for key,col in self._columns.items()})
-        return df.set_index('ix')
+        df = pd.DataFrame(self._columns, index=pd.Index(self._index, name='ix'))
+        for column, dtype in self._dtypes.items():
+            df[column] = df[column].astype(dtype)
+
+        return df
 
     def flush(self):
         self._df = self.get_dataframe()
@@ -139,13 +206,182 @@ class DataFrameWriter:
             return df.join(df1)
 
 
+class ColumnProfile:
+    """
+    Summary statistics for a single column. Distinct values are kept exactly up to the profiler's exact_limit,
+    beyond which the distinct count is a HyperLogLog estimate.
+    """
+    def __init__(self, name, dtype, count=0, null_count=0, minimum=None, maximum=None, values=None,
+                 registers=None, precision=12, exact_count=None, min_distinct=0):
+        self.name = name
+        self.dtype = dtype
+        self.count = count
+        self.null_count = null_count
+        self.min = minimum
+        self.max = maximum
+        self.values = values
+        self.registers = registers
+        self.precision = precision
+        self._exact_count = len(values) if values is not None else exact_count
+        # what's known for certain about the distinct count once it's approximate, e.g. when exact partitions
+        # are merged past exact_limit.
+        self._min_distinct = min_distinct
+
+    def is_exact(self) -> bool:
+        return self._exact_count is not None
+
+    def null_ratio(self) -> float:
+        return self.null_count / self.count if self.count > 0 else 0.0
+
+    def distinct(self, dropna=True) -> int:
+        """
+        :param dropna: if False, null counts as a value (the same as len(series.unique()))
+        """
+        n = self._exact_count if self.is_exact() else max(_hll_estimate(self.get_registers()), self._min_distinct)
+        return n if dropna or self.null_count == 0 else n + 1
+
+    def _lower_bound(self) -> int:
+        return self._exact_count if self.is_exact() else self._min_distinct
+
+    def get_registers(self) -> np.ndarray:
+        # only built from the exact values when they're needed (to merge with an approximate profile).
+        if self.registers is None:
+            self.registers = _hll_registers(pd.Series(list(self.values)), self.precision)
+
+        return self.registers
+
+    def merge(self, other: 'ColumnProfile', exact_limit: int) -> 'ColumnProfile':
+        values, registers = None, None
+        min_distinct = max(self._lower_bound(), other._lower_bound())
+        if self.values is not None and other.values is not None:
+            values = self.values | other.values
+
+        if values is None or len(values) > exact_limit:
+            if values is not None:
+                # the estimate can come in under the (known) size of the union, and so under exact_limit.
+                min_distinct = len(values)
+
+            values, registers = None, np.maximum(self.get_registers(), other.get_registers())
+
+        return ColumnProfile(self.name, self.dtype, self.count + other.count, self.null_count + other.null_count,
+                             _combine(min, self.min, other.min), _combine(max, self.max, other.max), values,
+                             registers, self.precision, min_distinct=min_distinct)
+
+
+def _combine(fn, a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+
+    return fn(a, b)
+
+
+def _hll_registers(series: pd.Series, precision: int) -> np.ndarray:
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    if len(series) == 0:
+        return registers
+
+    hashes = pd.util.hash_pandas_object(series, index=False).values
+    buckets = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    remainder = hashes & np.uint64((1 << (64 - precision)) - 1)
+    # the remainder is below 2**53, so it converts to a float exactly and frexp gives its bit length.
+    _, bit_length = np.frexp(remainder.astype(np.float64))
+    rank = (64 - precision - bit_length + 1).astype(np.uint8)
+    np.maximum.at(registers, buckets, rank)
+    return registers
+
+
+def _hll_estimate(registers: np.ndarray) -> int:
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)))
+    zeros = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * m and zeros > 0:
+        # linear counting for small cardinalities
+        estimate = m * np.log(m / zeros)
+
+    return int(round(estimate))
+
+
+def _profile_partition(df: pd.DataFrame, exact_limit: int, precision: int) -> Dict[object, ColumnProfile]:
+    profiles = {}
+    for col in df.columns:
+        series = df[col]
+        # everything is derived from the unique values, rather than scanning the column for each statistic.
+        unique = series.unique()
+        null_count = 0
+        nulls = pd.isnull(unique)
+        if nulls.any():
+            null_count = int(series.isnull().sum())
+            unique = unique[~nulls]
+
+        minimum, maximum = None, None
+        if len(unique) > 0 and (DataFrame.is_numeric(series.dtype) or DataFrame.is_bool(series.dtype)
+                                or DataFrame.is_timestamp(series.dtype)):
+            minimum, maximum = unique.min(), unique.max()
+
+        values, registers = None, None
+        if len(unique) <= exact_limit:
+            values = set(unique)
+        else:
+            registers = _hll_registers(pd.Series(unique), precision)
+
+        # the count of a single partition is always exact, even when there are too many values to keep.
+        profiles[col] = ColumnProfile(col, series.dtype, len(series), null_count, minimum, maximum, values,
+                                      registers, precision, exact_count=len(unique))
+
+    return profiles
+
+
+class ColumnProfiler:
+    """
+    Computes dtype, null count, min/ max and distinct counts for every column in a single pass over the data
+    (one dask.compute over all partitions for a Dask dataframe), so that AutoType, Filter and the coercion
+    functions don't each scan every column.
+    """
+    def __init__(self, df, exact_limit: int=1000, precision: int=12):
+        """
+        :param exact_limit: distinct values are counted exactly up to this many, and estimated beyond it
+        :param precision: the HyperLogLog precision (2**precision registers, ~1.04/sqrt(2**precision) error)
+        """
+        self._df = df
+        self._exact_limit = exact_limit
+        self._precision = precision
+        self._profiles = None
+
+    def profile(self) -> Dict[object, ColumnProfile]:
+        if self._profiles is not None:
+            return self._profiles
+
+        if isinstance(self._df, dd.DataFrame):
+            partitions = dask.compute(*[dask.delayed(_profile_partition)(p, self._exact_limit, self._precision)
+                                        for p in self._df.to_delayed()])
+        else:
+            partitions = [_profile_partition(self._df, self._exact_limit, self._precision)]
+
+        profiles = partitions[0]
+        for partition in partitions[1:]:
+            profiles = {col: profile.merge(partition[col], self._exact_limit) for col, profile in profiles.items()}
+
+        self._profiles = profiles
+        return profiles
+
+    def get(self, column) -> ColumnProfile:
+        return self.profile()[column]
+
+
 class AutoType:
-    def __init__(self, df, discrete=[], continuous=[], continuous_to_discrete_limit = 20, max_states=150):
+    def __init__(self, df, discrete=[], continuous=[], continuous_to_discrete_limit = 20, max_states=150,
+                 profiler: ColumnProfiler=None):
         self._df = df
         self._continuous_to_discrete_limit = continuous_to_discrete_limit
         self._continuous = continuous
         self._discrete = discrete
         self._max_states = max_states
+        # distinct counts only need to be exact up to the limits checked here.
+        self._profiler = profiler if profiler is not None \
+            else ColumnProfiler(df, exact_limit=max(continuous_to_discrete_limit, max_states) + 1)
 
     @listify
     def get_continuous_variables(self):
@@ -159,7 +395,7 @@ class AutoType:
                 elif not DataFrame.is_float(self._df[str(col)].dtype) and not DataFrame.is_int(self._df[str(col)].dtype):
                     continue
 
-                elif len(self._df[str(col)].unique()) > self._continuous_to_discrete_limit:
+                elif self._profiler.get(col).distinct(dropna=False) > self._continuous_to_discrete_limit:
                     yield str(col)
             except BaseException as e:
                 print(col, e)
@@ -168,7 +404,7 @@ class AutoType:
     def get_discrete_variables(self):
         continuous = set(self.get_continuous_variables())
         for col in self._df.columns.tolist():
-            l = len(dk.compute(self._df[str(col)].unique()))
+            l = self._profiler.get(col).distinct(dropna=False)
             if col in self._continuous:
                 continue
             elif l > self._max_states or l <= 1:
@@ -227,7 +463,8 @@ class DataFrame:
 
     @staticmethod
     def is_string(dtype):
-        return str(dtype) == "object" or str(dtype) == "O"
+        # Dask (and pandas 3) read strings in to a StringDtype rather than object.
+        return str(dtype) == "object" or str(dtype) == "O" or isinstance(dtype, pd.StringDtype)
 
     @staticmethod
     def could_be_int(col):
@@ -244,54 +481,90 @@ class DataFrame:
         return False
 
     @staticmethod
-    def coerce_to_numeric(df: pd.DataFrame, logger: logging.Logger, cutoff=0.10, ignore=[]) -> pd.DataFrame:
-        for col in df.columns:
-            if DataFrame.is_numeric(df[col].dtype):
-                continue
+    def _unique_values(df, columns: List[object], profiler: 'ColumnProfiler') -> Dict[object, np.ndarray]:
+        # non-null unique values per column, from the profile where it kept them and otherwise in one compute.
+        profiles = profiler.profile()
+        uniques = {col: np.array(list(profiles[col].values), dtype=object) for col in columns
+                   if profiles[col].values is not None}
+        remaining = [col for col in columns if col not in uniques]
+        if len(remaining) > 0:
+            computed = dask.compute(*[df[col].dropna().unique() for col in remaining]) \
+                if isinstance(df, dd.DataFrame) else [df[col].dropna().unique() for col in remaining]
+            uniques.update({col: np.asarray(values) for col, values in zip(remaining, computed)})
+
+        return uniques
 
-            if DataFrame.is_timestamp(df[col].dtype):
-                continue
+    @staticmethod
+    def _to_numeric(series: pd.Series, dtype) -> pd.Series:
+        return pd.to_numeric(series.astype(object), errors='coerce').astype(dtype)
 
-            if col in ignore:
-                continue
+    @staticmethod
+    def coerce_to_numeric(df: pd.DataFrame, logger: logging.Logger, cutoff=0.10, ignore=[],
+                          profiler: 'ColumnProfiler'=None) -> pd.DataFrame:
+        """
+        Converts (in place) columns to numeric where no more than cutoff of their distinct values can't be
+        parsed as numbers. Each column's distinct values are parsed once, and the result mapped back on to
+        the column.
+        """
+        columns = [col for col in df.columns if not DataFrame.is_numeric(df[col].dtype)
+                   and not DataFrame.is_timestamp(df[col].dtype) and col not in ignore]
+        if len(columns) == 0:
+            return df
+
+        profiler = profiler if profiler is not None else ColumnProfiler(df)
+        uniques = DataFrame._unique_values(df, columns, profiler)
 
-            values = df[col].dropna().unique()
+        for col in columns:
+            values = uniques[col]
             ratio = 0
-            pre_length = len(values)
+            new_values = None
 
-            if pre_length > 0:
-                new_values = pd.to_numeric(df[col].dropna().unique(), errors='coerce')
-                post_length = len(new_values[~np.isnan(new_values)])
-                ratio = (pre_length - post_length) / pre_length
+            if len(values) > 0:
+                new_values = pd.to_numeric(values, errors='coerce')
+                ratio = np.count_nonzero(np.isnan(new_values)) / len(values)
 
-            if ratio <= cutoff:
-                logger.debug("Converting column {} to numeric (ratio: {})".format(col, ratio))
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            else:
+            if ratio > cutoff:
                 logger.debug("Not converting column {} (ratio: {})".format(col, ratio))
-
-        return df
-
-    @staticmethod
-    def coerce_to_boolean(df: pd.DataFrame, ignore=[]):
-        for col in df.columns:
-            if col in ignore:
                 continue
 
-            if df[col].min() == df[col].max():
-                continue
-
-            if len(df[col].dropna().unique()) != 2:
-                continue
+            logger.debug("Converting column {} to numeric (ratio: {})".format(col, ratio))
+            if isinstance(df, dd.DataFrame):
+                # each partition is parsed alone, so settle the dtype from the whole column (as pandas would), and
+                # parse from object so Dask's string columns don't come back as nullable Int64/ Float64.
+                dtype = new_values.dtype if new_values is not None else np.dtype(np.float64)
+                if profiler.get(col).null_count > 0:
+                    dtype = np.result_type(dtype, np.float64)
+
+                df[col] = df[col].map_partitions(DataFrame._to_numeric, dtype, meta=(col, dtype))
+            elif new_values is not None and len(values) < len(df) / 2:
+                # far fewer distinct values than rows, so look up the parsed values rather than parse every row.
+                df[col] = df[col].map(pd.Series(new_values, index=values))
+            else:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
 
-            values = df[col].dropna().unique()
-            series = df[col].astype(bool)
+        return df
 
-            if len(df[df[col] == values[0]]) != len(series[series == True]) and \
-                            len(df[df[col] == values[1]]) != len(series[series == True]):
+    @staticmethod
+    def coerce_to_boolean(df: pd.DataFrame, ignore=[], profiler: 'ColumnProfiler'=None):
+        """
+        Converts (in place) columns with two distinct values, one of them falsy, to bool. Null values are
+        treated as True, as astype(bool) does.
+        """
+        profiler = profiler if profiler is not None else ColumnProfiler(df)
+        profiles = profiler.profile()
+        columns = [col for col in df.columns if col not in ignore and profiles[col].distinct() == 2]
+        if len(columns) == 0:
+            return df
+
+        counts = dask.compute(*[df[col].value_counts() for col in columns]) \
+            if isinstance(df, dd.DataFrame) else [df[col].value_counts() for col in columns]
+
+        for col, value_counts in zip(columns, counts):
+            trues = sum(count for value, count in value_counts.items() if bool(value)) + profiles[col].null_count
+            if trues not in value_counts.values:
                 continue
 
-            df[col] = series
+            df[col] = df[col].astype(bool)
 
         return df
 
@@ -326,12 +599,25 @@ class DataFrame:
 
 class DaskDataFrame:
 
-    def __init__(self, df: dd.DataFrame):
+    def __init__(self, df: dd.DataFrame, partition_lengths: List[int]=None):
+        """
+        :param partition_lengths: the number of rows in each partition, if already known (e.g. from
+        bayesianpy.distributed.parquet_partition_lengths)
+        """
         self._df = df
-        self.empty = all(p.empty for p in self._get_df_partitions())
+        if partition_lengths is not None:
+            dk.set_partition_lengths(df, partition_lengths)
+
+    @property
+    def empty(self):
+        # only computed when asked for, and then stops at the first partition with rows.
+        return dk.empty(self._df)
+
+    def partition_lengths(self) -> List[int]:
+        return dk.partition_lengths(self._df)
 
     def __len__(self):
-        return len(self._df)
+        return sum(self.partition_lengths())
 
     def __getattribute__(self, item):
         try:
@@ -347,60 +633,174 @@ class DaskDataFrame:
         for partitition in range(0, self._df.npartitions):
             yield self._df.get_partition(partitition).compute()
 
-    def to_sql(self, table, engine, index_label='ix', index=True):
-        for partition in range(0, self._df.npartitions):
-            df = self._df.get_partition(partition)
-            df.compute().to_sql(table, engine, if_exists='append', index_label=index_label, index=True)
+    def to_sql(self, table, engine, index_label='ix', index=True, chunksize=None, writers:int=None):
+        dk.to_sql(self._df, table, engine, index_label=index_label, index=index, if_exists='append',
+                  chunksize=chunksize, writers=writers)
 
 
 
 class Filter:
+    """
+    Column filters, computed from a single ColumnProfiler pass. Pass the same profiler to several filters (or use
+    apply) to avoid profiling the data again.
+    """
+
+    # HyperLogLog estimates above this fraction of the row count are checked exactly for remove_variable_variables
+    _ALL_UNIQUE_TOLERANCE = 0.9
+
+    @staticmethod
+    def _profiles(df, profiler: ColumnProfiler=None) -> Dict[object, ColumnProfile]:
+        return (profiler if profiler is not None else ColumnProfiler(df)).profile()
+
+    @staticmethod
+    def _static_variables(profiles: Dict[object, ColumnProfile], cutoff=1) -> List[object]:
+        return [col for col, profile in profiles.items() if profile.distinct(dropna=False) <= cutoff]
+
     @staticmethod
-    def remove_static_variables(df: pd.DataFrame, cutoff=1, logger:logging.Logger=None):
-        column_names = df.apply(lambda x: len(x.unique()) > cutoff)
+    def _variable_variables(df, profiles: Dict[object, ColumnProfile]) -> List[object]:
+        variable = []
+        candidates = []
+        for col, profile in profiles.items():
+            n = profile.distinct(dropna=False)
+            if profile.is_exact():
+                if n == profile.count:
+                    variable.append(col)
+            elif n >= profile.count * Filter._ALL_UNIQUE_TOLERANCE:
+                candidates.append(col)
+
+        if len(candidates) > 0:
+            # the estimate is too close to call, so count the candidate columns exactly (in one compute).
+            counts = dask.compute(*[df[col].nunique(dropna=False) for col in candidates]) \
+                if isinstance(df, dd.DataFrame) else [df[col].nunique(dropna=False) for col in candidates]
+            variable.extend(col for col, n in zip(candidates, counts) if n == profiles[col].count)
+
+        return variable
+
+    @staticmethod
+    def _mostly_empty_variables(profiles: Dict[object, ColumnProfile], cutoff=0.1) -> List[object]:
+        return [col for col, profile in profiles.items() if 1 - profile.null_ratio() <= cutoff]
+
+    @staticmethod
+    def _discrete_variables_with_too_many_states(profiles: Dict[object, ColumnProfile], num_states=30) \
+            -> List[object]:
+        return [col for col, profile in profiles.items()
+                if DataFrame.is_string(profile.dtype) and profile.distinct(dropna=False) >= num_states]
+
+    @staticmethod
+    def _project(df, remove: Iterable[object]):
+        remove = set(remove)
+        return df[[col for col in df.columns if col not in remove]]
+
+    @staticmethod
+    def remove_static_variables(df: pd.DataFrame, cutoff=1, logger:logging.Logger=None,
+                                profiler: ColumnProfiler=None):
+        remove = Filter._static_variables(Filter._profiles(df, profiler), cutoff)
 
         if logger is not None:
-            logger.info("Removing {}".format(", ".join(df.columns[column_names == False])))
+            logger.info("Removing {}".format(", ".join(str(col) for col in remove)))
 
-        return df[column_names[column_names == True].index.tolist()].copy()
+        return Filter._project(df, remove).copy()
 
     @staticmethod
-    def remove_variable_variables(df: pd.DataFrame):
-        column_names = df.apply(lambda x: len(x.unique()) != len(df))
-        return df[column_names[column_names == True].index.tolist()]
+    def remove_variable_variables(df: pd.DataFrame, profiler: ColumnProfiler=None):
+        return Filter._project(df, Filter._variable_variables(df, Filter._profiles(df, profiler)))
 
     @staticmethod
-    def remove_mostly_empty_variables(df: pd.DataFrame, cutoff=0.1):
-        length = len(df)
-        for column in df.columns.tolist():
-            if len(df[column].dropna()) / length <= cutoff:
-                df = df.drop(column, axis=1)
+    def remove_mostly_empty_variables(df: pd.DataFrame, cutoff=0.1, profiler: ColumnProfiler=None):
+        return Filter._project(df, Filter._mostly_empty_variables(Filter._profiles(df, profiler), cutoff))
 
-        return df
+    @staticmethod
+    def remove_discrete_variables_with_too_many_states(df: pd.DataFrame, num_states = 30,
+                                                       profiler: ColumnProfiler=None):
+        return Filter._project(df, Filter._discrete_variables_with_too_many_states(Filter._profiles(df, profiler),
+                                                                                   num_states))
+
+    @staticmethod
+    def apply(df: pd.DataFrame, profiler: ColumnProfiler=None, logger:logging.Logger=None):
+        """
+        Removes static variables, variables that are unique on every row and discrete variables with too many
+        states, from one profile of the data and with a single projection at the end.
+        """
+        profiles = Filter._profiles(df, profiler)
+        remove = set(Filter._static_variables(profiles))
+        remove.update(Filter._variable_variables(df, {col: profile for col, profile in profiles.items()
+                                                      if col not in remove}))
+        remove.update(Filter._discrete_variables_with_too_many_states(profiles))
+
+        if logger is not None:
+            logger.info("Removing {}".format(", ".join(str(col) for col in df.columns if col in remove)))
+
+        return Filter._project(df, remove)
+
+class Histogram:
+    """
+    A BayesServer HistogramDensity, with its bin edges and the cdf at each edge exported to NumPy so that its
+    (piecewise linear) cdf can be evaluated over a whole array at once.
+    """
+    def __init__(self, density):
+        """
+        :param density: the Java HistogramDensity, e.g. from create_histogram
+        """
+        self.density = density
+        self.edges = self._read_edges(density)
+        if self.edges[0] == self.edges[-1]:
+            # every value was the same, where the Java cdf is NaN; treat it as a step at that value.
+            self.cumulative = None
+        else:
+            self.cumulative = np.array([density.cdf(float(edge)) for edge in self.edges], dtype=np.float64)
 
     @staticmethod
-    def remove_discrete_variables_with_too_many_states(df: pd.DataFrame, num_states = 30):
-        column_names = df.select_dtypes(include=['object']).apply(lambda x: len(x.unique()) >= num_states)
-        cols = list(set(df.columns.tolist()) - set(column_names[column_names == True].index.tolist()))
-        return df[cols]
+    def _read_edges(density) -> np.ndarray:
+        # HistogramDensity doesn't expose its (contiguous) intervals, so find the list of them among its fields.
+        for field in density.getClass().getDeclaredFields():
+            field.setAccessible(True)
+            value = field.get(density)
+            if isinstance(value, jp.java.util.List):
+                intervals = list(value)
+                return np.array([float(interval.getMinimum()) for interval in intervals] +
+                                [float(intervals[-1].getMaximum())], dtype=np.float64)
+
+        raise ValueError("Could not find the intervals of the HistogramDensity")
 
     @staticmethod
-    def apply(df: pd.DataFrame):
-        return Filter.remove_discrete_variables_with_too_many_states(Filter.remove_variable_variables(Filter.remove_static_variables(df)))
+    def from_values(values) -> 'Histogram':
+        return Histogram(create_histogram(values))
+
+    def cdf(self, x):
+        """
+        :param x: a value or an array of values
+        :return: the cdf of x (as HistogramDensity.cdf), 0 below the first edge and 1 above the last, and NaN
+        where x is NaN
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if self.cumulative is None:
+            result = np.where(np.isnan(x), np.nan, np.where(x < self.edges[0], 0.0, 1.0))
+        else:
+            result = np.interp(x, self.edges, self.cumulative, left=0.0, right=1.0)
+
+        return float(result) if np.ndim(result) == 0 else result
+
 
 def create_histogram(series):
-    hdo = bayesServerAnalysis().HistogramDensityOptions()
-    values = []
-    for value in series.iteritems():
+    """
+    Learns a BayesServer HistogramDensity from the finite values in series.
+    """
+    values = np.asarray(series, dtype=np.float64)
+    # each distinct value is passed once, weighted by the number of times it occurs, which learns the same
+    # density with fewer objects to create in the JVM.
+    values, counts = np.unique(values[np.isfinite(values)], return_counts=True)
+    if len(values) == 0:
+        raise ValueError("Can't create a histogram without any finite values")
+
+    weighted_values = []
+    for value, count in zip(values.tolist(), counts.tolist()):
         v = bayesServerDiscovery().WeightedValue()
-        if np.isnan(value[1]) or np.isinf(value[1]):
-            continue
-        v.setValue(jp.java.lang.Double(value[1]))
-        v.setWeight(1.0)
-        values.append(v)
-
-    return bayesServerAnalysis().HistogramDensity.learn(jp.java.util.Arrays.asList(values), hdo)
+        v.setValue(jp.java.lang.Double(value))
+        v.setWeight(float(count))
+        weighted_values.append(v)
 
+    return bayesServerAnalysis().HistogramDensity.learn(jp.java.util.Arrays.asList(weighted_values),
+                                                        bayesServerAnalysis().HistogramDensityOptions())
 
 
 class DataSet:
@@ -420,6 +820,18 @@ class DataSet:
     def subset(self, indices:List[int]) -> 'DataSet':
         return DataSet(self.data.loc[indices], self._logger, identifier=self.uuid)
 
+    def create_subset_data_reader_command(self, indices:List[int]) -> bayesianpy.reader.CreatableWithDf:
+        return self.subset(indices).create_data_reader_command()
+
+    def supports_subsets(self) -> bool:
+        """
+        Whether the rows at given indices can be read (through create_subset_data_reader_command), which needs
+        the DataSet to implement subset or create_subset_data_reader_command itself.
+        """
+        cls = type(self)
+        return cls.subset is not DataSet.subset or \
+            cls.create_subset_data_reader_command is not DataSet.create_subset_data_reader_command
+
     def get_index_column(self):
         return "ix"
 
@@ -448,11 +860,28 @@ class DataSet:
 
 class DataTableDataSet(DataSet):
 
-    ''' Not very good for large datasets '''
+    ''' Holds the data in a BayesServer DataTable, in the JVM. '''
     def __init__(self, df: pd.DataFrame, logger: logging.Logger=None,
-                 identifier: str=None, weight_column: str=None,
+                 identifier: str=None, weight_column: str=None, chunk_size: int=10000
                  ):
+        """
+        :param chunk_size: the number of rows converted at a time when writing, which bounds the memory used
+        on top of the DataTable itself.
+        """
         super().__init__(df, logger, identifier, weight_column)
+        self._chunk_size = chunk_size
+
+    @staticmethod
+    def _to_java_values(series: pd.Series) -> list:
+        # native Python values (rather than numpy scalars) box straight in to java.lang types, with None as null.
+        values = series.values
+        if DataFrame.is_float(series.dtype) or DataFrame.is_string(series.dtype):
+            nulls = pd.isnull(values)
+            if nulls.any():
+                values = values.astype(object)
+                values[nulls] = None
+
+        return values.tolist()
 
     def write(self, if_exists:str=None):
         bayes = jp.JPackage("com.bayesserver")
@@ -466,8 +895,13 @@ class DataTableDataSet(DataSet):
             data_column = bayes_data.DataColumn(name, java_class)
             cols.add(data_column)
 
-        for index, row in self.data.iterrows():
-            data_table.getRows().add(row)
+        rows = data_table.getRows()
+        object_array = jp.JArray(jp.java.lang.Object)
+        for start in range(0, len(self.data), self._chunk_size):
+            chunk = self.data.iloc[start:start + self._chunk_size]
+            columns = [self._to_java_values(chunk[col]) for col in chunk.columns]
+            for row in zip(*columns):
+                rows.add(object_array(row))
 
         self._data_table = data_table
 
@@ -483,12 +917,17 @@ class DataTableDataSet(DataSet):
 
 
 class SqlDataSet(DataSet):
+    # above this many contiguous runs of indices, the subset is written to a table and joined on instead.
+    MAX_INDEX_RANGES = 50
+
     def __init__(self, df: pd.DataFrame, logger:logging.Logger=None, identifier=None, weight_column=None,
                     ):
         super().__init__(df, logger, identifier=identifier, weight_column=weight_column)
         self._engine = None
         self.table = "table_" + self.uuid
-
+        self._subset_tables = set()
+        self._reader_settings = {}
+        self._page_size = None
 
     def get_index_name(self):
         return "ix"
@@ -496,10 +935,89 @@ class SqlDataSet(DataSet):
     def get_connection(self):
         pass
 
-    def create_query(self):
-        return "select * from {} where {} in ({}) order by {} asc".format(self.table, self.get_index_name(),
-                                                                           ",".join(str(i) for
-                                                                                i in bayesianpy.distributed.compute(self.data.index).tolist()), self.get_index_name())
+    def _share_subset_tables(self, subset: 'SqlDataSet') -> 'SqlDataSet':
+        # subsets register their index tables with the parent, so they get dropped in the parent's cleanup,
+        # and read the same way as the parent.
+        subset._subset_tables = self._subset_tables
+        subset._reader_settings = dict(self._reader_settings)
+        subset._page_size = self._page_size
+        return subset
+
+    def use_connection_pool(self, enabled:bool=True, max_connections:int=4) -> 'SqlDataSet':
+        """
+        Read through pooled JDBC connections and cached prepared statements, rather than a new connection
+        per reader (see bayesianpy.reader.CreateSqlDataReaderCommand).
+        """
+        self._reader_settings.update({'pooled': enabled, 'max_connections': max_connections})
+        return self
+
+    def stream(self, fetch_size:int=10000, page_size:int=None) -> 'SqlDataSet':
+        """
+        Stream rows to the evidence readers rather than letting the JDBC driver buffer the whole result set,
+        so heap use stays flat regardless of the size of the table.
+        :param fetch_size: the number of rows fetched from the database at a time
+        :param page_size: if set, also split the query in to successive ix ranges of this many rows
+        """
+        self._reader_settings.update({'fetch_size': fetch_size, 'streaming': True})
+        self._page_size = page_size
+        return self
+
+    def is_streaming(self) -> bool:
+        return self._reader_settings.get('streaming', False)
+
+    def _create_queries(self, indices:List[int]=None):
+        if self._page_size is None:
+            return self.create_query(indices)
+
+        indices = np.unique(np.asarray(dk.compute(self.data.index) if indices is None else indices))
+        if len(indices) <= self._page_size:
+            return self.create_query(indices)
+
+        return [self.create_query(page) for page in np.array_split(indices,
+                                                                   int(np.ceil(len(indices) / self._page_size)))]
+
+    @staticmethod
+    def _to_ranges(indices: np.ndarray) -> List[Tuple[int, int]]:
+        if len(indices) == 0:
+            return []
+
+        breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+        starts = indices[np.concatenate(([0], breaks))]
+        ends = indices[np.concatenate((breaks - 1, [len(indices) - 1]))]
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def _write_subset_table(self, indices: np.ndarray) -> str:
+        # kept within Firebird's 31 character limit on identifiers.
+        digest = hashlib.blake2b(self.table.encode('utf-8'), digest_size=8)
+        digest.update(indices.tobytes())
+        name = "subset_{}".format(digest.hexdigest())
+        if name not in self._subset_tables:
+            pd.DataFrame({self.get_index_name(): indices}).to_sql(name, self._engine, if_exists='replace',
+                                                                  index=False)
+            self._subset_tables.add(name)
+
+        return name
+
+    def create_query(self, indices:List[int]=None):
+        ix = self.get_index_name()
+        indices = np.unique(np.asarray(dk.compute(self.data.index) if indices is None else indices))
+
+        if not DataFrame.is_int(indices.dtype):
+            return "select * from {} where {} in ({}) order by {} asc".format(self.table, ix,
+                                                                               ",".join(str(i) for i in indices.tolist()),
+                                                                               ix)
+
+        ranges = self._to_ranges(indices)
+        if len(ranges) == 0:
+            return "select * from {} where 1 = 0".format(self.table)
+
+        if len(ranges) <= self.MAX_INDEX_RANGES:
+            where = " or ".join("{} between {} and {}".format(ix, start, end) for start, end in ranges)
+            return "select * from {} where {} order by {} asc".format(self.table, where, ix)
+
+        subset_table = self._write_subset_table(indices)
+        return "select t.* from {0} t inner join {1} s on t.{2} = s.{2} order by t.{2} asc".format(self.table,
+                                                                                                  subset_table, ix)
 
     def create_data_reader_command(self):
         """
@@ -507,7 +1025,27 @@ class SqlDataSet(DataSet):
         :param indexes: training/ testing indexes
         :return: a a DatabaseDataReaderCommand
         """
-        return bayesianpy.reader.CreateSqlDataReaderCommand(self.get_connection(), self.create_query())
+        return bayesianpy.reader.CreateSqlDataReaderCommand(self.get_connection(), self._create_queries(),
+                                                            **self._reader_settings)
+
+    def create_subset_data_reader_command(self, indices:List[int]):
+        """
+        Get a data reader over a subset of the rows, without creating a new DataSet
+        :param indices: the training/ testing indexes
+        """
+        return bayesianpy.reader.CreateSqlDataReaderCommand(self.get_connection(), self._create_queries(indices),
+                                                            **self._reader_settings)
+
+    def cleanup(self):
+        for name in list(self._subset_tables):
+            try:
+                with self._engine.begin() as conn:
+                    conn.execute(text("drop table if exists {}".format(
+                        self._engine.dialect.identifier_preparer.quote(name))))
+            except BaseException as e:
+                self._logger.warning("Could not drop subset table {}: {}".format(name, e))
+
+            self._subset_tables.discard(name)
 
     def write(self, if_exists:str=None, use_index=True):
         self._logger.info("Writing rows to storage")
@@ -588,11 +1126,16 @@ class MysqlDataSet(SqlDataSet):
         return create_engine('mysql://{}:{}@{}/{}?charset={}'.format(username, password, server, database, self._encoding))
 
     def get_connection(self):
-        return "jdbc:mysql://{}:{}@{}/{}?charset={}".format(self._username, self._password, self._server, self._database, self._encoding)
+        connection = "jdbc:mysql://{}:{}@{}/{}?charset={}".format(self._username, self._password, self._server, self._database, self._encoding)
+        if self.is_streaming():
+            # Connector/J buffers the whole result set unless it's told to use a server side cursor.
+            connection += "&useCursorFetch=true"
+
+        return connection
 
     def subset(self, indices:List[int]) -> 'DataSet':
-        return MysqlDataSet(self.data.iloc[indices], self._username, self._password,
-                            self._server, identifier=self.uuid)
+        return self._share_subset_tables(MysqlDataSet(self.data.iloc[indices], self._username, self._password,
+                            self._server, identifier=self.uuid))
 
     def write(self, if_exists:str=None, use_index=True):
         jp.java.lang.Class.forName("com.mysql.jdbc.Driver",
@@ -629,8 +1172,8 @@ class FirebirdDataSet(SqlDataSet):
         return "jdbc:firebirdsql://{}:3050/{}?userName={}&password={}&sqlDialect=3".format(self._server, self.uuid, self._username, self._password)
 
     def subset(self, indices:List[int]) -> 'DataSet':
-        return FirebirdDataSet(self.data.iloc[indices], self._username, self._password,
-                            self._server, identifier=self.uuid)
+        return self._share_subset_tables(FirebirdDataSet(self.data.iloc[indices], self._username, self._password,
+                            self._server, identifier=self.uuid))
 
     def write(self, if_exists:str=None, use_index=True):
 
@@ -650,63 +1193,607 @@ class FirebirdDataSet(SqlDataSet):
 
         super().write(if_exists=if_exists)
 
+class SqliteBulkWriter:
+    """
+    Loads a Pandas or Dask dataframe in to a SQLite table in a single transaction, with journalling and syncing
+    switched off and rows inserted in chunks through executemany. The index on ix is built once all the rows are
+    in. Dask partitions are computed and written one at a time.
+    """
+
+    def __init__(self, path: str, table: str, logger: logging.Logger=None, chunk_size: int=50000,
+                 index_label: str='ix'):
+        self._path = path
+        self._table = table
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+        self._chunk_size = chunk_size
+        self._index_label = index_label
+
+    @staticmethod
+    def _to_sqlite_type(dtype) -> str:
+        # same declared types as pandas.to_sql, so the JDBC driver sees the same column types. Nullable
+        # (extension) dtypes are named in title case, e.g. Int64 or Float64.
+        name = str(dtype).lower()
+        if name in {"int8", "int16", "int32", "uint8", "uint16", "uint32"}:
+            return "INTEGER"
+        if DataFrame.is_int(name):
+            return "BIGINT"
+        if DataFrame.is_float(name):
+            return "FLOAT"
+        if DataFrame.is_bool(name) or name == "boolean":
+            return "BOOLEAN"
+        if DataFrame.is_timestamp(dtype):
+            return "TIMESTAMP"
+
+        return "TEXT"
+
+    @staticmethod
+    def _to_sqlite_values(series: pd.Series) -> list:
+        if pd.api.types.is_extension_array_dtype(series.dtype) and \
+                SqliteBulkWriter._to_sqlite_type(series.dtype) != "TEXT":
+            # pd.NA can't be bound, and the values come out of an object array as plain Python ints/ floats/ bools.
+            return series.astype(object).where(series.notna(), None).tolist()
+
+        if DataFrame.is_numeric(series.dtype) or DataFrame.is_bool(series.dtype):
+            # sqlite stores NaN as NULL
+            return series.tolist()
+
+        nulls = series.isnull()
+        if 'datetime64' in str(series.dtype):
+            series = series.dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+        elif DataFrame.is_timestamp(series.dtype):
+            series = series.astype(str)
+
+        return series.astype(object).where(~nulls, None).tolist()
+
+    def _columns(self, df, index: bool) -> List[Tuple[str, str]]:
+        columns = [(str(name), self._to_sqlite_type(dtype)) for name, dtype in zip(df.columns, df.dtypes)]
+        if index:
+            columns = [(self._index_label, self._to_sqlite_type(df.index.dtype))] + columns
+
+        return columns
+
+    def _rows(self, df: pd.DataFrame, index: bool):
+        for start in range(0, len(df), self._chunk_size):
+            chunk = df.iloc[start:start + self._chunk_size]
+            values = [self._to_sqlite_values(chunk[col]) for col in chunk.columns]
+            if index:
+                values = [self._to_sqlite_values(chunk.index.to_series())] + values
+
+            yield list(zip(*values))
+
+    def write(self, df, if_exists: str='replace', index: bool=True) -> int:
+        columns = self._columns(df, index)
+        insert = 'insert into "{}" ({}) values ({})'.format(self._table,
+                                                            ", ".join('"{}"'.format(name) for name, _ in columns),
+                                                            ", ".join("?" for _ in columns))
+        start = time.time()
+        rows = 0
+        conn = sqlite3.connect(self._path, isolation_level=None)
+        try:
+            conn.execute("pragma journal_mode=OFF")
+            conn.execute("pragma synchronous=OFF")
+            conn.execute("pragma temp_store=MEMORY")
+            conn.execute("begin")
+
+            exists = conn.execute("select count(*) from sqlite_master where type='table' and name=?",
+                                  (self._table,)).fetchone()[0] > 0
+            if exists and if_exists == 'fail':
+                raise ValueError("Table {} already exists".format(self._table))
+            if exists and if_exists == 'replace':
+                conn.execute('drop table "{}"'.format(self._table))
+
+            conn.execute('create table if not exists "{}" ({})'.format(
+                self._table, ", ".join('"{}" {}'.format(name, sql_type) for name, sql_type in columns)))
+
+            partitions = [df] if not hasattr(df, 'npartitions') else dk._get_df_partitions(df)
+            for partition in partitions:
+                for chunk in self._rows(partition, index):
+                    conn.executemany(insert, chunk)
+                    rows += len(chunk)
+
+            if index:
+                conn.execute('create index if not exists "ix_{0}_{1}" on "{0}" ("{1}")'.format(self._table,
+                                                                                           self._index_label))
+            conn.execute("commit")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("rollback")
+            raise
+        finally:
+            conn.close()
+
+        elapsed = time.time() - start
+        self._logger.info("Wrote {} rows to {} in {:.2f}s ({:.0f} rows/sec)".format(
+            rows, self._table, elapsed, rows / elapsed if elapsed > 0 else float(rows)))
+
+        return rows
+
+
+def hash_dataframe(df) -> str:
+    """
+    A content hash of a Pandas or Dask dataframe, taken from the schema and a per-row hash of the values/ index.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr([(str(c), str(t)) for c, t in zip(df.columns, df.dtypes)]).encode('utf-8'))
+    digest.update(str(df.index.dtype).encode('utf-8'))
+
+    if hasattr(df, 'npartitions'):
+        row_hashes = dk.compute(df.map_partitions(pd.util.hash_pandas_object, index=True, meta=('hash', 'uint64')))
+    else:
+        row_hashes = pd.util.hash_pandas_object(df, index=True)
+
+    digest.update(np.ascontiguousarray(row_hashes.values).tobytes())
+    return digest.hexdigest()
+
+
+class DatasetCache:
+    """
+    A folder of materialised datasets, named by their content hash and shared between runs and processes. Each
+    entry is reference counted (per process, so the references of a process that died without releasing them are
+    dropped), and once the folder grows beyond max_bytes the least recently used entries that nobody holds are
+    deleted. Counts and sizes are kept in a manifest, guarded by a lock file.
+    """
+
+    def __init__(self, folder: str, max_bytes: int=10 * 1024 ** 3, logger: logging.Logger=None,
+                 lock_timeout: float=60.0):
+        self._folder = folder
+        self._max_bytes = max_bytes
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+        self._lock_timeout = lock_timeout
+        self._manifest_path = os.path.join(folder, "manifest.json")
+        self._lock_path = os.path.join(folder, "manifest.lock")
+
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self._folder, "{}.db".format(key))
+
+    def _is_stale(self) -> bool:
+        # the lock is only held while the manifest is read/ written, so one that's older than the timeout was left
+        # behind by a process that died holding it.
+        try:
+            return time.time() - os.path.getmtime(self._lock_path) > self._lock_timeout
+        except FileNotFoundError:
+            return False
+
+    def _lock(self):
+        while True:
+            try:
+                fd = os.open(self._lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return
+            except FileExistsError:
+                if self._is_stale():
+                    self._logger.warning("Breaking stale dataset cache lock {}".format(self._lock_path))
+                    self._unlock()
+                    continue
+                time.sleep(0.01)
+
+    def _unlock(self):
+        try:
+            os.remove(self._lock_path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _is_running(pid: int) -> bool:
+        if os.name == 'nt':
+            # os.kill would terminate the process, so on Windows references are only ever dropped by release.
+            return True
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+
+        return True
+
+    def _read_manifest(self) -> Dict[str, dict]:
+        if not os.path.exists(self._manifest_path):
+            return {}
+
+        with open(self._manifest_path, 'r') as fh:
+            manifest = json.load(fh)
+
+        running = {}
+        for entry in manifest.values():
+            refs = entry['refs'] if isinstance(entry['refs'], dict) else {}
+            for pid in refs:
+                if pid not in running:
+                    running[pid] = self._is_running(int(pid))
+
+            entry['refs'] = {pid: count for pid, count in refs.items() if running[pid]}
+
+        return manifest
+
+    @staticmethod
+    def _add_ref(entry: dict, count: int):
+        pid = str(os.getpid())
+        refs = entry.setdefault('refs', {})
+        refs[pid] = refs.get(pid, 0) + count
+        if refs[pid] <= 0:
+            del refs[pid]
+
+    def _write_manifest(self, manifest: Dict[str, dict]):
+        tmp = "{}.{}".format(self._manifest_path, os.getpid())
+        with open(tmp, 'w') as fh:
+            json.dump(manifest, fh)
+        os.replace(tmp, self._manifest_path)
+
+    def _evict(self, manifest: Dict[str, dict]):
+        total = sum(entry['size'] for entry in manifest.values())
+        for key in sorted(manifest, key=lambda k: manifest[k]['last_used']):
+            if total <= self._max_bytes:
+                break
+
+            if len(manifest[key]['refs']) > 0:
+                continue
+
+            self._logger.debug("Evicting dataset {} from the cache".format(key))
+            try:
+                os.remove(self.get_path(key))
+            except FileNotFoundError:
+                pass
+
+            total -= manifest.pop(key)['size']
+
+    def acquire(self, key: str, writer) -> str:
+        """
+        Get the path to the dataset with the given key, calling writer(path) to materialise it if it's not there.
+        """
+        path = self.get_path(key)
+        self._lock()
+        try:
+            manifest = self._read_manifest()
+            if key in manifest and os.path.exists(path):
+                self._add_ref(manifest[key], 1)
+                manifest[key]['last_used'] = time.time()
+                self._write_manifest(manifest)
+                self._logger.info("Reusing cached dataset {}".format(key))
+                return path
+        finally:
+            self._unlock()
+
+        # write outside of the lock, to a temporary file, so other processes are only ever exposed to a complete db.
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        writer(tmp)
+
+        self._lock()
+        try:
+            manifest = self._read_manifest()
+            if key in manifest and os.path.exists(path):
+                os.remove(tmp)
+            else:
+                os.replace(tmp, path)
+                manifest[key] = {'refs': {}, 'size': os.path.getsize(path)}
+
+            self._add_ref(manifest[key], 1)
+
+            manifest[key]['last_used'] = time.time()
+            self._evict(manifest)
+            self._write_manifest(manifest)
+        finally:
+            self._unlock()
+
+        return path
+
+    def release(self, key: str):
+        self._lock()
+        try:
+            manifest = self._read_manifest()
+            if key in manifest:
+                self._add_ref(manifest[key], -1)
+                manifest[key]['last_used'] = time.time()
+                self._evict(manifest)
+                self._write_manifest(manifest)
+        finally:
+            self._unlock()
+
+
 class DefaultDataSet(SqlDataSet):
 
     def __init__(self, df: pd.DataFrame, db_folder:str=None, logger:logging.Logger=None, identifier=None, cleanup=True,
-                 overwrite_if_exists=True):
+                 overwrite_if_exists=True, bulk_write=True, content_addressed=False,
+                 cache_size:int=10 * 1024 ** 3):
+        """
+        :param content_addressed: name the SQLite db after a hash of the dataframe and keep it in a shared cache
+        folder (db_folder/cache), so identical data is only written once across runs and processes.
+        :param cache_size: the size (in bytes) the content addressed cache is trimmed to
+        """
+
+        if content_addressed and identifier is None:
+            identifier = hash_dataframe(df)
 
         super().__init__(df, logger, identifier)
 
         self._db_dir = db_folder if db_folder is not None \
             else bayesianpy.utils.get_path_to_parent_dir(os.path.basename(os.getcwd()))
 
+        self._content_addressed = content_addressed
+        self._cache_size = cache_size
+        self._cache = DatasetCache(os.path.join(self._db_dir, "cache"), max_bytes=cache_size,
+                                   logger=self._logger) if content_addressed else None
+        self._acquired = False
+        self._subset_keys = set()
+
         self._create_folder()
         self._cleanup = cleanup
         self._engine = self._create_sqlite_engine()
         self._overwrite = overwrite_if_exists
+        self._bulk_write = bulk_write
+
+    def _get_db_path(self):
+        if self._content_addressed:
+            return self._cache.get_path(self.uuid)
+
+        return "{}.db".format(os.path.join(self._db_dir, "db", self.uuid))
 
     def get_connection(self):
-        return "jdbc:sqlite:{}.db".format(os.path.join(self._db_dir, "db", self.uuid))
+        return "jdbc:sqlite:{}".format(self._get_db_path())
+
+    def _create_dense_queries(self, indices: np.ndarray):
+        # the db holds exactly these rows, so pages of the sorted indices can be selected by range.
+        ix = self.get_index_name()
+        if self._page_size is None or len(indices) <= self._page_size:
+            return "select * from {} order by {} asc".format(self.table, ix)
+
+        return ["select * from {0} where {1} between {2} and {3} order by {1} asc".format(self.table, ix, page[0],
+                                                                                            page[-1])
+                for page in np.array_split(indices, int(np.ceil(len(indices) / self._page_size)))]
+
+    def _write_subset_table(self, indices: np.ndarray) -> str:
+        if self._content_addressed:
+            raise ValueError("The cached db of a content addressed dataset is shared, so it isn't written to; read "
+                             "scattered subsets through create_subset_data_reader_command instead")
+
+        return super()._write_subset_table(indices)
+
+    def _acquire_subset(self, indices: np.ndarray) -> str:
+        # a content addressed db is shared with other processes and its size is recorded in the cache manifest, so
+        # it's never written to; scattered subsets are copied to a cached db of their own instead.
+        digest = hashlib.blake2b(self.uuid.encode('utf-8'), digest_size=16)
+        digest.update(indices.tobytes() if indices.dtype != object else repr(indices.tolist()).encode('utf-8'))
+        key = digest.hexdigest()
+        if key not in self._subset_keys:
+            self._cache.acquire(key, lambda path: SqliteBulkWriter(path, self.table, self._logger,
+                                                                   index_label=self.get_index_name())
+                                .write(self.data.loc[indices], if_exists='replace', index=True))
+            self._subset_keys.add(key)
+
+        return self._cache.get_path(key)
+
+    def create_data_reader_command(self):
+        if not self._content_addressed:
+            return super().create_data_reader_command()
+
+        indices = np.unique(np.asarray(dk.compute(self.data.index)))
+        return bayesianpy.reader.CreateSqlDataReaderCommand(self.get_connection(), self._create_dense_queries(indices),
+                                                            **self._reader_settings)
+
+    def create_subset_data_reader_command(self, indices:List[int]):
+        indices = np.unique(np.asarray(indices))
+        if not self._content_addressed or (DataFrame.is_int(indices.dtype)
+                                           and len(self._to_ranges(indices)) <= self.MAX_INDEX_RANGES):
+            return super().create_subset_data_reader_command(indices)
+
+        path = self._acquire_subset(indices)
+        return bayesianpy.reader.CreateSqlDataReaderCommand("jdbc:sqlite:{}".format(path),
+                                                            self._create_dense_queries(indices),
+                                                            **self._reader_settings)
 
     def _create_sqlite_engine(self):
-        filename = "sqlite:///{}.db".format(os.path.join(self._db_dir, "db", self.uuid))
-        return create_engine(filename)
+        return create_engine("sqlite:///{}".format(self._get_db_path()))
 
     def _create_folder(self):
         if not os.path.exists(os.path.join(self._db_dir, "db")):
             os.makedirs(os.path.join(self._db_dir, "db"))
 
+    def _write_to(self, path, if_exists:str=None, use_index=True):
+        SqliteBulkWriter(path, self.table, self._logger, index_label=self.get_index_name())\
+            .write(self.data, if_exists='replace' if if_exists is None else if_exists, index=use_index)
+
     def write(self, if_exists:str=None, use_index=True):
-        if os.path.exists(os.path.join(self._db_dir, "db", "{}.db".format(self.uuid))) and not self._overwrite:
+        if self._content_addressed:
+            if not self._acquired:
+                self._cache.acquire(self.uuid, lambda path: self._write_to(path, use_index=use_index))
+                self._acquired = True
             return
-        else:
+
+        if os.path.exists(self._get_db_path()) and not self._overwrite:
+            return
+
+        if not self._bulk_write:
             super().write(if_exists)
+            return
+
+        self._logger.info("Writing rows to storage")
+        self._write_to(self._get_db_path(), if_exists=if_exists, use_index=use_index)
+        self._logger.info("Finished writing rows to storage")
 
     def cleanup(self):
-        if self._cleanup:
+        if self._content_addressed:
+            # leave the db in the cache for the next run, just drop the reference to it.
+            if self._acquired:
+                self._cache.release(self.uuid)
+                self._acquired = False
+            for key in list(self._subset_keys):
+                self._cache.release(key)
+                self._subset_keys.discard(key)
+        elif self._cleanup:
             self._logger.debug("Cleaning up: deleting db folder")
             try:
                 shutil.rmtree(os.path.join(self._db_dir, "db"))
             except:
                 self._logger.error("Could not delete the db folder {} for some reason.".format(self._db_dir))
+        else:
+            super().cleanup()
+
+    def subset(self, indices:List[int]) -> 'DataSet':
+        if self._content_addressed:
+            # hashed (and cached) by its own content, so it never writes its rows under the parent's key.
+            return DefaultDataSet(self.data.loc[indices], self._db_dir, self._logger, content_addressed=True,
+                                  cache_size=self._cache_size)
+
+        return self._share_subset_tables(DefaultDataSet(self.data.loc[indices], self._db_dir, self._logger,
+                                                        identifier=self.uuid))
+
+
+class ArrowDataSet(DataSet):
+    """
+    Stores the data in an Arrow IPC file (or points at an existing Arrow/ Parquet file) which is memory mapped by
+    the evidence reader, rather than being copied in to a database. Columns are only read when the network
+    references them. Requires pyarrow.
+    """
+
+    def __init__(self, df: pd.DataFrame, db_folder:str=None, logger:logging.Logger=None, identifier=None,
+                 weight_column=None, path:str=None, rows_per_batch:int=65536, cleanup=True):
+        """
+        :param path: an existing .arrow/ .feather/ .parquet file containing the data (and an 'ix' column), which
+        will be used as-is instead of writing df out.
+        :param rows_per_batch: the size of the record batches written, which is also the granularity at which
+        subsets are read.
+        """
+        super().__init__(df, logger, identifier=identifier, weight_column=weight_column)
+
+        self._db_dir = db_folder if db_folder is not None \
+            else bayesianpy.utils.get_path_to_parent_dir(os.path.basename(os.getcwd()))
+
+        self._owns_file = path is None
+        self._path = path if path is not None else os.path.join(self._db_dir, "db", "{}.arrow".format(self.uuid))
+        self._rows_per_batch = rows_per_batch
+        self._cleanup = cleanup
+        self._batch_index = None
+        self._batches = None
+        self._row_filter = None
+
+    def get_path(self) -> str:
+        return self._path
+
+    def _to_table(self, df: pd.DataFrame, use_index=True):
+        import pyarrow as pa
+
+        if use_index:
+            df = df.copy()
+            df.insert(0, self.get_index_column(), df.index.values)
+
+        return pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+
+    def write(self, if_exists:str=None, use_index=True):
+        """
+        :param use_index: write the index to the 'ix' column, which is needed to take subsets of the rows
+        """
+        import pyarrow as pa
+
+        if not self._owns_file or (os.path.exists(self._path) and if_exists != 'replace'):
+            return
+
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        self._logger.info("Writing rows to {}".format(self._path))
+        tmp_path = "{}.{}.tmp".format(self._path, os.getpid())
+        writer = None
+        schema = None
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            partitions = dk._get_df_partitions(self.data) if isinstance(self.data, dd.DataFrame) else [self.data]
+            for partition in partitions:
+                table = self._to_table(partition, use_index=use_index)
+                if writer is None:
+                    schema = table.schema
+                    writer = pa.ipc.new_file(sink, schema)
+                else:
+                    # keep the schema of the first partition, so all-null columns don't change type
+                    table = table.cast(schema)
+
+                writer.write_table(table, max_chunksize=self._rows_per_batch)
+
+            if writer is not None:
+                writer.close()
+
+        os.replace(tmp_path, self._path)
+        self._logger.info("Finished writing rows to storage")
+
+    def _get_batch_index(self) -> List[np.ndarray]:
+        # the index values of every batch, only reading the index column.
+        if self._batch_index is None:
+            arrow_file = bayesianpy.reader.ArrowFile(self._path)
+            if self.get_index_column() not in arrow_file.column_names:
+                raise ValueError("{} has no {} column, so subsets of its rows can't be taken (write it with "
+                                 "use_index=True)".format(self._path, self.get_index_column()))
+
+            self._batch_index = [np.asarray(arrow_file.read_column(i, self.get_index_column()).to_pylist())
+                                 for i in range(arrow_file.num_batches)]
+
+        return self._batch_index
 
     def subset(self, indices:List[int]) -> 'DataSet':
-        return DefaultDataSet(self.data.loc[indices], self._db_dir, self._logger, identifier=self.uuid)
+        """
+        Selects the rows in indices by reading only the batches that contain any of them, with a row mask
+        for the batches that are only partially selected.
+        """
+        subset = ArrowDataSet(self.data.loc[indices], self._db_dir, self._logger, identifier=self.uuid,
+                              weight_column=self._weight_column, path=self._path,
+                              rows_per_batch=self._rows_per_batch, cleanup=False)
+
+        indices = np.asarray(indices)
+        subset._batch_index = self._get_batch_index()
+        subset._batches = []
+        subset._row_filter = {}
+        for i, batch_index in enumerate(subset._batch_index):
+            if self._batches is not None and i not in self._batches:
+                continue
+
+            mask = np.isin(batch_index, indices)
+            if self._row_filter is not None and i in self._row_filter:
+                positions = self._row_filter[i][mask[self._row_filter[i]]]
+            else:
+                positions = np.flatnonzero(mask)
+
+            if len(positions) == 0:
+                continue
+
+            subset._batches.append(i)
+            if len(positions) < len(batch_index):
+                subset._row_filter[i] = positions
+
+        return subset
+
+    def create_data_reader_command(self):
+        return bayesianpy.reader.CreateArrowDataReaderCommand(self._path, self._batches, self._row_filter)
+
+    def cleanup(self):
+        if self._owns_file and self._cleanup and os.path.exists(self._path):
+            self._logger.debug("Cleaning up: deleting {}".format(self._path))
+            os.remove(self._path)
 
 
 class DaskDataset(DataSet):
-    def __init__(self, df: dd.DataFrame):
+    def __init__(self, df: dd.DataFrame, cache_partitions: bool=False, memory_budget: int=1024 ** 3,
+                 disk_budget: int=10 * 1024 ** 3):
+        """
+        :param cache_partitions: keep computed partitions between EM iterations (see
+        bayesianpy.reader.PandasDataReaderCommand), until cleanup is called.
+        """
         super().__init__(df)
         self._df = df
+        self._reader_settings = {'cache_partitions': cache_partitions, 'memory_budget': memory_budget,
+                                 'disk_budget': disk_budget}
+        self._commands = []
 
     def get_dataframe(self) -> dd.DataFrame:
         return self._df
 
     def create_data_reader_command(self):
-        return bayesianpy.reader.CreateDataFrameReaderCommand(self._df)
+        command = bayesianpy.reader.CreateDataFrameReaderCommand(self._df, **self._reader_settings)
+        self._commands.append(command)
+        return command
 
     def cleanup(self):
-        pass
+        for command in self._commands:
+            command.close()
+
+        self._commands = []
 
     def subset(self, indices:List[int]):
         try:
@@ -717,7 +1804,7 @@ class DaskDataset(DataSet):
 
 
 def as_probability(series, output_column='cdf'):
-    hist = create_histogram(series)
+    hist = Histogram.from_values(series)
     df = pd.DataFrame(series)
-    df[output_column] = series.apply(lambda x: hist.cdf(x))
+    df[output_column] = hist.cdf(series.values.astype(np.float64))
     return df
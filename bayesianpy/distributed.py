@@ -1,10 +1,16 @@
-from typing import Iterable
+from typing import Iterable, List
 import pandas as pd
 import dask.dataframe as dd
 import dask.array as da
 import numpy as np
 import pathos.multiprocessing as mp
 import logging
+import dask
+import queue
+import threading
+import time
+from bayesianpy.cache import LruCache
+from bayesianpy.decorators import deprecated
 
 class DaskPool:
     '''
@@ -62,12 +68,68 @@ def compute(df):
     return df
 
 
+# partition lengths and emptiness by Dask graph name (which changes whenever the dataframe does).
+_partition_lengths = LruCache(max_size=64)
+_empty = LruCache(max_size=64)
+
+
+def _is_dask(df):
+    return hasattr(df, 'npartitions')
+
+
+def set_partition_lengths(df, lengths: List[int]):
+    """
+    Records known partition lengths for df (e.g. from Parquet footers), so they don't need computing.
+    """
+    if len(lengths) != df.npartitions:
+        raise ValueError("Expected {} partition lengths, got {}".format(df.npartitions, len(lengths)))
+
+    _partition_lengths.put(df._name, list(lengths))
+
+
+def partition_lengths(df) -> List[int]:
+    """
+    The number of rows in each partition, computed in one pass and cached for the dataframe.
+    """
+    if not _is_dask(df):
+        return [len(df)]
+
+    lengths = _partition_lengths.get(df._name)
+    if lengths is None:
+        lengths = list(df.map_partitions(len).compute())
+        _partition_lengths.put(df._name, lengths)
+
+    return lengths
+
+
 def empty(df):
-    if not hasattr(df, 'empty'):
-        return all(p.empty for p in _get_df_partitions(df))
-    else:
+    if not _is_dask(df):
         return df.empty
 
+    lengths = _partition_lengths.get(df._name)
+    if lengths is not None:
+        return sum(lengths) == 0
+
+    def is_empty():
+        # stop at the first partition with any rows, rather than computing all of them.
+        for partition in range(df.npartitions):
+            if len(df.get_partition(partition)) > 0:
+                return False
+
+        return True
+
+    return _empty.get_or_create(df._name, is_empty)
+
+
+def parquet_partition_lengths(paths: List[str]) -> List[int]:
+    """
+    Reads the row counts from the footers of Parquet files, without reading any data. Requires pyarrow.
+    :param paths: the files, in partition order
+    """
+    import pyarrow.parquet as pq
+
+    return [pq.ParquetFile(path).metadata.num_rows for path in paths]
+
 
 def _get_df_partitions(df) -> Iterable[pd.DataFrame]:
     for partitition in range(0, df.npartitions):
@@ -77,39 +139,152 @@ def _get_df_partitions(df) -> Iterable[pd.DataFrame]:
 def _is_pandas(df):
     return isinstance(df, pd.DataFrame)
 
+@deprecated("Use 'create_increasing_index', which doesn't shuffle")
 def slowly_create_increasing_index(ddf:dd.DataFrame) -> dd.DataFrame:
     ddf['cs'] = 1
     ddf['cs'] = ddf.cs.cumsum()
     return ddf.set_index('cs')
 
-def create_increasing_index(ddf:dd.DataFrame) -> dd.DataFrame:
-    mps = int(len(ddf) / ddf.npartitions + 1000)
-    values = ddf.index.values
 
-    def do(x, max_partition_size, block_id=None):
-        length = len(x)
+def _with_range_index(df: pd.DataFrame, start: int, name: str) -> pd.DataFrame:
+    df = df.copy(deep=False)
+    df.index = pd.RangeIndex(start, start + len(df), name=name)
+    return df
+
+
+def create_increasing_index(ddf:dd.DataFrame, name:str='ix') -> dd.DataFrame:
+    """
+    Replaces the index with a dense, increasing int index (0..n-1) without a shuffle: partition lengths are
+    computed in one pass, each partition is offset by the length of the ones before it, and the result has
+    known divisions. Empty partitions are dropped.
+    """
+    lengths = partition_lengths(ddf)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+    meta = _with_range_index(ddf._meta, 0, name)
+
+    parts = []
+    divisions = []
+    for partition, offset, length in zip(ddf.to_delayed(), offsets, lengths):
         if length == 0:
-            raise ValueError("Does not work with empty partitions. Consider using dask.repartition.")
+            continue
+
+        parts.append(dask.delayed(_with_range_index)(partition, int(offset), name))
+        divisions.append(int(offset))
+
+    if len(parts) == 0:
+        return dd.from_pandas(meta, npartitions=1)
+
+    divisions.append(int(sum(lengths)) - 1)
+    indexed = dd.from_delayed(parts, meta=meta, divisions=divisions)
+    set_partition_lengths(indexed, [length for length in lengths if length > 0])
+    return indexed
+
+
+def _default_writers(engine) -> int:
+    # SQLite only allows one writer at a time, server databases get a connection per writer from the pool.
+    if engine.dialect.name == 'sqlite':
+        return 1
+
+    return min(4, mp.cpu_count())
+
+
+def _write_partitions(df, table, engine, index_label, index, chunksize, writers, queue_depth) -> int:
+    partitions = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+    errors = []
+    rows = [0]
+    lock = threading.Lock()
 
-        start = block_id[0] * max_partition_size
-        return da.arange(start, start+length, chunks=1)
+    def put(item):
+        while not stop.is_set():
+            try:
+                partitions.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
 
-    series = values.map_blocks(do, max_partition_size=mps, dtype=np.int64)
-    ddf2 = dd.concat([ddf, dd.from_array(series)], axis=1)
-    return ddf
+        return False
 
+    def produce():
+        try:
+            # compute a queue's worth of partitions at a time, in parallel on the scheduler.
+            for start in range(0, df.npartitions, queue_depth):
+                group = range(start, min(start + queue_depth, df.npartitions))
+                for partition in dask.compute(*[df.get_partition(i) for i in group]):
+                    if not put(partition):
+                        return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            for _ in range(writers):
+                put(None)
 
-def to_sql(df, table, engine, index_label='ix', index=True, if_exists=None):
-    if hasattr(df, 'to_sql'):
+    def write():
+        while not stop.is_set():
+            try:
+                partition = partitions.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if partition is None:
+                return
+
+            try:
+                partition.to_sql(table, engine, if_exists='append', index_label=index_label, index=index,
+                                 chunksize=chunksize)
+                with lock:
+                    rows[0] += len(partition)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+                return
+
+    threads = [threading.Thread(target=produce, daemon=True)] + \
+              [threading.Thread(target=write, daemon=True) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads[1:]:
+        thread.join()
+
+    stop.set()
+    threads[0].join()
+
+    if len(errors) > 0:
+        raise errors[0]
+
+    return rows[0]
+
+
+def to_sql(df, table, engine, index_label='ix', index=True, if_exists=None, chunksize=None, writers:int=None,
+           queue_depth:int=None):
+    """
+    Writes a pandas or Dask dataframe to a table. Dask partitions are computed in parallel on the scheduler
+    and passed through a bounded queue to one or more writer threads.
+    :param chunksize: the number of rows per insert batch
+    :param writers: the number of concurrent writers (defaults to 1 for SQLite, up to 4 otherwise)
+    :param queue_depth: the maximum number of computed partitions waiting to be written
+    """
+    if hasattr(df, 'to_sql') and not _is_dask(df):
         mode = 'replace'
         if if_exists is not None:
             mode = if_exists
         #a = "replace" if_exists is not None else if_exists
-        df.to_sql(table, engine, if_exists=mode, index_label=index_label, index=index)
+        df.to_sql(table, engine, if_exists=mode, index_label=index_label, index=index, chunksize=chunksize)
     else:
+        logger = logging.getLogger(__name__)
         mode = 'append'
         if if_exists is not None:
             mode = if_exists
 
-        for partition in _get_df_partitions(df):
-            partition.to_sql(table, engine, if_exists=mode, index_label=index_label, index=index)
+        writers = _default_writers(engine) if writers is None else writers
+        queue_depth = max(writers * 2, 2) if queue_depth is None else queue_depth
+
+        # create the table (or apply if_exists) from the empty metadata, so the writers can all append.
+        df._meta.to_sql(table, engine, if_exists=mode, index_label=index_label, index=index)
+
+        start = time.time()
+        rows = _write_partitions(df, table, engine, index_label, index, chunksize, writers, queue_depth)
+        elapsed = time.time() - start
+        logger.info("Wrote {} rows from {} partitions with {} writer(s) in {:.2f}s ({:.0f} rows/sec)"
+                    .format(rows, df.npartitions, writers, elapsed, rows / elapsed if elapsed > 0 else 0))
@@ -181,6 +181,7 @@ class TableIterator:
 
     def set_table(self) -> None:
         self._node.setDistribution(self._iterator.getTable())
+        bayesianpy.network.bump_network_version(self._node.getNetwork())
 
     def __next__(self) -> 'TableIterator':
         if self.read():
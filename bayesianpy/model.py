@@ -19,9 +19,13 @@ import logging
 import multiprocess.context as ctx
 import pathos.multiprocessing as mp
 import itertools
+import inspect
+import hashlib
+import copy
 import math
 import bayesianpy.reader
-from typing import List, Dict, Tuple
+from bayesianpy.cache import LruCache
+from typing import List, Dict, Tuple, Union
 import dask.dataframe as dd
 import dill
 
@@ -32,6 +36,12 @@ class QueryOutput:
 
 
 class QueryBase:
+    def __new__(cls, *args, **kwargs):
+        query = super().__new__(cls)
+        # the constructor's arguments are kept, as they're what identifies the query (setup changes the rest).
+        query._settings = (args, kwargs)
+        return query
+
     def setup(self, network, inference_engine, query_options) -> None:
         pass
 
@@ -41,19 +51,111 @@ class QueryBase:
     def reset(self):
         pass
 
+    def clone(self) -> 'QueryBase':
+        """
+        A new instance with (copies of) the same constructor arguments, which shares no state with this one.
+        """
+        args, kwargs = copy.deepcopy(self._settings)
+        return type(self)(*args, **kwargs)
+
+    def signature(self) -> tuple:
+        """
+        Identifies what the query returns, for caching results: the class and its constructor arguments
+        (including defaults).
+        """
+        args, kwargs = self._settings
+        try:
+            bound = inspect.signature(type(self).__init__).bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            settings = tuple((name, _signature_of(value)) for name, value in list(bound.arguments.items())[1:])
+        except TypeError:
+            settings = (_signature_of(args), _signature_of(kwargs))
+
+        return (type(self).__name__,) + settings
+
+
+def _signature_of(value):
+    """
+    A hashable stand in for a query's constructor argument (or the evidence). Arrays are hashed in full, as their
+    repr is truncated.
+    """
+    if value is None or isinstance(value, (bool, int, str, bytes)):
+        return value
+
+    if isinstance(value, float):
+        # NaN never equals itself, which would make the key miss every time.
+        return ('float', repr(value))
+
+    if isinstance(value, np.generic):
+        return _signature_of(value.item())
+
+    if isinstance(value, pd.Index):
+        return ('Index', _signature_of(value.name), _signature_of(value.to_numpy()))
+
+    if isinstance(value, pd.Series):
+        return ('Series', _signature_of(value.name), _signature_of(value.index), _signature_of(value.to_numpy()))
+
+    if isinstance(value, pd.DataFrame):
+        return ('DataFrame', _signature_of(value.columns), _signature_of(value.index),
+                tuple(_signature_of(value[column]) for column in value.columns))
+
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return ('ndarray', value.shape, _signature_of(value.tolist()))
+
+        return ('ndarray', value.dtype.str, value.shape,
+                hashlib.blake2b(np.ascontiguousarray(value).tobytes(), digest_size=16).hexdigest())
+
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(_signature_of(v) for v in value)
+
+    if isinstance(value, dict):
+        return ('dict',) + tuple(sorted(((repr(k), _signature_of(v)) for k, v in value.items()), key=repr))
+
+    if isinstance(value, (set, frozenset)):
+        return ('set',) + tuple(sorted((_signature_of(v) for v in value), key=repr))
+
+    return (type(value).__name__, repr(value))
+
+
+class QueryResultCache:
+    """
+    A bounded cache of Query results, keyed by a hash of the network's content (recomputed whenever the network
+    changes, see bayesianpy.network.bump_network_version), the evidence and the queries.
+    """
+    def __init__(self, max_size: int=10000, ttl: float=None):
+        """
+        :param ttl: the number of seconds results are kept for, or None to keep them until they're evicted
+        """
+        self._cache = LruCache(max_size=max_size, ttl=ttl)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def put(self, key, results: List[dict]):
+        self._cache.put(key, results)
+
+    def invalidate(self):
+        self._cache.invalidate()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
 
 class QueryContext(object):
 
-    def __init__(self, network: bayesianpy.network.Network):
+    def __init__(self, network: bayesianpy.network.Network, cache: QueryResultCache=None):
         self._engine = None
         self._evidence = None
         self._network = network
         self._query = None
+        self._cache = cache
 
     def __enter__(self) -> Tuple['InferenceEngine', 'Evidence', 'Query']:
         self._engine = InferenceEngine(self._network.jclass()).create_engine()
         self._evidence = Evidence(self._network.jclass(), self._engine)
-        self._query = Query(self._network.jclass(), self._engine, logging.getLogger(__name__))
+        self._query = Query(self._network.jclass(), self._engine, logging.getLogger(__name__),
+                            cache=self._cache, evidence=self._evidence)
         return (self._engine, self._evidence, self._query)
 
     def __exit__(self, type, value, traceback):
@@ -93,20 +195,63 @@ class InferenceEngine:
 
 
 class Query:
-    def __init__(self, network, inference_engine, logger):
+    def __init__(self, network, inference_engine, logger, cache: QueryResultCache=None,
+                 evidence: 'Evidence'=None):
+        """
+        :param cache: where to memoise results. Results are only cached when the evidence is known (an Evidence
+        instance is passed to execute, or evidence is the one set through the Evidence given here). Changes made
+        to the network through the Java API need to be followed by bayesianpy.network.bump_network_version.
+        :param evidence: the Evidence used to set evidence on inference_engine
+        """
         self._factory = bayesServerInference().RelevanceTreeInferenceFactory()
         self._query_options = self._factory.createQueryOptions()
         self._query_output = self._factory.createQueryOutput()
         self._inference_engine = inference_engine
         self._network = network
         self._logger = logger
+        self._cache = cache
+        self._evidence = evidence
+
+    def _get_evidence(self, evidence) -> 'Evidence':
+        if isinstance(evidence, Evidence):
+            return evidence
+
+        if self._evidence is not None and (evidence is None or evidence is self._evidence.get_evidence()):
+            return self._evidence
+
+        return None
+
+    def _get_network_key(self) -> str:
+        # a hash of the network's content, so a cache can be shared between (copies of) networks. It's memoised
+        # against the network's version, so it's only recomputed once the network has changed.
+        return bayesianpy.network.memoise(self._network, 'content_hash',
+                                          lambda: bayesianpy.network.content_hash(self._network.saveToString()))
+
+    def _cache_key(self, queries: List[QueryBase], evidence: 'Evidence'):
+        return (self._get_network_key(), evidence.signature(), tuple(query.signature() for query in queries))
+
+    def get_cache_statistics(self) -> dict:
+        return self._cache.stats() if self._cache is not None else {}
 
     def execute(self, queries: List[QueryBase], evidence=None, clear_evidence=True, aslist=True):
         """
                Query a number of variables (if none, then query all variables in the network)
                :param variables: a list of variables, or none
+               :param evidence: the (Java) evidence, or an Evidence instance
                :return: a QueryOutput object with separate continuous/ discrete dataframes
                """
+        tracked = self._get_evidence(evidence)
+        if isinstance(evidence, Evidence):
+            evidence = evidence.get_evidence()
+
+        key = None
+        if self._cache is not None and tracked is not None:
+            key = self._cache_key(queries, tracked)
+            results = self._cache.get(key)
+            if results is not None:
+                return self._finish([dict(result) for result in results], queries, evidence, tracked,
+                                    clear_evidence, aslist)
+
         for query in queries:
             query.reset()
             query.setup(self._network, self._inference_engine, self._query_options)
@@ -114,17 +259,28 @@ class Query:
         if evidence is not None:
             self._inference_engine.setEvidence(evidence)
 
+        failed = False
         try:
             self._inference_engine.query(self._query_options, self._query_output)
         except BaseException as e:
             self._logger.error(e)
+            failed = True
 
         results = []
         for query in queries:
             results.append(query.results(self._inference_engine, self._query_output))
 
+        # whatever came out of a failed query isn't worth replaying.
+        if key is not None and not failed:
+            self._cache.put(key, [dict(result) for result in results])
+
+        return self._finish(results, queries, evidence, tracked, clear_evidence, aslist)
+
+    def _finish(self, results, queries, evidence, tracked: 'Evidence', clear_evidence, aslist):
         if clear_evidence and evidence is not None:
             evidence.clear()
+            if tracked is not None:
+                tracked.clear()
 
         if len(queries) == 1 and not aslist:
             return results[0]
@@ -161,9 +317,19 @@ class Evidence:
         self._evidence = inference.getEvidence()
         self._evidence.clear()
         self._variables = network.getVariables()
+        # what's been set, by variable name, for caching query results against.
+        self._signature = {}
 
     def clear(self):
         self._evidence.clear()
+        self._signature = {}
+
+    def signature(self) -> tuple:
+        """
+        A canonical (hashable) description of the evidence set through this instance, with discretised values
+        replaced by the state they fall in.
+        """
+        return tuple(sorted(self._signature.items()))
 
     def get_evidence(self):
         return self._evidence
@@ -193,6 +359,7 @@ class Evidence:
         javaDblArray = jp.JArray(jp.JDouble)
         j_evidence = javaDblArray(evidence.astype(float).tolist())
         self._evidence.setStates(v, j_evidence)
+        self._signature[variable_name] = ('soft', tuple(evidence.astype(float).tolist()))
 
         return self._evidence
 
@@ -220,9 +387,11 @@ class Evidence:
                     raise ValueError("State {} does not exist in variable {}".format(value, variable_name))
 
             self._evidence.setState(st)
+            self._signature[variable_name] = ('state', st.getName())
 
         elif bayesianpy.network.is_variable_continuous(v):
             self._evidence.set(v, jp.java.lang.Double(float(value)))
+            self._signature[variable_name] = ('value', float(value))
 
     def apply(self, evidence: Dict[str, object]=None):
         """
@@ -326,6 +495,10 @@ class QueryConditionalJointProbability(QueryBase):
         self._discrete_variables = []
         self._is_discrete_head = False
 
+    def reset(self):
+        self._discrete_variables = []
+        self._is_discrete_head = False
+
     def get_head_variables(self):
         return self._head_variables
 
@@ -678,7 +851,7 @@ class QueryKLDivergence(QueryBase):
         self._variables = None
 
 
-def _batch_query(df: pd.DataFrame, network_string: str,
+def _batch_query(df: pd.DataFrame, network_string: Union[str, 'bayesianpy.network.SerialisedNetwork'],
                  variable_references: List[str],
                  queries: List[QueryBase],
                  create_data_reader_command:bayesianpy.reader.CreatableWithDf,
@@ -699,7 +872,7 @@ def _batch_query(df: pd.DataFrame, network_string: str,
         else:
             data_reader = drc.executeReader()
 
-        network = bayesianpy.network.create_network_from_string(network_string)
+        network = bayesianpy.network.create_network_from_serialised(network_string)
         reader_options = create_data_reader_options.create()
         variable_refs = list(bayesianpy.network.create_variable_references(network, schema,
                                                                            variable_references=variable_references))
@@ -763,17 +936,32 @@ def _batch_query(df: pd.DataFrame, network_string: str,
 
 
 class BatchQuery:
-    def __init__(self, network, datastore:bayesianpy.data.DataSet, logger: logging.Logger):
+    # below this many rows per distinct evidence combination, deduplicating isn't worth the subset query
+    MIN_DEDUP_RATIO = 1.1
+
+    def __init__(self, network, datastore:bayesianpy.data.DataSet, logger: logging.Logger, compression: str='gzip',
+                 deduplicate: bool=True):
+        """
+        :param deduplicate: run inference once per distinct combination of evidence (over the columns that
+        reference network variables), and copy the results to the other rows with the same evidence.
+        """
         self._logger = logger
         self._datastore = datastore
-        # serialise the network as a string.
+        # serialise the network (compressed, along with a content hash) to ship to the workers.
+        self._network = bayesianpy.network.serialise(network, compression=compression)
         if isinstance(network, bayesianpy.network.Network):
-            self._network = network.to_xml()
-        else:
-            from xml.dom import minidom
-            nt = network.saveToString()
-            reparsed = minidom.parseString(nt)
-            self._network = reparsed.toprettyxml(indent="  ")
+            network = network.jclass()
+
+        self._variable_names = [v.getName() for v in network.getVariables()]
+        self._deduplicate = deduplicate
+        self._statistics = {}
+
+    def get_statistics(self) -> dict:
+        """
+        :return: the number of rows, distinct evidence combinations and inference calls from the last query,
+        and the dedup ratio (rows per inference call)
+        """
+        return dict(self._statistics)
 
     def _calc_num_threads(self, df_size: int, query_size: int, max_threads=None) -> int:
         num_queries = df_size * query_size
@@ -799,6 +987,40 @@ class BatchQuery:
 
         return r
 
+    def _get_evidence_columns(self, df: pd.DataFrame, variable_references: List[str]) -> List[str]:
+        names = set(variable_references if len(variable_references) > 0 else self._variable_names)
+        return [col for col in df.columns if col in names]
+
+    @staticmethod
+    def _find_duplicates(df: pd.DataFrame, columns: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: the case ids of one row per distinct evidence combination, and the position of each
+        row's representative in that array
+        """
+        if len(columns) == 0:
+            return df.index.values[:1], np.zeros(len(df), dtype=np.int64)
+
+        hashes = pd.util.hash_pandas_object(df[columns], index=False).values
+        codes, uniques = pd.factorize(hashes)
+        _, first = np.unique(codes, return_index=True)
+        return df.index.values[first], codes
+
+    @staticmethod
+    def _scatter_results(pdf: pd.DataFrame, representatives: np.ndarray, codes: np.ndarray,
+                         index: pd.Index) -> pd.DataFrame:
+        """
+        Copies each representative's results to every row with the same evidence.
+        :param index: the index of the rows that were queried
+        """
+        pdf = pdf.reindex(representatives[codes])
+        pdf.index = index.copy()
+        pdf.index.name = 'caseid'
+        return pdf
+
+    @staticmethod
+    def _run_batch(*args) -> pd.DataFrame:
+        return _batch_query(*args)
+
     def query(self, queries: List[QueryBase] = None, append_to_df=True,
               variable_references: List[str] = None, max_threads=None):
 
@@ -812,17 +1034,33 @@ class BatchQuery:
             queries = [QueryModelStatistics()]
 
         nt = self._network
-        processes = self._calc_num_threads(len(self._datastore.data), len(queries), max_threads=max_threads)
-
-        self._logger.info("Using {} processes to query {} rows".format(processes, len(self._datastore.data)))
-
         df = self._datastore.get_dataframe()
         schema = bayesianpy.data.DataFrame.get_schema(df)
 
+        indices = None
+        codes = None
+        # deduplicating reads a subset of the rows, which not every datastore can do.
+        if self._deduplicate and self._datastore.supports_subsets() and isinstance(df, pd.DataFrame) \
+                and len(df) > 0:
+            representatives, row_codes = self._find_duplicates(df, self._get_evidence_columns(df, variable_references))
+            if len(df) / len(representatives) >= self.MIN_DEDUP_RATIO:
+                indices, codes = representatives, row_codes
+
+        num_rows = len(df) if indices is None else len(indices)
+        self._statistics = {'rows': len(df), 'unique_evidence': num_rows, 'inference_calls': num_rows,
+                            'dedup_ratio': len(df) / num_rows if num_rows > 0 else 1.0}
+
+        processes = self._calc_num_threads(num_rows, len(queries), max_threads=max_threads)
+
+        self._logger.info("Using {} processes to query {} rows ({} distinct evidence combinations)"
+                          .format(processes, len(df), num_rows))
+
+        run_batch = self._run_batch
         if processes == 1:
-            pdf = _batch_query(schema, nt,
+            pdf = run_batch(schema, nt,
                                             variable_references, queries,
-                                            self._datastore.create_data_reader_command(),
+                                            self._datastore.create_data_reader_command() if indices is None
+                                            else self._datastore.create_subset_data_reader_command(indices.tolist()),
                                             self._datastore.get_reader_options())
         else:
             # bit nasty, but the only way I could get jpype to stop hanging in Linux.
@@ -830,35 +1068,33 @@ class BatchQuery:
             ro = self._datastore.get_reader_options()
 
             commands = []
-            for group in np.array_split(self._datastore.get_dataframe(), processes):
-                subset = self._datastore.subset(group.index.tolist())
-                commands.append(subset.create_data_reader_command())
+            for group in np.array_split(df.index.values if indices is None else indices, processes):
+                commands.append(self._datastore.create_subset_data_reader_command(group.tolist()))
 
             with mp.Pool(processes=processes) as pool:
                 pdf = pd.DataFrame()
 
                 # logger with StreamHandler does not pickle, so best to leave it out as an option.
-                for result_set in pool.map(lambda drc: _batch_query(schema, nt, variable_references, queries,
-                                                                   drc, ro), commands):
+                for result_set in pool.map(lambda drc: run_batch(schema, nt, variable_references, queries,
+                                                                drc, ro), commands):
                     pdf = pdf.append(result_set)
 
+        if codes is not None and pdf is not None and len(pdf) > 0:
+            pdf = self._scatter_results(pdf, indices, codes, df.index)
+            self._logger.info("Deduplicated evidence: {} rows from {} inference calls ({:.1f}x)"
+                              .format(len(df), num_rows, self._statistics['dedup_ratio']))
+
         if append_to_df:
             return self._datastore.get_dataframe().join(pdf)
         else:
             return pdf
 
 class DaskBatchQuery:
-    def __init__(self, network, datastore: bayesianpy.data.DaskDataset):
+    def __init__(self, network, datastore: bayesianpy.data.DaskDataset, compression: str='gzip'):
         self._logger = logging.getLogger(__name__)
         self._datastore = datastore
-        # serialise the network as a string.
-        if isinstance(network, bayesianpy.network.Network):
-            self._network = network.to_xml()
-        else:
-            from xml.dom import minidom
-            nt = network.saveToString()
-            reparsed = minidom.parseString(nt)
-            self._network = reparsed.toprettyxml(indent="  ")
+        # serialise the network (compressed, along with a content hash) to ship to the workers.
+        self._network = bayesianpy.network.serialise(network, compression=compression)
 
         if not isinstance(datastore.get_dataframe(), dd.DataFrame):
             raise ValueError("Dataframe has to be of type Dask.DataFrame")
@@ -956,6 +1192,11 @@ class Impute:
         self._logger = logger
 
     def analyse(self, dataset):
+        """
+        Fills the missing values of the network's variables in the dataset's dataframe (in place) with the most
+        likely state/ the mean.
+        :return: the filled dataframe, the same object as dataset.get_dataframe()
+        """
         model = NetworkModel(self._network, self._logger)
 
         df = dataset.get_dataframe()
@@ -972,8 +1213,11 @@ class Impute:
         result = model.batch_query(dataset, queries, append_to_df=False)
 
         for col in result.columns:
-            nulls = pd.isnull(df[col])
-            df.iloc[nulls, col] = result.ix(nulls)
+            # one bulk write of the missing values per column.
+            nulls = pd.isnull(df[col]).values
+            df.loc[nulls, col] = result[col].reindex(df.index).values[nulls]
+
+        return df
 
 class Sampling:
     def __init__(self, network):
@@ -1014,12 +1258,8 @@ class NetworkModel:
     def get_network(self):
         return self._jnetwork
 
-    def save(self, path, encoding='utf-8'):
-        from xml.dom import minidom
-        nt = self._jnetwork.saveToString()
-        reparsed = minidom.parseString(nt)
-        with open(path, 'w', encoding=encoding) as fh:
-            fh.write(reparsed.toprettyxml(indent="  "))
+    def save(self, path, encoding='utf-8', pretty=False):
+        bayesianpy.network.save(self._jnetwork, path, pretty=pretty, encoding=encoding)
 
     def is_trained(self):
         return bayesianpy.network.is_trained(self._jnetwork)
@@ -1055,6 +1295,8 @@ class NetworkModel:
         self._logger.info("Training model...")
 
         result = learning.learn(evidence_reader_command, learning_options)
+        # anything cached from the old parameters (e.g. query results) is now stale.
+        bayesianpy.network.bump_network_version(self._jnetwork)
         self._logger.info("Finished training model")
 
         return TrainingResults(self._jnetwork, {'converged': result.getConverged(),
@@ -8,6 +8,12 @@ import numpy as np
 from typing import Iterator, Optional
 from . import distributed as dk
 import dask
+import gzip
+import hashlib
+import threading
+import itertools
+import weakref
+from bayesianpy.cache import LruCache
 
 def create_network():
     return bayesServer().Network(str(uuid.getnode()))
@@ -27,11 +33,140 @@ def create_network_from_file(path, encoding='utf-8'):
 
 
 def create_network_from_string(network_string):
+    if isinstance(network_string, SerialisedNetwork):
+        network_string = network_string.to_string()
+
     network = create_network()
     network.loadFromString(network_string)
     return network
 
 
+def content_hash(network_string: str) -> str:
+    # str(), as newer JPype versions return saveToString() as a java.lang.String.
+    return hashlib.blake2b(str(network_string).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression is None:
+        return data
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=1)
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().compress(data)
+
+    raise ValueError("Compression {} not recognised, expecting one of None, 'gzip' or 'zstd'".format(compression))
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    if compression is None:
+        return data
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    raise ValueError("Compression {} not recognised, expecting one of None, 'gzip' or 'zstd'".format(compression))
+
+
+class SerialisedNetwork:
+    """
+    The network as it comes out of saveToString (no pretty printing), optionally compressed, along with a hash
+    of the uncompressed content. Cheap to pickle, so it's what gets shipped to worker processes.
+    """
+
+    def __init__(self, payload: bytes, compression: str=None, content_hash: str=None, size: int=None):
+        self._payload = payload
+        self._compression = compression
+        self._hash = content_hash
+        self._size = size
+
+    @staticmethod
+    def from_string(network_string: str, compression: str='gzip') -> 'SerialisedNetwork':
+        data = str(network_string).encode('utf-8')
+        return SerialisedNetwork(_compress(data, compression), compression=compression,
+                                 content_hash=hashlib.blake2b(data, digest_size=16).hexdigest(),
+                                 size=len(data))
+
+    @staticmethod
+    def from_network(network, compression: str='gzip') -> 'SerialisedNetwork':
+        return SerialisedNetwork.from_string(network.saveToString(), compression=compression)
+
+    def to_string(self) -> str:
+        return _decompress(self._payload, self._compression).decode('utf-8')
+
+    def get_hash(self) -> str:
+        if self._hash is None:
+            self._hash = content_hash(self.to_string())
+        return self._hash
+
+    def get_compression(self) -> str:
+        return self._compression
+
+    def get_payload(self) -> bytes:
+        return self._payload
+
+    def get_size(self) -> int:
+        """
+        The size (in bytes) of the uncompressed network
+        """
+        if self._size is None:
+            self._size = len(self.to_string().encode('utf-8'))
+        return self._size
+
+    def __len__(self):
+        return len(self._payload)
+
+    def __str__(self):
+        return "SerialisedNetwork({}, {} bytes, compression: {})".format(self.get_hash(), len(self),
+                                                                         self._compression)
+
+
+def serialise(network, compression: str='gzip') -> SerialisedNetwork:
+    if isinstance(network, Network):
+        network = network.jclass()
+
+    return SerialisedNetwork.from_network(network, compression=compression)
+
+
+# rough multiplier from the size of the xml to the size of the loaded Java network.
+NETWORK_MEMORY_FACTOR = 4
+
+_network_cache = LruCache(max_size=32, max_weight=2 * 1024 ** 3)
+
+
+def get_network_cache() -> LruCache:
+    return _network_cache
+
+
+def set_network_cache_size(max_networks: int=None, max_memory: int=None):
+    """
+    Configure the per-process network cache
+    :param max_networks: the maximum number of deserialised networks to keep
+    :param max_memory: the (estimated) maximum number of bytes the cached networks should take up
+    """
+    _network_cache.resize(max_size=max_networks, max_weight=max_memory)
+
+
+def create_network_from_serialised(serialised: SerialisedNetwork, use_cache=True):
+    """
+    Deserialise a network, returning an already loaded instance if one with the same content hash is in the
+    process' cache. Networks are cached per thread, so threads (e.g. Dask's threaded scheduler) never run inference
+    on the same instance, but later calls on a thread share it: copy it before changing its structure or parameters.
+    :param serialised: a SerialisedNetwork, or the network's xml (as from saveToString)
+    """
+    if isinstance(serialised, str):
+        serialised = SerialisedNetwork.from_string(serialised, compression=None)
+
+    if not use_cache:
+        return create_network_from_string(serialised.to_string())
+
+    return _network_cache.get_or_create((serialised.get_hash(), threading.get_ident()),
+                                        lambda: create_network_from_string(serialised.to_string()),
+                                        weight=serialised.get_size() * NETWORK_MEMORY_FACTOR)
+
+
 STATE_DELIMITER = "$$"
 
 
@@ -368,6 +503,9 @@ class Network(object):
     def to_string(self):
         return self._network.saveToString()
 
+    def serialise(self, compression: str='gzip') -> SerialisedNetwork:
+        return SerialisedNetwork.from_network(self._network, compression=compression)
+
     @staticmethod
     def from_new():
         return Network(create_network())
@@ -377,7 +515,7 @@ class Network(object):
         return Network(create_network_from_file(network_path, encoding))
 
     @staticmethod
-    def from_string(self, network_string: str):
+    def from_string(network_string: str):
         return Network(create_network_from_string(network_string))
 
     def links(self) -> NetworkLinks:
@@ -389,8 +527,8 @@ class Network(object):
     def variables(self) -> NetworkVariables:
         return NetworkVariables(self._network, self._network.getVariables())
 
-    def save(self, path):
-        save(self._network, path)
+    def save(self, path, pretty=False):
+        save(self._network, path, pretty=pretty)
 
     def jclass(self) -> jp.JClass:
         return self._network
@@ -439,6 +577,7 @@ class Builder:
 
         if to_remove is not None:
             network.getLinks().remove(to_remove)
+            bump_network_version(network)
 
     @staticmethod
     def delete_links_from(network, node):
@@ -448,6 +587,8 @@ class Builder:
         for link in list(node.getLinksOut()):
             network.getLinks().remove(link)
 
+        bump_network_version(network)
+
     @staticmethod
     def delete_links_to(network, node):
         if isinstance(node, str):
@@ -456,6 +597,8 @@ class Builder:
         for link in list(node.getLinksIn()):
             network.getLinks().remove(link)
 
+        bump_network_version(network)
+
     @staticmethod
     def create_link(network, n1, n2, t=None):
         if isinstance(n1, str):
@@ -479,6 +622,7 @@ class Builder:
 
         try:
             network.getLinks().add(l)
+            bump_network_version(network)
         except BaseException as e:
             raise ValueError(e.message() + ". Trying to add link from {} to {}".format(n1.getName(), n2.getName()))
 
@@ -546,6 +690,7 @@ class Builder:
                                         interval))
 
                 network.getNodes().add(n)
+                bump_network_version(network)
                 yield n
 
         else:
@@ -578,6 +723,7 @@ class Builder:
                                             interval))
 
                 network.getNodes().add(n)
+                bump_network_version(network)
                 yield n
 
 
@@ -644,6 +790,7 @@ class Builder:
                 bayesServer().State("{}".format(Builder._create_interval_name(interval, decimal_places)), interval))
 
         network.getNodes().add(n)
+        bump_network_version(network)
         return n
 
 
@@ -657,6 +804,7 @@ class Builder:
         n_ = bayesServer().Node(v)
 
         network.getNodes().add(n_)
+        bump_network_version(network)
 
         return n_
 
@@ -669,6 +817,7 @@ class Builder:
             v.getStates().add(bayesServer().State("Cluster{}".format(i)))
 
         network.getNodes().add(parent)
+        bump_network_version(network)
         return parent
 
 
@@ -677,6 +826,7 @@ class Builder:
         n_ = bayesServer().Node(node_name,
                                 [bayesServer().Variable(v, bayesServer().VariableValueType.CONTINUOUS) for v in variables])
         network.getNodes().add(n_)
+        bump_network_version(network)
         return n_
 
 
@@ -708,6 +858,7 @@ class Builder:
                     state.setValue(state.getName() == 'True')
 
         network.getNodes().add(n_)
+        bump_network_version(network)
 
         return n_
 
@@ -829,6 +980,7 @@ def remove_node(network, node):
     if node is None:
         raise ValueError("Node must be specified when trying to remove it.")
     network.getNodes().remove(node)
+    bump_network_version(network)
 
 
 def get_number_of_states(network, variable):
@@ -852,13 +1004,84 @@ def get_other_states_from_variable(network, target):
         yield state(target.variable, st.getName())
 
 
+class _NetworkState:
+    """
+    What's known about a network: its version, and values derived from it at that version (e.g. its content
+    hash, or variable references).
+    """
+    def __init__(self, version: int):
+        self.version = version
+        self.memo = LruCache(max_size=32)
+
+
+# weakly keyed on the (Java) network, so the state goes with it. Versions are drawn from a single counter, so
+# that a version is never reused, even by a network whose state was dropped and created again.
+_network_states = weakref.WeakKeyDictionary()
+_network_versions = itertools.count(1)
+_network_states_lock = threading.Lock()
+
+
+def _get_network_state(network) -> _NetworkState:
+    if isinstance(network, Network):
+        network = network.jclass()
+
+    with _network_states_lock:
+        state = _network_states.get(network)
+        if state is None:
+            state = _network_states[network] = _NetworkState(next(_network_versions))
+
+        return state
+
+
+def get_network_version(network) -> int:
+    """
+    The network's version, which changes whenever bayesianpy changes the network (see bump_network_version).
+    """
+    return _get_network_state(network).version
+
+
+def bump_network_version(network) -> int:
+    """
+    Records that the network has changed (its structure or parameters), dropping anything derived from it.
+    bayesianpy calls this itself when it adds nodes or links, or trains, but it needs calling after changing
+    the Java network directly.
+    """
+    state = _get_network_state(network)
+    with _network_states_lock:
+        state.version = next(_network_versions)
+        state.memo = LruCache(max_size=32)
+        return state.version
+
+
+def memoise(network, key, factory):
+    """
+    Gets the value of factory() for the current version of network, creating it if needed.
+    """
+    return _get_network_state(network).memo.get_or_create(key, factory)
+
+
+def _schema_fingerprint(data) -> tuple:
+    return tuple((str(column), str(dtype)) for column, dtype in zip(data.columns, data.dtypes))
+
+
 def create_variable_references(network, data, variable_references=[]):
     """
-    Match up network variables to the dataframe columns
-    :param data: dataframe
+    Match up network variables to the dataframe columns. The references are memoised against the network's version
+    and the dataframe schema, so repeated training/ querying against the same schema doesn't redo the matching.
+    :param data: dataframe (only the column names and dtypes are used)
     :return: a list of 'VariableReference' objects
     """
+    key = ('variable_references', _schema_fingerprint(data), tuple(variable_references))
+    return list(memoise(network, key, lambda: [
+        bayesServer().data.VariableReference(variable, value_type, variable.getName(),
+                                             bayesServer().data.StateNotFoundAction.MISSING_VALUE)
+        for variable, value_type in _match_variable_columns(network, data, variable_references)]))
 
+
+def _match_variable_columns(network, data, variable_references):
+    """
+    :return: (variable, ColumnValueType) for each variable with a column in data
+    """
     variables = []
 
     if len(variable_references) == 0:
@@ -867,16 +1090,14 @@ def create_variable_references(network, data, variable_references=[]):
         for v in variable_references:
             variables.append(bayesianpy.network.get_variable(network, v))
 
-    latent_variable_name = "Cluster"
+    columns = set(data.columns.tolist())
+    dtypes = dict(zip(data.columns, data.dtypes))
     for v in variables:
-        #if v.getName().startswith(latent_variable_name):
-        #    continue
+        name = v.getName()
 
-        if v.getName() not in data.columns.tolist():
+        if name not in columns:
             continue
 
-        name = v.getName()
-
         valueType = bayesServer().data.ColumnValueType.VALUE
 
         if v.getStateValueType() == bayesServer().StateValueType.NONE:
@@ -884,20 +1105,21 @@ def create_variable_references(network, data, variable_references=[]):
         elif v.getStateValueType() != bayesServer().StateValueType.DOUBLE_INTERVAL \
                 and bayesianpy.network.is_variable_discrete(v):
 
-            if not DataFrame.is_int(data[name].dtype) and not DataFrame.is_bool(data[name].dtype) \
-                    and not DataFrame.is_float(data[name].dtype):
+            dtype = dtypes[name]
+            if not DataFrame.is_int(dtype) and not DataFrame.is_bool(dtype) and not DataFrame.is_float(dtype):
                 valueType = bayesServer().data.ColumnValueType.NAME
 
-        yield bayesServer().data.VariableReference(v, valueType, name,
-                                                   bayesServer().data.StateNotFoundAction.MISSING_VALUE)
+        yield (v, valueType)
 
 
-def save(network, path):
-    from xml.dom import minidom
+def save(network, path, pretty=False, encoding='utf-8'):
     nt = network.saveToString()
-    reparsed = minidom.parseString(nt)
-    with open(path, 'w') as fh:
-        fh.write(reparsed.toprettyxml(indent="  "))
+    if pretty:
+        from xml.dom import minidom
+        nt = minidom.parseString(nt).toprettyxml(indent="  ")
+
+    with open(path, 'w', encoding=encoding) as fh:
+        fh.write(nt)
 
 
 def is_cluster_variable(v):
@@ -915,14 +1137,22 @@ def is_trained(network):
 
 
 class NetworkFactory:
-    def __init__(self, logger, network_file_path=None, network=None, encoding='utf-8'):
+    def __init__(self, logger, network_file_path=None, network=None, encoding='utf-8', use_cache=True):
         self._logger = logger
         self._network_file_path = network_file_path
         self._network = network
         self._encoding = encoding
+        self._use_cache = use_cache
 
     def create_from_file(self, path):
-        return create_network_from_file(path, self._encoding)
+        if not self._use_cache:
+            return create_network_from_file(path, self._encoding)
+
+        with open(path, mode='r', encoding=self._encoding) as fh:
+            serialised = SerialisedNetwork.from_string(fh.read(), compression=None)
+
+        # the factory's callers add nodes and train, so hand out a copy rather than the cached instance.
+        return create_network_from_serialised(serialised).copy()
 
     def create(self):
         if self._network is not None:
@@ -9,6 +9,7 @@ from bayesianpy.jni import bayesServerInference
 from bayesianpy.decorators import deprecated
 
 import bayesianpy.network
+import bayesianpy.model
 import pandas as pd
 from bayesianpy.jni import bayesServer
 from bayesianpy.jni import bayesServerStatistics
@@ -19,7 +20,7 @@ import multiprocess.context as ctx
 import pathos.multiprocessing as mp
 import itertools
 import bayesianpy.reader
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Union
 import dask.dataframe as dd
 import math
 
@@ -485,7 +486,7 @@ class QueryKLDivergence(QueryBase):
         self._variables = None
 
 
-def _batch_query(df: pd.DataFrame, network_string: str,
+def _batch_query(df: pd.DataFrame, network_string: Union[str, 'bayesianpy.network.SerialisedNetwork'],
                  variable_references: List[str],
                  queries: List[QueryFactory],
                  create_data_reader_command:bayesianpy.reader.CreatableWithDf,
@@ -516,7 +517,7 @@ def _batch_query(df: pd.DataFrame, network_string: str,
         else:
             data_reader = drc.executeReader()
 
-        network = bayesianpy.network.create_network_from_string(network_string)
+        network = bayesianpy.network.create_network_from_serialised(network_string)
         reader_options = create_data_reader_options.create()
         variable_refs = list(bayesianpy.network.create_variable_references(network, schema,
                                                                            variable_references=variable_references))
@@ -579,105 +580,30 @@ def _batch_query(df: pd.DataFrame, network_string: str,
         logger.error("Unexpected Error: {}. Using queries: {}".format(e, r"\n ".join(q)))
 
 
-class BatchQuery:
-    def __init__(self, network, datastore:bayesianpy.data.DataSet, logger: logging.Logger):
-        self._logger = logger
-        self._datastore = datastore
-        # serialise the network as a string.
-        if isinstance(network, bayesianpy.network.Network):
-            self._network = network.to_xml()
-        else:
-            from xml.dom import minidom
-            nt = network.saveToString()
-            reparsed = minidom.parseString(nt)
-            self._network = reparsed.toprettyxml(indent="  ")
-
-    def _calc_num_threads(self, df_size: int, query_size: int, max_threads=None) -> int:
-        num_queries = df_size * query_size
-
-        if mp.cpu_count() == 1:
-            max = 1
-        else:
-            max = mp.cpu_count() - 1
-
-        calc = int(num_queries / 5000)
-        if calc > max:
-            r = max
-        elif calc <= 1:
-            if num_queries > 1000:
-                r = 2
-            else:
-                r = 1
-        else:
-            r = calc
-
-        if max_threads is not None and r > max_threads:
-            return max_threads
+class BatchQuery(bayesianpy.model.BatchQuery):
+    """
+    As bayesianpy.model.BatchQuery (including running inference once per distinct evidence combination), but
+    creating the queries on each worker from QueryFactory instances.
+    """
 
-        return r
+    @staticmethod
+    def _run_batch(*args) -> pd.DataFrame:
+        return _batch_query(*args)
 
     def query(self, queries: List[QueryFactory] = None, append_to_df=True,
               variable_references: List[str] = None, max_threads=None):
-
-
-
-        if not hasattr(queries, "__getitem__"):
-            queries = [queries]
-
-        if variable_references is None:
-            variable_references = []
-
         if queries is None:
-            queries = [QueryModelStatistics()]
-
-        nt = self._network
-        processes = self._calc_num_threads(len(self._datastore.data), len(queries), max_threads=max_threads)
-
-        self._logger.info("Using {} processes to query {} rows".format(processes, len(self._datastore.data)))
-
-        df = self._datastore.get_dataframe()
-        schema = bayesianpy.data.DataFrame.get_schema(df)
-
-        if processes == 1:
-            pdf = _batch_query(schema, nt,
-                                            variable_references, queries,
-                                            self._datastore.create_data_reader_command(),
-                                            self._datastore.get_reader_options())
-        else:
-            # bit nasty, but the only way I could get jpype to stop hanging in Linux.
-            ctx._force_start_method('spawn')
-            ro = self._datastore.get_reader_options()
+            queries = [QueryFactory(QueryModelStatistics)]
 
-            commands = []
-            for group in np.array_split(self._datastore.get_dataframe(), processes):
-                subset = self._datastore.subset(group.index.tolist())
-                commands.append(subset.create_data_reader_command())
-
-            with mp.Pool(processes=processes) as pool:
-                pdf = pd.DataFrame()
-
-                # logger with StreamHandler does not pickle, so best to leave it out as an option.
-                for result_set in pool.map(lambda drc: _batch_query(schema, nt, variable_references, queries,
-                                                                   drc, ro), commands):
-                    pdf = pdf.append(result_set)
-
-        if append_to_df:
-            return self._datastore.get_dataframe().join(pdf)
-        else:
-            return pdf
+        return super().query(queries, append_to_df=append_to_df, variable_references=variable_references,
+                             max_threads=max_threads)
 
 class DaskBatchQuery:
-    def __init__(self, network, datastore: bayesianpy.data.DaskDataset):
+    def __init__(self, network, datastore: bayesianpy.data.DaskDataset, compression: str='gzip'):
         self._logger = logging.getLogger(__name__)
         self._datastore = datastore
-        # serialise the network as a string.
-        if isinstance(network, bayesianpy.network.Network):
-            self._network = network.to_xml()
-        else:
-            from xml.dom import minidom
-            nt = network.saveToString()
-            reparsed = minidom.parseString(nt)
-            self._network = reparsed.toprettyxml(indent="  ")
+        # serialise the network (compressed, along with a content hash) to ship to the workers.
+        self._network = bayesianpy.network.serialise(network, compression=compression)
 
         if not isinstance(datastore.get_dataframe(), dd.DataFrame):
             raise ValueError("Dataframe has to be of type Dask.DataFrame")
@@ -3,8 +3,16 @@ from bayesianpy.jni import jp
 import pandas as pd
 import dask.dataframe as dd
 import numpy as np
-from typing import List
+from typing import List, Dict
 import logging
+import queue
+import threading
+import time
+import os
+import shutil
+import tempfile
+import dask
+from bayesianpy.cache import LruCache
 
 class Creatable:
     def create(self):
@@ -16,16 +24,298 @@ class CreatableWithDf:
         pass
 
 
+class JdbcConnectionPool:
+    """
+    A pool of at most max_size JDBC connections to a single url, kept for the life of the JVM session, with an
+    LRU cache of prepared statements per connection so that repeated queries (one per EM iteration, or per
+    partition) are only prepared once. Statements that drop out of the cache are closed.
+    """
+    def __init__(self, url:str, max_size:int=4, max_statements:int=32, timeout:float=60):
+        """
+        :param max_size: the maximum number of connections open at once, borrowed or idle
+        :param timeout: how long (in seconds) borrow waits for a connection when all of them are in use
+        """
+        if max_size < 1:
+            raise ValueError("max_size should be at least 1")
+
+        if max_statements < 2:
+            # a paged reader prepares its next page while the last one's statement is the most recent.
+            raise ValueError("max_statements should be at least 2")
+
+        self._url = url
+        self._max_size = max_size
+        self._max_statements = max_statements
+        self._timeout = timeout
+        self._available = threading.BoundedSemaphore(max_size)
+        self._idle = []
+        # id(connection) -> (connection, statements); holding the connection keeps its id from being reused.
+        self._statements = {}
+        self._closed = False
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    def _is_usable(self, connection) -> bool:
+        try:
+            return not connection.isClosed()
+        except BaseException:
+            return False
+
+    @staticmethod
+    def _close_statement(query, statement):
+        try:
+            statement.close()
+        except BaseException:
+            pass
+
+    def _get_statements(self, connection) -> LruCache:
+        with self._lock:
+            entry = self._statements.get(id(connection))
+            if entry is None or entry[0] is not connection:
+                entry = (connection, LruCache(max_size=self._max_statements, on_evict=self._close_statement))
+                self._statements[id(connection)] = entry
+
+            return entry[1]
+
+    def borrow(self):
+        if not self._available.acquire(timeout=self._timeout):
+            raise RuntimeError("Timed out waiting for one of the {} connections to {}"
+                               .format(self._max_size, self._url.split("?")[0]))
+
+        try:
+            with self._lock:
+                while len(self._idle) > 0:
+                    connection = self._idle.pop()
+                    if self._is_usable(connection):
+                        return connection
+
+                    self._statements.pop(id(connection), None)
+
+            self._logger.debug("Opening JDBC connection to {}".format(self._url.split("?")[0]))
+            return jp.java.sql.DriverManager.getConnection(self._url)
+        except BaseException:
+            self._available.release()
+            raise
+
+    def release(self, connection):
+        try:
+            with self._lock:
+                if not self._closed and self._is_usable(connection):
+                    self._idle.append(connection)
+                    return
+
+                self._statements.pop(id(connection), None)
+
+            # closing the connection closes its statements.
+            connection.close()
+        finally:
+            self._available.release()
+
+    def prepare(self, connection, query:str):
+        """
+        Gets a forward-only, read-only prepared statement for query on connection, preparing it if it hasn't
+        been already.
+        """
+        statements = self._get_statements(connection)
+        statement = statements.get(query)
+
+        if statement is None or statement.isClosed():
+            result_set = jp.java.sql.ResultSet
+            statement = connection.prepareStatement(query, result_set.TYPE_FORWARD_ONLY, result_set.CONCUR_READ_ONLY)
+            statements.put(query, statement)
+
+        return statement
+
+    def statistics(self) -> List[dict]:
+        """
+        The statement cache statistics for each (pooled) connection
+        """
+        with self._lock:
+            return [statements.stats() for _, statements in self._statements.values()]
+
+    def close(self):
+        """
+        Closes the idle connections; borrowed ones are closed when they're released.
+        """
+        with self._lock:
+            self._closed = True
+            for connection in self._idle:
+                self._statements.pop(id(connection), None)
+                try:
+                    # closing the connection closes its statements.
+                    connection.close()
+                except BaseException:
+                    pass
+
+            self._idle = []
+
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(url:str, max_size:int=4, max_statements:int=32) -> JdbcConnectionPool:
+    with _connection_pools_lock:
+        if url not in _connection_pools:
+            _connection_pools[url] = JdbcConnectionPool(url, max_size=max_size, max_statements=max_statements)
+
+        return _connection_pools[url]
+
+
+def close_connection_pools():
+    with _connection_pools_lock:
+        for pool in _connection_pools.values():
+            pool.close()
+
+        _connection_pools.clear()
+
+
+class ResultSetDataReader:
+    """
+    A DataReader over one or more JDBC ResultSets (one per page) from a pooled connection, which goes back to
+    the pool when the reader is closed.
+    """
+    def __init__(self, pool:JdbcConnectionPool, connection, result_sets):
+        """
+        :param result_sets: an iterator of ResultSets, each opened when the previous one is exhausted
+        """
+        self._pool = pool
+        self._connection = connection
+        self._result_sets = result_sets
+        self._result_set = next(result_sets)
+        metadata = self._result_set.getMetaData()
+        self._columns = [str(metadata.getColumnLabel(i + 1)) for i in range(metadata.getColumnCount())]
+        self._column_indices = {column: i for i, column in enumerate(self._columns)}
+        # as ResultSet.findColumn, fall back on a case insensitive match (e.g. Firebird upper cases names).
+        self._column_indices_lower = {column.lower(): i for i, column in reversed(list(enumerate(self._columns)))}
+        self._column_classes = [str(metadata.getColumnClassName(i + 1)) for i in range(len(self._columns))]
+
+    def read(self):
+        while self._result_set is not None:
+            if self._result_set.next():
+                return jp.JBoolean(True)
+
+            self._result_set.close()
+            self._result_set = next(self._result_sets, None)
+
+        return jp.JBoolean(False)
+
+    def close(self):
+        if self._connection is None:
+            return
+
+        try:
+            if self._result_set is not None:
+                self._result_set.close()
+
+            if not self._connection.getAutoCommit():
+                # end the (read only) transaction the cursor was streamed in.
+                self._connection.rollback()
+        finally:
+            self._result_set = None
+            self._pool.release(self._connection)
+            self._connection = None
+
+    def getBoolean(self, columnIndex):
+        return self._result_set.getBoolean(columnIndex + 1)
+
+    def getColumnCount(self):
+        return len(self._columns)
+
+    def getColumnIndex(self, columnName):
+        index = self._column_indices.get(columnName)
+        return index if index is not None else self._column_indices_lower[str(columnName).lower()]
+
+    def getColumnName(self, columnIndex):
+        return self._columns[columnIndex]
+
+    def getColumnType(self, columnIndex):
+        return jp.java.lang.Class.forName(self._column_classes[columnIndex])
+
+    def getDouble(self, columnIndex):
+        return self._result_set.getDouble(columnIndex + 1)
+
+    def getFloat(self, columnIndex):
+        return self._result_set.getFloat(columnIndex + 1)
+
+    def getInt(self, columnIndex):
+        return self._result_set.getInt(columnIndex + 1)
+
+    def getLong(self, columnIndex):
+        return self._result_set.getLong(columnIndex + 1)
+
+    def getObject(self, columnIndex):
+        return self._result_set.getObject(columnIndex + 1)
+
+    def getString(self, columnIndex):
+        return self._result_set.getString(columnIndex + 1)
+
+    def isNull(self, columnIndex):
+        return self._result_set.getObject(columnIndex + 1) is None
+
+
+class PooledSqlDataReaderCommand:
+    def __init__(self, connection_string:str, queries:List[str], max_connections:int=4, fetch_size:int=None,
+                 streaming:bool=False):
+        self._conn = connection_string
+        self._queries = queries
+        self._max_connections = max_connections
+        self._fetch_size = fetch_size
+        self._streaming = streaming
+
+    def _execute(self, pool, connection):
+        for query in self._queries:
+            statement = pool.prepare(connection, query)
+            if self._fetch_size is not None:
+                statement.setFetchSize(self._fetch_size)
+
+            yield statement.executeQuery()
+
+    def executeReader(self) -> jp.JProxy:
+        pool = get_connection_pool(self._conn, max_size=self._max_connections)
+        connection = pool.borrow()
+        try:
+            # some drivers (e.g. PostgreSQL) only use a server side cursor inside a transaction.
+            connection.setAutoCommit(not self._streaming)
+            reader = ResultSetDataReader(pool, connection, self._execute(pool, connection))
+        except BaseException:
+            pool.release(connection)
+            raise
+
+        return jp.JProxy("com.bayesserver.data.DataReader", inst=reader)
+
+
 class CreateSqlDataReaderCommand(CreatableWithDf):
 
-    def __init__(self, connection_string, query_string):
+    def __init__(self, connection_string, query_string, pooled:bool=False, max_connections:int=4,
+                 fetch_size:int=None, streaming:bool=False):
+        """
+        :param query_string: the query, or a list of queries which are read one after the other (pages)
+        :param pooled: borrow connections from a JDBC connection pool (and reuse prepared statements) rather
+        than letting BayesServer open a new connection for every reader. Each cell is then read through
+        Python, so this is best for small/ repeated queries against servers with an expensive connect.
+        Paged, streamed and fetch size limited queries are always read this way.
+        :param fetch_size: the number of rows the driver fetches at a time
+        :param streaming: read through a forward-only cursor with auto commit off, so that drivers which
+        would otherwise buffer the whole result set (e.g. PostgreSQL) stream it instead
+        """
         self._conn = connection_string
-        self._query = query_string
+        self._queries = query_string if isinstance(query_string, list) else [query_string]
+        # the fetch size and auto commit are set on the java.sql statement/ connection, which only the pooled
+        # reader has a hold of.
+        self._pooled = pooled or len(self._queries) > 1 or fetch_size is not None or streaming
+        self._max_connections = max_connections
+        self._fetch_size = fetch_size
+        self._streaming = streaming
 
     def create(self, _:pd.DataFrame):
+        if self._pooled:
+            return jp.JProxy("com.bayesserver.data.DataReaderCommand",
+                             inst=PooledSqlDataReaderCommand(self._conn, self._queries, self._max_connections,
+                                                             self._fetch_size, self._streaming))
+
         data_reader_command = bayesServer().data.DatabaseDataReaderCommand(
             self._conn,
-            self._query)
+            self._queries[0])
 
         return data_reader_command
 
@@ -43,12 +333,33 @@ class CreateReaderOptions(Creatable):
 
 
 class CreateDataFrameReaderCommand:
-    def __init__(self, ddf:dd.DataFrame):
+    def __init__(self, ddf:dd.DataFrame, prefetch_depth:int=2, cache_partitions:bool=False,
+                 memory_budget:int=1024 ** 3, disk_budget:int=10 * 1024 ** 3):
+        """
+        :param cache_partitions: see PandasDataReaderCommand. Call close() once training has finished, to
+        delete any partitions spilled to disk.
+        """
         self._df = ddf
+        self._prefetch_depth = prefetch_depth
+        self._cache_partitions = cache_partitions
+        self._memory_budget = memory_budget
+        self._disk_budget = disk_budget
+        self._commands = []
 
     def create(self, df:pd.DataFrame=None):
-        return jp.JProxy("com.bayesserver.data.DataReaderCommand",
-                                        inst=PandasDataReaderCommand(self._df if df is None else df))
+        command = PandasDataReaderCommand(self._df if df is None else df, prefetch_depth=self._prefetch_depth,
+                                          cache_partitions=self._cache_partitions,
+                                          memory_budget=self._memory_budget, disk_budget=self._disk_budget)
+        if command.is_caching():
+            self._commands.append(command)
+
+        return jp.JProxy("com.bayesserver.data.DataReaderCommand", inst=command)
+
+    def close(self):
+        for command in self._commands:
+            command.close()
+
+        self._commands = []
 
 
 def _to_java_class(data_type):
@@ -73,24 +384,215 @@ def _to_java_class(data_type):
     raise ValueError('dtype [{}] not currently supported'.format(data_type))
 
 
+class PartitionCache:
+    """
+    Holds computed Dask partitions so that readers created on later EM iterations don't recompute them from
+    source. Partitions are kept in memory until memory_budget (bytes) is used up, after which they're spilled
+    to pickle files in a temporary folder, until that holds disk_budget bytes. Partitions beyond both budgets
+    aren't cached, and get recomputed.
+    """
+    def __init__(self, memory_budget:int=1024 ** 3, spill_folder:str=None, disk_budget:int=10 * 1024 ** 3):
+        self._logger = logging.getLogger(__name__)
+        self._memory_budget = memory_budget
+        self._disk_budget = disk_budget
+        self._spill_folder = spill_folder
+        self._spill_dir = None
+        self._memory = {}
+        self._spilled = {}
+        self._used = 0
+        self._spilled_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _spill(self, partition:int, df:pd.DataFrame):
+        with self._lock:
+            if self._spill_dir is None:
+                self._spill_dir = tempfile.mkdtemp(prefix="bayesianpy_partitions_", dir=self._spill_folder)
+            spill_dir = self._spill_dir
+
+        # pickled outside of the lock, to a file no other thread writes (they may be spilling the same partition).
+        path = os.path.join(spill_dir, "{}.{}.pkl".format(partition, threading.get_ident()))
+        try:
+            df.to_pickle(path)
+            size = os.path.getsize(path)
+        except OSError:
+            # the cache was cleared meanwhile.
+            return
+
+        with self._lock:
+            if spill_dir == self._spill_dir and partition not in self._spilled \
+                    and self._spilled_bytes + size <= self._disk_budget:
+                self._spilled[partition] = path
+                self._spilled_bytes += size
+                return
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, partition:int, compute) -> pd.DataFrame:
+        with self._lock:
+            if partition in self._memory:
+                self._hits += 1
+                return self._memory[partition]
+
+            path = self._spilled.get(partition)
+            if path is not None:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+        if path is not None:
+            try:
+                return pd.read_pickle(path)
+            except FileNotFoundError:
+                # the cache was cleared meanwhile.
+                pass
+
+        df = compute(partition)
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if self._used + size <= self._memory_budget:
+                if partition not in self._memory:
+                    self._memory[partition] = df
+                    self._used += size
+                return df
+
+            # the in-memory size is only an estimate of the pickle's, which _spill checks.
+            spill = partition not in self._spilled and self._spilled_bytes + size <= self._disk_budget
+
+        if spill:
+            self._spill(partition, df)
+
+        return df
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'in_memory': len(self._memory), 'spilled': len(self._spilled), 'memory_used': self._used,
+                    'disk_used': self._spilled_bytes, 'hits': self._hits, 'misses': self._misses}
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._spilled.clear()
+            self._used = 0
+            self._spilled_bytes = 0
+            if self._spill_dir is not None:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+                self._spill_dir = None
+
+    def __del__(self):
+        try:
+            self.clear()
+        except BaseException:
+            # probably interpreter shutdown.
+            pass
+
+
+class PartitionPrefetcher:
+    """
+    Computes Dask partitions on a background thread, up to depth partitions ahead of the one being read, so the
+    JVM isn't left waiting while the next partition is loaded. At most depth computed partitions (including the
+    one being computed) are held in memory, plus the one being read.
+    """
+    def __init__(self, compute_partition, partitions:List[int], depth:int=2):
+        self._logger = logging.getLogger(__name__)
+        self._compute_partition = compute_partition
+        self._partitions = partitions
+        # a slot is taken before a partition is computed, and given back once the reader moves on to it.
+        self._slots = threading.Semaphore(max(depth, 1))
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._compute_time = 0.0
+        self._wait_time = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _acquire(self) -> bool:
+        while not self._stop.is_set():
+            if self._slots.acquire(timeout=0.1):
+                return True
+
+        return False
+
+    def _run(self):
+        try:
+            for partition in self._partitions:
+                if not self._acquire():
+                    return
+
+                start = time.time()
+                df = self._compute_partition(partition)
+                self._compute_time += time.time() - start
+                self._queue.put((partition, df, None))
+        except BaseException as e:
+            self._queue.put((None, None, e))
+            return
+
+        self._queue.put((None, None, None))
+
+    def __iter__(self):
+        while True:
+            start = time.time()
+            partition, df, error = self._queue.get()
+            self._wait_time += time.time() - start
+            if error is not None:
+                raise error
+            if df is None:
+                return
+
+            self._slots.release()
+            yield partition, df
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._logger.info("Prefetched {} partitions: {:.2f}s computing, {:.2f}s waiting on partitions"
+                          .format(len(self._partitions), self._compute_time, self._wait_time))
+
+
 class PandasDataReader:
-    def __init__(self, df:dd.DataFrame, partition_order:List[int]=None):
+    def __init__(self, df:dd.DataFrame, partition_order:List[int]=None, prefetch_depth:int=2,
+                 partition_cache:PartitionCache=None):
+        """
+        :param prefetch_depth: the number of Dask partitions computed ahead of the one being read, on a
+        background thread. 0 computes each partition when it's needed.
+        :param partition_cache: where computed partitions are kept between readers, if anywhere.
+        """
         self._logger = logging.getLogger(__name__)
         self._df = df
         self._columns = ["ix"] + [str(col) for col in self._df.columns.tolist()]
         self._dtypes = [df.index.dtype] + df.dtypes.tolist()
         self._i = 0
         self._ordered_partitions = partition_order
+        self._prefetch_depth = prefetch_depth
+        self._prefetcher = None
+        self._partition_cache = partition_cache
         self._iterator = self._iterator()
         self._object_accessors = None
 
+    def _compute_partition(self, partition:int) -> pd.DataFrame:
+        if self._partition_cache is not None:
+            return self._partition_cache.get(partition, lambda p: self._df.get_partition(p).compute())
+
+        return self._df.get_partition(partition).compute()
+
+    def _partitions(self):
+        if self._prefetch_depth > 0:
+            self._prefetcher = PartitionPrefetcher(self._compute_partition, self._ordered_partitions,
+                                                   self._prefetch_depth)
+            yield from self._prefetcher
+        else:
+            for partition in self._ordered_partitions:
+                yield partition, self._compute_partition(partition)
+
     def _iterator(self):
         if hasattr(self._df, 'npartitions'):
             # is a dask dataframe.
-            for i in range(len(self._ordered_partitions)):
-                ordered_partition = self._ordered_partitions[i]
+            for ordered_partition, df in self._partitions():
                 self._logger.info("Partition {}".format(ordered_partition))
-                df = self._df.get_partition(ordered_partition).compute()
                 for row in df.itertuples():
                     yield row
         else:
@@ -133,6 +635,10 @@ class PandasDataReader:
             return jp.JBoolean(False)
 
     def close(self):
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
         self._logger.info("Closed Dask DataReader (read {} rows)".format(self._i))
 
     def getBoolean(self, columnIndex):
@@ -174,33 +680,245 @@ class PandasDataReader:
         return pd.isnull(self.current_row[columnIndex])
 
 
+# partition orderings by Dask graph name, which changes whenever the dataframe does.
+_partition_order_cache = LruCache(max_size=64)
+
+
+def _first_index(df:pd.DataFrame):
+    return None if df.empty else df.index.min()
+
+
 class PandasDataReaderCommand:
-    def __init__(self, df:dd.DataFrame):
+    def __init__(self, df:dd.DataFrame, prefetch_depth:int=2, cache_partitions:bool=False,
+                 memory_budget:int=1024 ** 3, disk_budget:int=10 * 1024 ** 3):
+        """
+        :param cache_partitions: keep computed partitions (spilling to disk past memory_budget bytes, up to
+        disk_budget bytes), so that readers for later EM iterations don't recompute the Dask graph. Call close()
+        to release them.
+        """
         self._df = df
+        self._prefetch_depth = prefetch_depth
+        self._partition_cache = PartitionCache(memory_budget, disk_budget=disk_budget) \
+            if cache_partitions and hasattr(df, 'npartitions') else None
         self._logger = logging.getLogger(__name__)
         self._i = 0
         self._ordered_partitions = None
 
     def _order_partitions(self, df):
-        ordering = {}
-        for partition in range(df.npartitions):
-            p = df.get_partition(partition).head(1)
-            if p.empty:
-                continue
-
-            ordering.update({partition: int(p.index[0])})
+        name = getattr(df, '_name', None)
+        partitions = _partition_order_cache.get(name) if name is not None else None
+        if partitions is not None:
+            return partitions
+
+        if df.known_divisions:
+            # partitions are already sorted by index, and empty ones just won't yield any rows.
+            partitions = list(range(df.npartitions))
+        else:
+            # one graph execution for the first index of every partition, rather than one per partition.
+            first_indices = dask.compute(*[dask.delayed(_first_index)(p) for p in df.to_delayed()])
+            ordering = {partition: ix for partition, ix in enumerate(first_indices) if ix is not None}
+            partitions = sorted(ordering, key=ordering.get)
 
-        partitions = sorted(ordering, key=ordering.get)
         self._logger.info("Ordered Partitions: {}".format(partitions))
+        if name is not None:
+            _partition_order_cache.put(name, partitions)
+
         return partitions
 
+    def is_caching(self) -> bool:
+        return self._partition_cache is not None
+
+    def close(self):
+        if self._partition_cache is not None:
+            self._logger.info("Partition cache: {}".format(self._partition_cache.stats()))
+            self._partition_cache.clear()
+
     def executeReader(self) -> jp.JProxy:
         self._i += 1
         self._logger.info("Creating Dask Data Reader (iteration: {})".format(self._i))
+        if self._partition_cache is not None and self._i > 1:
+            self._logger.info("Partition cache: {}".format(self._partition_cache.stats()))
 
         if self._ordered_partitions is None and hasattr(self._df, 'npartitions'):
             # is a dask dataframe
             self._ordered_partitions = self._order_partitions(self._df)
 
         return jp.JProxy("com.bayesserver.data.DataReader",
-                                 inst=PandasDataReader(self._df, self._ordered_partitions))
+                                 inst=PandasDataReader(self._df, self._ordered_partitions,
+                                                       prefetch_depth=self._prefetch_depth,
+                                                       partition_cache=self._partition_cache))
+
+
+class ArrowFile:
+    """
+    Memory maps an Arrow IPC (feather v2) or Parquet file, giving access to single columns of single record
+    batches (row groups for Parquet), so only the buffers that are actually read get paged in.
+    """
+    def __init__(self, path:str):
+        import pyarrow as pa
+
+        self._path = path
+        self._is_parquet = path.endswith(".parquet") or path.endswith(".parq")
+
+        if self._is_parquet:
+            import pyarrow.parquet as pq
+            self._file = pq.ParquetFile(path, memory_map=True)
+            self.schema = self._file.schema_arrow
+            self.num_batches = self._file.num_row_groups
+        else:
+            self._file = pa.ipc.open_file(pa.memory_map(path, 'r'))
+            self.schema = self._file.schema
+            self.num_batches = self._file.num_record_batches
+
+        self.column_names = self.schema.names
+
+    def read_column(self, batch:int, name:str):
+        if self._is_parquet:
+            return self._file.read_row_group(batch, columns=[name]).column(0)
+
+        return self._file.get_batch(batch).column(self.column_names.index(name))
+
+
+def _arrow_to_java_class(data_type):
+    import pyarrow as pa
+
+    if pa.types.is_int32(data_type) or pa.types.is_int16(data_type) or pa.types.is_int8(data_type):
+        return jp.java.lang.Integer(0).getClass()
+    if pa.types.is_integer(data_type):
+        return jp.java.lang.Long(0).getClass()
+    if pa.types.is_float32(data_type):
+        return jp.java.lang.Float(0).getClass()
+    if pa.types.is_floating(data_type):
+        return jp.java.lang.Double(0.0).getClass()
+    if pa.types.is_boolean(data_type):
+        return jp.java.lang.Boolean(False).getClass()
+    if pa.types.is_string(data_type) or pa.types.is_large_string(data_type) or pa.types.is_dictionary(data_type):
+        return jp.java.lang.String().getClass()
+
+    raise ValueError('Arrow type [{}] not currently supported'.format(data_type))
+
+
+class ArrowDataReader:
+    """
+    Reads rows from a memory mapped Arrow/ Parquet file, a batch at a time. Columns are only converted when the
+    evidence reader asks for them, so columns that aren't referenced by the network are never read.
+    """
+    def __init__(self, path:str, batches:List[int]=None, row_filter:Dict[int, np.ndarray]=None):
+        self._logger = logging.getLogger(__name__)
+        self._file = ArrowFile(path)
+        self._columns = self._file.column_names
+        self._batches = list(range(self._file.num_batches)) if batches is None else batches
+        self._row_filter = {} if row_filter is None else row_filter
+        self._batch = -1
+        self._batch_values = {}
+        self._batch_length = 0
+        self._row = 0
+        self._i = 0
+
+    def _next_batch(self) -> bool:
+        while self._batch + 1 < len(self._batches):
+            self._batch += 1
+            self._batch_values = {}
+            self._row = 0
+            self._batch_length = self._batch_rows()
+            if self._batch_length > 0:
+                return True
+
+        return False
+
+    def _batch_rows(self) -> int:
+        batch = self._batches[self._batch]
+        if batch in self._row_filter:
+            return len(self._row_filter[batch])
+
+        return len(self._file.read_column(batch, self._columns[0]))
+
+    def _values(self, columnIndex) -> list:
+        if columnIndex not in self._batch_values:
+            batch = self._batches[self._batch]
+            column = self._file.read_column(batch, self._columns[columnIndex])
+            if batch in self._row_filter:
+                import pyarrow as pa
+                column = column.take(pa.array(self._row_filter[batch]))
+
+            self._batch_values[columnIndex] = column.to_pylist()
+
+        return self._batch_values[columnIndex]
+
+    def _value(self, columnIndex):
+        return self._values(columnIndex)[self._row - 1]
+
+    def read(self):
+        if self._row >= self._batch_length and not self._next_batch():
+            return jp.JBoolean(False)
+
+        self._row += 1
+        self._i += 1
+        if self._i % 10000 == 0:
+            self._logger.info("Read {} Rows".format(self._i))
+
+        return jp.JBoolean(True)
+
+    def close(self):
+        self._batch_values = {}
+        self._logger.info("Closed Arrow DataReader (read {} rows)".format(self._i))
+
+    def getBoolean(self, columnIndex):
+        return bool(self._value(columnIndex))
+
+    def getColumnCount(self):
+        return len(self._columns)
+
+    def getColumnIndex(self, columnName):
+        return self._columns.index(columnName)
+
+    def getColumnName(self, columnIndex):
+        return self._columns[columnIndex]
+
+    def getColumnType(self, columnIndex):
+        return _arrow_to_java_class(self._file.schema.field(columnIndex).type)
+
+    def getDouble(self, columnIndex):
+        return float(self._value(columnIndex))
+
+    def getFloat(self, columnIndex):
+        return float(self._value(columnIndex))
+
+    def getInt(self, columnIndex):
+        return int(self._value(columnIndex))
+
+    def getLong(self, columnIndex):
+        return int(self._value(columnIndex))
+
+    def getObject(self, columnIndex):
+        return self._value(columnIndex)
+
+    def getString(self, columnIndex):
+        return str(self._value(columnIndex))
+
+    def isNull(self, columnIndex):
+        value = self._value(columnIndex)
+        # files that weren't written from pandas can hold NaN as a value, which is missing in a dataframe.
+        return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+class ArrowDataReaderCommand:
+    def __init__(self, path:str, batches:List[int]=None, row_filter:Dict[int, np.ndarray]=None):
+        self._path = path
+        self._batches = batches
+        self._row_filter = row_filter
+
+    def executeReader(self) -> jp.JProxy:
+        return jp.JProxy("com.bayesserver.data.DataReader",
+                         inst=ArrowDataReader(self._path, self._batches, self._row_filter))
+
+
+class CreateArrowDataReaderCommand(CreatableWithDf):
+    def __init__(self, path:str, batches:List[int]=None, row_filter:Dict[int, np.ndarray]=None):
+        self._path = path
+        self._batches = batches
+        self._row_filter = row_filter
+
+    def create(self, _:pd.DataFrame=None):
+        return jp.JProxy("com.bayesserver.data.DataReaderCommand",
+                         inst=ArrowDataReaderCommand(self._path, self._batches, self._row_filter))
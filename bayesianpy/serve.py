@@ -0,0 +1,534 @@
+"""
+Serves one or more trained networks to local clients, keeping a warm inference engine on each worker thread.
+
+    python -m bayesianpy.serve --network titanic=titanic.bayes --socket /tmp/bayesianpy.sock
+
+Clients talk to the server over a Unix socket (or the process' stdin/ stdout, with --stdio) in length-prefixed
+frames: a 4 byte (big-endian) payload length, a 1 byte codec (0 for JSON, 1 for msgpack) and the payload. Responses
+are sent in the codec of the request. A request holds a batch of evidence in columns, with None where a variable has
+no evidence, and the queries to run for each row:
+
+    {'id': 1, 'network': 'titanic',
+     'evidence': {'sex': ['male', 'female'], 'age': [30.0, None]},
+     'queries': [{'type': 'QueryStateProbability', 'args': ['survived'], 'kwargs': {}}]}
+
+and results come back in the same layout, with a row's error (if any) in errors:
+
+    {'id': 1, 'results': {'survived_0': [0.2, 0.7], 'survived_1': [0.8, 0.3]}, 'errors': [None, None]}
+
+{'id': 2, 'command': 'stats'} returns the latency percentiles and batching statistics, and 'networks' lists the
+networks being served. See Client for the other end.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import math
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+import bayesianpy.jni
+import bayesianpy.model
+import bayesianpy.network
+from bayesianpy.service import AsyncInferenceService
+
+FRAME_HEADER = struct.Struct('>IB')
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+
+CODEC_JSON = 0
+CODEC_MSGPACK = 1
+
+_QUERY_TYPES = {name: cls for name, cls in vars(bayesianpy.model).items()
+                if isinstance(cls, type) and issubclass(cls, bayesianpy.model.QueryBase)
+                and cls is not bayesianpy.model.QueryBase}
+
+
+def default_codec() -> int:
+    try:
+        import msgpack
+        return CODEC_MSGPACK
+    except ImportError:
+        return CODEC_JSON
+
+
+def encode(message: dict, codec: int) -> bytes:
+    if codec == CODEC_MSGPACK:
+        import msgpack
+        return msgpack.packb(message, use_bin_type=True)
+
+    if codec == CODEC_JSON:
+        return json.dumps(message).encode('utf-8')
+
+    raise ValueError("Unknown codec {}".format(codec))
+
+
+def decode(payload: bytes, codec: int) -> dict:
+    if codec == CODEC_MSGPACK:
+        import msgpack
+        return msgpack.unpackb(payload, raw=False)
+
+    if codec == CODEC_JSON:
+        return json.loads(payload.decode('utf-8'))
+
+    raise ValueError("Unknown codec {}".format(codec))
+
+
+def frame(message: dict, codec: int) -> bytes:
+    payload = encode(message, codec)
+    return FRAME_HEADER.pack(len(payload), codec) + payload
+
+
+def _check_length(length: int):
+    if length > MAX_FRAME_SIZE:
+        raise ValueError("Frame of {} bytes is larger than the maximum of {}".format(length, MAX_FRAME_SIZE))
+
+
+def _read_payload(stream):
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None, None
+
+    length, codec = FRAME_HEADER.unpack(header)
+    _check_length(length)
+    payload = stream.read(length)
+    if len(payload) < length:
+        return None, None
+
+    return payload, codec
+
+
+def read_frame(stream):
+    """
+    Reads a frame from a (blocking) binary stream.
+    :return: (message, codec), or (None, None) if the stream has closed.
+    """
+    payload, codec = _read_payload(stream)
+    if payload is None:
+        return None, None
+
+    return decode(payload, codec), codec
+
+
+def query_spec(query_type: str, *args, **kwargs) -> dict:
+    """
+    Describes a query to run on the server, e.g. query_spec('QueryMeanVariance', 'age').
+    :param query_type: the name of one of the query classes in bayesianpy.model
+    """
+    if query_type not in _QUERY_TYPES:
+        raise ValueError("{} is not a known query type".format(query_type))
+
+    return {'type': query_type, 'args': list(args), 'kwargs': kwargs}
+
+
+def _create_queries(specs: List[dict]) -> List[bayesianpy.model.QueryBase]:
+    queries = []
+    for spec in specs:
+        query_type = _QUERY_TYPES.get(spec.get('type'))
+        if query_type is None:
+            raise ValueError("{} is not a known query type".format(spec.get('type')))
+
+        queries.append(query_type(*spec.get('args', []), **spec.get('kwargs', {})))
+
+    return queries
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _plain(value):
+    # results can hold Java strings and numpy scalars, neither of which the codecs know about.
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+
+    if hasattr(value, 'item'):
+        return value.item()
+
+    return str(value)
+
+
+class LatencyRecorder:
+    """
+    Keeps the latencies of the most recent requests, to report percentiles.
+    """
+
+    def __init__(self, window: int=10000):
+        self._latencies = collections.deque(maxlen=window)
+        self._count = 0
+
+    def record(self, seconds: float):
+        self._latencies.append(seconds)
+        self._count += 1
+
+    def percentiles(self, percentiles=(50, 90, 99)) -> dict:
+        stats = {'count': self._count}
+        if len(self._latencies) == 0:
+            return stats
+
+        values = np.percentile(np.array(self._latencies), percentiles)
+        for percentile, value in zip(percentiles, values):
+            stats['p{}_ms'.format(percentile)] = float(value) * 1000
+
+        stats['max_ms'] = max(self._latencies) * 1000
+        return stats
+
+
+class ModelServer:
+    """
+    Answers framed requests for the given networks, with an AsyncInferenceService (and so a pool of warm engines)
+    for each one.
+    """
+
+    def __init__(self, networks: Dict[str, object], workers: int=4, max_batch_size: int=64, max_wait: float=0.002,
+                 cache_size: int=None, logger: logging.Logger=None):
+        """
+        :param networks: name -> network (a Network or the Java network)
+        :param cache_size: if given, results are memoised in a QueryResultCache of this size for each network
+        """
+        if len(networks) == 0:
+            raise ValueError("At least one network needs to be served")
+
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+        self._services = {name: AsyncInferenceService(network, max_batch_size=max_batch_size, max_wait=max_wait,
+                                                      workers=workers, logger=self._logger,
+                                                      cache=bayesianpy.model.QueryResultCache(cache_size)
+                                                      if cache_size else None)
+                          for name, network in networks.items()}
+        self._latency = LatencyRecorder()
+        self._rows = 0
+
+    async def start(self):
+        for service in self._services.values():
+            await service.start()
+
+    async def stop(self):
+        for service in self._services.values():
+            await service.stop()
+
+    def get_statistics(self) -> dict:
+        return {'latency': self._latency.percentiles(), 'rows': self._rows,
+                'networks': {name: service.get_statistics() for name, service in self._services.items()}}
+
+    async def handle(self, request: dict) -> dict:
+        start = time.perf_counter()
+        response = {'id': request.get('id')}
+        try:
+            command = request.get('command', 'query')
+            if command == 'query':
+                response.update(await self._query(request))
+            elif command == 'stats':
+                response['stats'] = self.get_statistics()
+            elif command == 'networks':
+                response['networks'] = sorted(self._services.keys())
+            elif command == 'ping':
+                pass
+            else:
+                raise ValueError("Unknown command {}".format(command))
+        except Exception as e:
+            self._logger.error(e)
+            response['error'] = str(e)
+
+        self._latency.record(time.perf_counter() - start)
+        return response
+
+    async def _query(self, request: dict) -> dict:
+        service = self._services.get(request.get('network'))
+        if service is None:
+            raise ValueError("{} is not being served (try one of {})".format(request.get('network'),
+                                                                              sorted(self._services.keys())))
+
+        # checks the specs up front; each row then gets its own instances.
+        _create_queries(request.get('queries', []))
+        evidence = request.get('evidence', {})
+        rows = len(next(iter(evidence.values()))) if len(evidence) > 0 else 1
+        for name, values in evidence.items():
+            if len(values) != rows:
+                raise ValueError("Expected {} values of evidence for {}, but there are {}".format(rows, name,
+                                                                                                 len(values)))
+
+        results = await asyncio.gather(*[
+            service.query({name: values[i] for name, values in evidence.items() if not _is_missing(values[i])},
+                          _create_queries(request.get('queries', [])))
+            for i in range(rows)], return_exceptions=True)
+
+        self._rows += rows
+        columns = collections.OrderedDict()
+        errors = []
+        for i, result in enumerate(results):
+            if isinstance(result, BaseException):
+                errors.append(str(result))
+                continue
+
+            errors.append(None)
+            for query_result in result:
+                for key, value in query_result.items():
+                    columns.setdefault(str(key), [None] * rows)[i] = _plain(value)
+
+        return {'results': columns, 'errors': errors}
+
+    async def _respond(self, request: dict, codec: int, write):
+        write(frame(await self.handle(request), codec))
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # requests on a connection are answered as they finish (not necessarily in order), so use the ids.
+        pending = set()
+        try:
+            while True:
+                try:
+                    length, codec = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                    _check_length(length)
+                    payload = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    break
+
+                try:
+                    request = decode(payload, codec)
+                except Exception as e:
+                    # the request's id is unknown, so the client has to take this as the answer to its last request.
+                    writer.write(frame({'id': None, 'error': "Could not decode the request: {}".format(e)},
+                                       CODEC_JSON))
+                    continue
+
+                task = asyncio.ensure_future(self._respond(request, codec, writer.write))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+            if len(pending) > 0:
+                await asyncio.wait(list(pending))
+
+            await writer.drain()
+        except Exception as e:
+            self._logger.error(e)
+        finally:
+            writer.close()
+
+    async def serve_unix(self, path: str):
+        """
+        Serves requests on a Unix socket at path until cancelled.
+        """
+        if os.path.exists(path):
+            os.unlink(path)
+
+        server = await asyncio.start_unix_server(self._handle_connection, path=path)
+        self._logger.info("Serving {} on {}".format(sorted(self._services.keys()), path))
+        try:
+            await asyncio.Future()
+        finally:
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(path):
+                os.unlink(path)
+
+    async def serve_stdio(self, stdin=None, stdout=None):
+        """
+        Serves requests read from stdin until it closes, writing the responses to stdout.
+        """
+        stdin = stdin if stdin is not None else sys.stdin.buffer
+        stdout = stdout if stdout is not None else sys.stdout.buffer
+        loop = asyncio.get_running_loop()
+
+        def write(data):
+            stdout.write(data)
+            stdout.flush()
+
+        pending = set()
+        while True:
+            payload, codec = await loop.run_in_executor(None, _read_payload, stdin)
+            if payload is None:
+                break
+
+            try:
+                request = decode(payload, codec)
+            except Exception as e:
+                write(frame({'id': None, 'error': "Could not decode the request: {}".format(e)}, CODEC_JSON))
+                continue
+
+            task = asyncio.ensure_future(self._respond(request, codec, write))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        if len(pending) > 0:
+            await asyncio.wait(list(pending))
+
+
+class Client:
+    """
+    A (blocking) client for a ModelServer, either listening on a Unix socket or started by the client itself (see
+    spawn), in which case requests go over the server's stdin/ stdout.
+
+        with Client.spawn({'titanic': 'titanic.bayes'}) as client:
+            df = client.query('titanic', {'sex': ['male', 'female']}, [query_spec('QueryStateProbability', 'survived')])
+    """
+
+    def __init__(self, path: str=None, stream_in=None, stream_out=None, process: subprocess.Popen=None,
+                 codec: int=None):
+        if path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(path)
+            self._in = self._out = self._socket.makefile('rwb')
+        elif stream_in is not None and stream_out is not None:
+            self._socket = None
+            self._in = stream_in
+            self._out = stream_out
+        else:
+            raise ValueError("Either a socket path or both streams are required")
+
+        self._process = process
+        self._codec = codec if codec is not None else default_codec()
+        self._id = 0
+
+    @classmethod
+    def spawn(cls, networks: Dict[str, str], *args) -> 'Client':
+        """
+        Starts a server process talking over stdin/ stdout.
+        :param networks: name -> path of the network file
+        :param args: any other command line arguments for the server, e.g. '--workers', '2'
+        """
+        command = [sys.executable, '-m', 'bayesianpy.serve', '--stdio']
+        for name, path in networks.items():
+            command += ['--network', '{}={}'.format(name, path)]
+
+        process = subprocess.Popen(command + list(args), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return cls(stream_in=process.stdout, stream_out=process.stdin, process=process)
+
+    def _request(self, request: dict) -> dict:
+        self._id += 1
+        request['id'] = self._id
+        self._out.write(frame(request, self._codec))
+        self._out.flush()
+        response, _ = read_frame(self._in)
+        if response is None:
+            raise ValueError("The server closed the connection")
+
+        if response.get('id') is None and 'error' in response:
+            # the server couldn't read the request.
+            raise ValueError(response['error'])
+
+        if response.get('id') != self._id:
+            raise ValueError("Expected the response to request {}, but got {}".format(self._id, response.get('id')))
+
+        if 'error' in response:
+            raise ValueError(response['error'])
+
+        return response
+
+    def query(self, network: str, evidence, queries: List[dict]):
+        """
+        :param evidence: a DataFrame, or variable name -> list of values (None where there's no evidence)
+        :param queries: see query_spec
+        :return: a DataFrame of the results, with an '_error' column if any of the rows failed
+        """
+        import pandas as pd
+        if isinstance(evidence, pd.DataFrame):
+            evidence = {str(column): [None if _is_missing(v) else _plain(v) for v in evidence[column].tolist()]
+                        for column in evidence.columns}
+
+        response = self._request({'command': 'query', 'network': network, 'evidence': evidence,
+                                  'queries': queries})
+        df = pd.DataFrame(response['results'])
+        if any(error is not None for error in response['errors']):
+            df['_error'] = response['errors']
+
+        return df
+
+    def stats(self) -> dict:
+        return self._request({'command': 'stats'})['stats']
+
+    def networks(self) -> List[str]:
+        return self._request({'command': 'networks'})['networks']
+
+    def close(self):
+        if self._socket is not None:
+            self._in.close()
+            self._socket.close()
+
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+            self._process.stdout.close()
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _parse_networks(values: List[str]) -> Dict[str, str]:
+    networks = {}
+    for value in values:
+        name, separator, path = value.partition('=')
+        if separator == '':
+            name, path = os.path.splitext(os.path.basename(value))[0], value
+
+        networks[name] = path
+
+    return networks
+
+
+def main(argv: List[str]=None):
+    parser = argparse.ArgumentParser(prog='python -m bayesianpy.serve',
+                                     description="Serves trained networks to local clients.")
+    parser.add_argument('--network', action='append', required=True,
+                        help="A network to serve, as name=path (the name defaults to the file name)")
+    transport = parser.add_mutually_exclusive_group(required=True)
+    transport.add_argument('--socket', help="The Unix socket to listen on")
+    transport.add_argument('--stdio', action='store_true', help="Read requests from stdin, write responses to stdout")
+    parser.add_argument('--workers', type=int, default=4, help="Worker threads (and engines) per network")
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait', type=float, default=0.002, help="Seconds to wait for a batch to fill")
+    parser.add_argument('--cache-size', type=int, default=None, help="Memoise this many results per network")
+    parser.add_argument('--heap-space', default='6g')
+    args = parser.parse_args(argv)
+
+    # stdout might be the transport, so keep logging on stderr.
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    bayesianpy.jni.attach(logger, heap_space=args.heap_space)
+    networks = {name: bayesianpy.network.create_network_from_file(path)
+                for name, path in _parse_networks(args.network).items()}
+
+    server = ModelServer(networks, workers=args.workers, max_batch_size=args.max_batch_size,
+                         max_wait=args.max_wait, cache_size=args.cache_size, logger=logger)
+
+    async def run():
+        await server.start()
+        try:
+            if args.stdio:
+                await server.serve_stdio()
+            else:
+                await server.serve_unix(args.socket)
+        finally:
+            await server.stop()
+            logger.info("Served {}".format(server.get_statistics()))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    task = loop.create_task(run())
+    try:
+        loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Dict, List
+
+import bayesianpy.jni
+import bayesianpy.network
+from bayesianpy.model import InferenceEngine, Evidence, Query, QueryBase, QueryResultCache
+
+
+class _Request:
+    def __init__(self, evidence: Dict[str, object], queries: List[QueryBase], future: asyncio.Future):
+        self.evidence = evidence
+        self.queries = queries
+        self.future = future
+
+
+class AsyncInferenceService:
+    """
+    An asyncio front-end for online inference. Concurrent calls to query are gathered in to micro-batches
+    (up to max_batch_size requests, waiting no longer than max_wait seconds for a batch to fill), which are split
+    across a pool of JVM-attached threads, each with its own inference engine.
+
+        async with AsyncInferenceService(network) as service:
+            results = await service.query({'sex': 'male'}, [QueryStateProbability('survived')])
+    """
+
+    def __init__(self, network, max_batch_size: int=64, max_wait: float=0.002, workers: int=4,
+                 cache: QueryResultCache=None, logger: logging.Logger=None):
+        """
+        :param network: the (trained) network, either a Network or the Java network
+        :param cache: optionally, a result cache shared by all of the workers
+        """
+        if isinstance(network, bayesianpy.network.Network):
+            network = network.jclass()
+
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size should be at least 1")
+
+        self._network = network
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._workers = workers
+        self._cache = cache
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+        self._local = threading.local()
+        self._executor = None
+        self._queue = None
+        self._batcher = None
+        self._dispatches = set()
+        self._batches = 0
+        self._requests = 0
+
+    async def start(self):
+        if self._batcher is not None:
+            return
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._workers)
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.ensure_future(self._batch())
+
+    async def stop(self):
+        if self._batcher is None:
+            return
+
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+
+        if len(self._dispatches) > 0:
+            await asyncio.wait(list(self._dispatches))
+
+        # anything still waiting won't be run.
+        while not self._queue.empty():
+            request = self._queue.get_nowait()
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("The inference service was stopped"))
+
+        self._executor.shutdown(wait=True)
+        self._batcher = None
+
+    async def __aenter__(self) -> 'AsyncInferenceService':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def query(self, evidence: Dict[str, object], queries: List[QueryBase]) -> List[dict]:
+        """
+        :param evidence: variable name -> value (or state name)
+        :param queries: the queries to run, which are copied for each request
+        :return: a list of results, one dict per query (as Query.execute)
+        """
+        if self._batcher is None:
+            raise RuntimeError("The inference service hasn't been started (use start() or 'async with')")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Request(evidence, queries, future))
+        return await future
+
+    def get_statistics(self) -> dict:
+        return {'batches': self._batches, 'requests': self._requests,
+                'mean_batch_size': self._requests / self._batches if self._batches > 0 else 0.0,
+                'cache': self._cache.stats() if self._cache is not None else {}}
+
+    async def _batch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_wait
+            try:
+                while len(batch) < self._max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # stopping while a batch is being gathered; the requests are already off the queue, so run them.
+                self._start_dispatch(batch)
+                raise
+
+            self._start_dispatch(batch)
+
+    def _start_dispatch(self, batch: List[_Request]):
+        # don't wait for the batch to finish, so the other workers can be given batches meanwhile.
+        dispatch = asyncio.ensure_future(self._dispatch(batch))
+        self._dispatches.add(dispatch)
+        dispatch.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[_Request]):
+        # callers that were cancelled while the batch was gathered don't need running.
+        batch = [request for request in batch if not request.future.done()]
+        if len(batch) == 0:
+            return
+
+        self._batches += 1
+        self._requests += len(batch)
+        loop = asyncio.get_running_loop()
+        # one chunk of the batch per worker, rather than running it all on one of them.
+        chunks = [batch[i::self._workers] for i in range(min(self._workers, len(batch)))]
+        outcomes = await asyncio.gather(*[loop.run_in_executor(self._executor, self._run, chunk)
+                                          for chunk in chunks], return_exceptions=True)
+
+        for chunk, results in zip(chunks, outcomes):
+            if isinstance(results, BaseException):
+                results = [results] * len(chunk)
+
+            for request, result in zip(chunk, results):
+                if request.future.done():
+                    continue
+
+                if isinstance(result, BaseException):
+                    request.future.set_exception(result)
+                else:
+                    request.future.set_result(result)
+
+    def _get_worker(self):
+        # each thread keeps its own engine, evidence and query for the life of the service.
+        if getattr(self._local, 'query', None) is None:
+            bayesianpy.jni.attach_thread(self._logger)
+            engine = InferenceEngine(self._network).create_engine()
+            evidence = Evidence(self._network, engine)
+            self._local.engine = engine
+            self._local.evidence = evidence
+            self._local.query = Query(self._network, engine, self._logger, cache=self._cache, evidence=evidence)
+
+        return self._local.engine, self._local.evidence, self._local.query
+
+    def _run(self, batch: List[_Request]) -> list:
+        engine, evidence, query = self._get_worker()
+        results = []
+        for request in batch:
+            try:
+                evidence.apply(request.evidence)
+                # setup stores engine specific state on the queries (and some of it in lists passed to the
+                # constructor), so each request gets its own instances.
+                queries = [q.clone() for q in request.queries]
+                results.append(query.execute(queries, aslist=True))
+            except BaseException as e:
+                self._logger.error(e)
+                results.append(e)
+            finally:
+                evidence.clear()
+                # the engine lives as long as the worker, so don't let query distributions pile up on it.
+                engine.getQueryDistributions().clear()
+
+        return results
@@ -241,12 +241,11 @@ class AutoStructure(Template):
 
                     if dataPartitioning.getMethod() == bayesServer().data.DataPartitionMethod.EXCLUDE_PARTITION_DATA:
                         print("Excluding")
-                        subset = self._ds.subset(train)
+                        cmd = self._ds.create_subset_data_reader_command(train)
                     else:
                         print("Including")
-                        subset = self._ds.subset(test)
+                        cmd = self._ds.create_subset_data_reader_command(test)
 
-                    cmd = subset.create_data_reader_command()
                     return bayesServer().data.DefaultEvidenceReaderCommand(cmd,
                                                                            jp.java.util.Arrays.asList(
                                                                                variable_references),
@@ -327,7 +326,7 @@ class WithDiscretisedVariables(Template):
                 links_from = [link.getFrom() for link in node.getLinks() if link.getFrom().getName() != var]
                 links_to = [link.getTo() for link in node.getLinks() if link.getTo().getName() != var]
 
-                network.getNodes().remove(node)
+                bayesianpy.network.remove_node(network, node)
 
         for node in builder.create_discretised_variables(network, self._continuous, self._discretised_variables.columns.tolist(),
                         bin_count=self._default_bin_count, mode=self._mode, zero_crossing=self._zero_crossing, defined_bins=self._bins):
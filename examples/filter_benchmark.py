@@ -0,0 +1,47 @@
+import bayesianpy
+import pandas as pd
+import numpy as np
+import time
+
+# Compares the old, per-rule Filter chain (a unique() per column for each rule) against Filter.apply, which
+# profiles a wide (1,000 column) frame once and projects it once.
+
+def legacy_apply(df: pd.DataFrame) -> pd.DataFrame:
+    column_names = df.apply(lambda x: len(x.unique()) > 1)
+    df = df[column_names[column_names == True].index.tolist()].copy()
+    column_names = df.apply(lambda x: len(x.unique()) != len(df))
+    df = df[column_names[column_names == True].index.tolist()]
+    column_names = df.select_dtypes(include=['object']).apply(lambda x: len(x.unique()) >= 30)
+    cols = list(set(df.columns.tolist()) - set(column_names[column_names == True].index.tolist()))
+    return df[cols]
+
+
+def main():
+    rows = 20000
+    columns = {}
+    for i in range(1000):
+        kind = i % 4
+        if kind == 0:
+            columns['continuous_{}'.format(i)] = np.random.normal(size=rows)
+        elif kind == 1:
+            columns['discrete_{}'.format(i)] = np.random.choice(['a', 'b', 'c'], size=rows)
+        elif kind == 2:
+            columns['states_{}'.format(i)] = np.random.randint(0, 100, size=rows).astype(str)
+        else:
+            columns['static_{}'.format(i)] = np.ones(rows)
+
+    df = pd.DataFrame(columns)
+
+    start = time.time()
+    legacy = legacy_apply(df)
+    print("Legacy filter chain: {:.2f}s ({} columns kept)".format(time.time() - start, len(legacy.columns)))
+
+    start = time.time()
+    filtered = bayesianpy.data.Filter.apply(df)
+    print("Filter.apply: {:.2f}s ({} columns kept)".format(time.time() - start, len(filtered.columns)))
+
+    assert set(legacy.columns) == set(filtered.columns)
+
+
+if __name__ == "__main__":
+    main()
@@ -85,7 +85,9 @@ def main():
                                                                              bayesianpy.jni.bayesServerAnalysis().CrossValidationCombineMethod.WEIGHTED_AVERAGE)
 
         # append the score on to the existing dataframe
-        samples.set_value(reader.get_index(), 'score', score)
+        reader.set_value('score', score)
+
+    samples = reader.writer().get_dataframe()
 
     variables = ['sepal_length', 'sepal_width', 'petal_length', 'petal_width']
 
@@ -0,0 +1,38 @@
+import bayesianpy
+import pandas as pd
+import numpy as np
+import logging
+import shutil
+import tempfile
+import time
+
+# Compares writing a dataframe to SQLite through pandas.to_sql (the old DefaultDataSet.write) against the bulk
+# loader, and reports rows/sec for each.
+
+def main():
+    logger = logging.getLogger()
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+    rows = 1000000
+    df = pd.DataFrame({'a': np.random.normal(size=rows),
+                       'b': np.random.randint(0, 10, size=rows),
+                       'c': np.random.choice(['x', 'y', 'z'], size=rows),
+                       'd': np.random.rand(rows) > 0.5})
+    df.loc[df.sample(frac=0.1).index, 'a'] = np.nan
+
+    db_folder = tempfile.mkdtemp()
+    try:
+        for bulk_write in [False, True]:
+            dataset = bayesianpy.data.DefaultDataSet(df, db_folder, logger, bulk_write=bulk_write)
+            start = time.time()
+            dataset.write()
+            elapsed = time.time() - start
+            print("bulk_write={}: {:.2f}s ({:.0f} rows/sec)".format(bulk_write, elapsed, rows / elapsed))
+            dataset.cleanup()
+    finally:
+        shutil.rmtree(db_folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
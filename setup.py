@@ -16,5 +16,6 @@ setup(
                       'dask[complete]==0.16',
                       'multiprocess'
                       ],
+    extras_require={'arrow': ['pyarrow']},
     include_package_data=True
 )
@@ -0,0 +1,78 @@
+import unittest
+import os
+import tempfile
+import shutil
+import numpy as np
+import pandas as pd
+import bayesianpy.jni
+from bayesianpy.data import ArrowDataSet
+from bayesianpy.reader import ArrowDataReader
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed")
+class ArrowDataSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        bayesianpy.jni.attach()
+        self.folder = tempfile.mkdtemp()
+        self.df = pd.DataFrame({'x': np.arange(10, dtype=float), 'y': list('abcdefghij')},
+                               index=pd.RangeIndex(10, name='ix'))
+        self.df.loc[3, 'x'] = np.nan
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _read(self, reader: ArrowDataReader, column: str) -> list:
+        index = reader.getColumnIndex(column)
+        values = []
+        while reader.read():
+            values.append(None if reader.isNull(index) else reader.getObject(index))
+
+        return values
+
+    def test_write_and_read(self):
+        dataset = ArrowDataSet(self.df, db_folder=self.folder, rows_per_batch=4)
+        dataset.write()
+
+        reader = ArrowDataReader(dataset.get_path())
+        self.assertEqual(reader.getColumnName(0), 'ix')
+        self.assertEqual(self._read(reader, 'x'), [0.0, 1.0, 2.0, None, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0])
+
+        dataset.cleanup()
+        self.assertFalse(os.path.exists(dataset.get_path()))
+
+    def test_subset(self):
+        dataset = ArrowDataSet(self.df, db_folder=self.folder, rows_per_batch=4)
+        dataset.write()
+        subset = dataset.subset([1, 2, 8]).subset([2, 8])
+
+        self.assertEqual(subset._batches, [0, 2])
+        self.assertEqual(self._read(ArrowDataReader(subset.get_path(), subset._batches, subset._row_filter), 'y'),
+                         ['c', 'i'])
+
+    def test_without_the_index(self):
+        dataset = ArrowDataSet(self.df, db_folder=self.folder)
+        dataset.write(use_index=False)
+
+        self.assertEqual(ArrowDataReader(dataset.get_path()).getColumnName(0), 'x')
+        with self.assertRaises(ValueError):
+            dataset.subset([1])
+
+    def test_nan_in_parquet_is_null(self):
+        path = os.path.join(self.folder, "data.parquet")
+        # written with NaN as a value, rather than converted to null as from_pandas does.
+        pq.write_table(pa.table({'ix': [0, 1, 2], 'x': pa.array([1.0, float('nan'), None], from_pandas=False)}),
+                       path)
+        dataset = ArrowDataSet(self.df.iloc[:3], path=path)
+
+        self.assertEqual(self._read(ArrowDataReader(dataset.get_path()), 'x'), [1.0, None, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
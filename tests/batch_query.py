@@ -0,0 +1,71 @@
+import unittest
+import numpy as np
+import pandas as pd
+from bayesianpy.model import BatchQuery
+from bayesianpy.data import DataSet
+from bayesianpy.network import Network
+import bayesianpy.output
+
+
+class SubsetDataSet(DataSet):
+    def subset(self, indices):
+        return SubsetDataSet(self.data.loc[indices])
+
+
+class FakeVariable:
+    def __init__(self, name):
+        self._name = name
+
+    def getName(self):
+        return self._name
+
+
+class FakeJavaNetwork:
+    # just enough of the Java network for BatchQuery's constructor.
+    def saveToString(self):
+        return "<Network />"
+
+    def getVariables(self):
+        return [FakeVariable('a'), FakeVariable('b')]
+
+
+class BatchQueryDeduplicationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({'a': ['x', 'y', 'x', 'y', 'x'], 'b': [1.0, 2.0, 1.0, np.nan, 1.0],
+                                'other': [1, 2, 3, 4, 5]}, index=pd.Index([10, 11, 12, 13, 14], name='ix'))
+
+    def test_find_duplicates(self):
+        representatives, codes = BatchQuery._find_duplicates(self.df, ['a', 'b'])
+
+        self.assertEqual(representatives.tolist(), [10, 11, 13])
+        self.assertEqual(representatives[codes].tolist(), [10, 11, 10, 13, 10])
+
+    def test_find_duplicates_without_evidence_columns(self):
+        representatives, codes = BatchQuery._find_duplicates(self.df, [])
+
+        self.assertEqual(representatives[codes].tolist(), [10] * 5)
+
+    def test_scatter_results(self):
+        representatives, codes = BatchQuery._find_duplicates(self.df, ['a', 'b'])
+        # the results come back in caseid order, which needn't be the order of the representatives.
+        pdf = pd.DataFrame({'p': [0.3, 0.1, 0.2]}, index=pd.Index([13, 10, 11], name='caseid'))
+
+        scattered = BatchQuery._scatter_results(pdf, representatives, codes, self.df.index)
+
+        self.assertEqual(scattered.index.tolist(), self.df.index.tolist())
+        self.assertEqual(scattered['p'].tolist(), [0.1, 0.2, 0.1, 0.3, 0.1])
+
+    def test_only_datasets_that_read_subsets_are_deduplicated(self):
+        self.assertFalse(DataSet(self.df).supports_subsets())
+        self.assertTrue(SubsetDataSet(self.df).supports_subsets())
+
+    def test_accepts_the_network_wrapper(self):
+        for batch_query in (BatchQuery, bayesianpy.output.BatchQuery):
+            for network in (FakeJavaNetwork(), Network(FakeJavaNetwork())):
+                query = batch_query(network, SubsetDataSet(self.df), logger=None)
+                self.assertEqual(query._get_evidence_columns(self.df, []), ['a', 'b'])
+
+
+if __name__ == "__main__":
+    unittest.main()
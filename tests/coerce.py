@@ -0,0 +1,102 @@
+import unittest
+import logging
+import numpy as np
+import pandas as pd
+import dask.dataframe as dd
+from bayesianpy.data import DataFrame
+
+
+# the per column implementations the coerce_* functions replaced.
+def coerce_to_numeric(df, cutoff=0.10):
+    for col in df.columns:
+        if DataFrame.is_numeric(df[col].dtype) or DataFrame.is_timestamp(df[col].dtype):
+            continue
+
+        values = df[col].dropna().unique()
+        ratio = 0
+        if len(values) > 0:
+            new_values = pd.to_numeric(values, errors='coerce')
+            ratio = (len(values) - len(new_values[~np.isnan(new_values)])) / len(values)
+
+        if ratio <= cutoff:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    return df
+
+
+def coerce_to_boolean(df):
+    for col in df.columns:
+        if df[col].min() == df[col].max():
+            continue
+
+        if len(df[col].dropna().unique()) != 2:
+            continue
+
+        values = df[col].dropna().unique()
+        series = df[col].astype(bool)
+        if len(df[df[col] == values[0]]) != len(series[series == True]) and \
+                len(df[df[col] == values[1]]) != len(series[series == True]):
+            continue
+
+        df[col] = series
+
+    return df
+
+
+class CoerceToNumericTestCase(unittest.TestCase):
+
+    def setUp(self):
+        n = 100
+        self.df = pd.DataFrame({
+            'ints': pd.Series([str(i % 5) for i in range(n)], dtype=object),
+            'ints_with_nan': pd.Series([str(i % 5) if i % 3 else None for i in range(n)], dtype=object),
+            'ints_and_floats': pd.Series(['1', '2.5', 3, 4.0] * (n // 4), dtype=object),
+            'mostly_numbers': pd.Series(['1', '2', 'x'] + [str(i) for i in range(n - 3)], dtype=object),
+            'words': pd.Series(['a', 'b', '1', '2'] * (n // 4), dtype=object),
+            'empty': pd.Series([None] * n, dtype=object),
+            'numbers': np.arange(n, dtype=float),
+            # more distinct values than half the rows, so parsed row by row.
+            'unique': pd.Series([str(i) for i in range(n)], dtype=object)
+        })
+
+    def test_same_as_per_column(self):
+        expected = coerce_to_numeric(self.df.copy())
+        actual = DataFrame.coerce_to_numeric(self.df.copy(), logging.getLogger(__name__))
+
+        pd.testing.assert_frame_equal(actual, expected)
+
+    def test_dask(self):
+        expected = coerce_to_numeric(self.df.copy())
+        actual = DataFrame.coerce_to_numeric(dd.from_pandas(self.df.copy(), npartitions=3),
+                                             logging.getLogger(__name__)).compute()
+
+        for col in ['ints', 'ints_with_nan', 'ints_and_floats', 'mostly_numbers', 'empty', 'numbers', 'unique']:
+            np.testing.assert_array_equal(actual[col].values, expected[col].values)
+            self.assertEqual(actual[col].dtype, expected[col].dtype, col)
+
+
+class CoerceToBooleanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        n = 100
+        self.df = pd.DataFrame({
+            'zero_one': np.arange(n) % 2,
+            'zero_one_float_with_nan': np.where(np.arange(n) % 5 == 0, np.nan, np.arange(n) % 2),
+            'one_two': np.arange(n) % 2 + 1,
+            'bool': np.arange(n) % 3 == 0,
+            'static': np.zeros(n),
+            'three': np.arange(n) % 3,
+            'strings': pd.Series(['', 'x'] * (n // 2), dtype=object)
+        })
+
+    def test_same_as_per_column(self):
+        expected = coerce_to_boolean(self.df.copy())
+        actual = DataFrame.coerce_to_boolean(self.df.copy())
+
+        pd.testing.assert_frame_equal(actual, expected)
+        self.assertTrue(DataFrame.is_bool(actual['zero_one'].dtype))
+        self.assertFalse(DataFrame.is_bool(actual['one_two'].dtype))
+
+
+if __name__ == "__main__":
+    unittest.main()
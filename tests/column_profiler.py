@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+import pandas as pd
+import dask.dataframe as dd
+from bayesianpy.data import ColumnProfiler, AutoType
+
+
+class ColumnProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        n = 300
+        self.df = pd.DataFrame({
+            'mixed': pd.Series(['a', 1, 2.5, None, 'b', 1] * (n // 6), dtype=object),
+            'nan': np.where(np.arange(n) % 7 == 0, np.nan, np.arange(n) % 13).astype(float),
+            'category': pd.Categorical(['x', 'y', None, 'z', 'x'] * (n // 5)),
+            'int': np.arange(n) % 40,
+            'bool': np.arange(n) % 2 == 0,
+            'unique': np.arange(n, dtype=float)
+        })
+
+    def _assert_matches_pandas(self, profiler):
+        for col in self.df.columns:
+            series = self.df[col]
+            profile = profiler.get(col)
+
+            # the statistics AutoType and Filter computed per column before.
+            self.assertEqual(profile.count, len(series), col)
+            self.assertEqual(profile.null_count, int(series.isnull().sum()), col)
+            self.assertEqual(profile.distinct(dropna=False), len(series.unique()), col)
+            self.assertEqual(profile.distinct(), series.nunique(), col)
+
+        for col in ['nan', 'int', 'bool', 'unique']:
+            self.assertEqual(profiler.get(col).min, self.df[col].min(), col)
+            self.assertEqual(profiler.get(col).max, self.df[col].max(), col)
+
+    def test_pandas(self):
+        self._assert_matches_pandas(ColumnProfiler(self.df))
+
+    def test_dask_partitions_are_merged(self):
+        self._assert_matches_pandas(ColumnProfiler(dd.from_pandas(self.df, npartitions=4)))
+
+    def test_estimate_beyond_exact_limit(self):
+        series = pd.Series(np.arange(20000, dtype=float))
+        profile = ColumnProfiler(dd.from_pandas(series.to_frame('x'), npartitions=4), exact_limit=100).get('x')
+
+        self.assertFalse(profile.is_exact())
+        self.assertAlmostEqual(profile.distinct(), len(series), delta=len(series) * 0.05)
+
+    def test_auto_type_decisions(self):
+        auto = AutoType(self.df)
+
+        self.assertEqual(sorted(auto.get_continuous_variables()), ['int', 'unique'])
+        self.assertEqual(sorted(auto.get_discrete_variables()), ['bool', 'category', 'mixed', 'nan'])
+
+
+if __name__ == "__main__":
+    unittest.main()
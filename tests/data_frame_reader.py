@@ -0,0 +1,33 @@
+import unittest
+import copy
+import pandas as pd
+from bayesianpy.data import DataFrameReader
+
+
+class DataFrameReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']}, index=pd.Index([10, 20], name='ix'))
+
+    def test_columns_as_attributes(self):
+        reader = DataFrameReader(self.df)
+        self.assertTrue(reader.read())
+
+        self.assertEqual((reader.a, reader.b, reader.missing), (1, 'x', None))
+        self.assertEqual(reader.get_index(), 10)
+
+    def test_instance_without_init(self):
+        reader = DataFrameReader.__new__(DataFrameReader)
+
+        with self.assertRaises(AttributeError):
+            reader._positions
+        self.assertFalse(hasattr(reader, '__deepcopy__'))
+
+    def test_copy(self):
+        # copy looks up __setstate__ on an instance made without __init__.
+        reader = DataFrameReader(self.df)
+        self.assertEqual(copy.copy(reader).columns(), ['a', 'b'])
+
+
+if __name__ == "__main__":
+    unittest.main()
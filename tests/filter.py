@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+import pandas as pd
+import dask.dataframe as dd
+from bayesianpy.data import Filter, ColumnProfiler
+
+
+# the row-wise rules Filter used before it was computed from a column profile.
+def remove_static_variables(df, cutoff=1):
+    return [col for col in df.columns if len(df[col].unique()) > cutoff]
+
+
+def remove_variable_variables(df):
+    return [col for col in df.columns if len(df[col].unique()) != len(df)]
+
+
+def remove_mostly_empty_variables(df, cutoff=0.1):
+    return [col for col in df.columns if len(df[col].dropna()) / len(df) > cutoff]
+
+
+def remove_discrete_variables_with_too_many_states(df, num_states=30):
+    objects = df.select_dtypes(include=['object']).columns
+    return [col for col in df.columns if col not in objects or len(df[col].unique()) < num_states]
+
+
+class FilterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        n = 2000
+        rng = np.random.RandomState(0)
+        self.df = pd.DataFrame({
+            'static': np.ones(n),
+            'static_with_nan': np.where(np.arange(n) % 2 == 0, 1.0, np.nan),
+            'id': np.arange(n),
+            # unique on all but one row, which the estimate alone can't tell apart from an id.
+            'almost_id': np.concatenate((np.arange(n - 1), [0])),
+            'unique_with_one_nan': np.concatenate((np.arange(n - 1, dtype=float), [np.nan])),
+            'empty': np.where(np.arange(n) % 20 == 0, 1.0, np.nan),
+            'states': pd.Series(rng.randint(0, 40, n).astype(str), dtype=object),
+            'few_states': pd.Series(rng.choice(['a', 'b', None], n), dtype=object),
+            'continuous': rng.normal(size=n).round(1)
+        })
+
+    def _assert_same(self, df):
+        profiler = ColumnProfiler(df, exact_limit=100)
+        pdf = self.df
+        self.assertEqual(list(Filter.remove_static_variables(df, profiler=profiler).columns),
+                         remove_static_variables(pdf))
+        self.assertEqual(list(Filter.remove_variable_variables(df, profiler=profiler).columns),
+                         remove_variable_variables(pdf))
+        self.assertEqual(list(Filter.remove_mostly_empty_variables(df, profiler=profiler).columns),
+                         remove_mostly_empty_variables(pdf))
+        self.assertEqual(list(Filter.remove_discrete_variables_with_too_many_states(df, profiler=profiler).columns),
+                         remove_discrete_variables_with_too_many_states(pdf))
+
+        chained = remove_discrete_variables_with_too_many_states(
+            pdf[remove_variable_variables(pdf[remove_static_variables(pdf)])])
+        self.assertEqual(sorted(Filter.apply(df).columns), sorted(chained))
+
+    def test_pandas(self):
+        self._assert_same(self.df)
+
+    def test_dask(self):
+        self._assert_same(dd.from_pandas(self.df, npartitions=3))
+
+
+if __name__ == "__main__":
+    unittest.main()
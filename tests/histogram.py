@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+import pandas as pd
+import bayesianpy.jni
+from bayesianpy.jni import bayesServerAnalysis, bayesServerDiscovery, jp
+from bayesianpy.data import Histogram, create_histogram, as_probability
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def setUp(self):
+        bayesianpy.jni.attach()
+        rng = np.random.RandomState(5)
+        self.values = np.concatenate([np.round(rng.normal(size=2000), 1), rng.exponential(size=1000)])
+
+    def test_matches_the_java_cdf(self):
+        histogram = Histogram.from_values(self.values)
+        x = np.concatenate([np.linspace(-5, 10, 301), self.values[:100], histogram.edges])
+
+        expected = np.array([histogram.density.cdf(float(v)) for v in x])
+        np.testing.assert_allclose(histogram.cdf(x), expected, atol=1e-12)
+        self.assertAlmostEqual(histogram.cdf(0.25), histogram.density.cdf(0.25))
+
+    def test_learns_the_same_density_as_one_value_per_row(self):
+        weighted_values = []
+        for value in self.values:
+            v = bayesServerDiscovery().WeightedValue()
+            v.setValue(jp.java.lang.Double(float(value)))
+            v.setWeight(1.0)
+            weighted_values.append(v)
+
+        per_row = bayesServerAnalysis().HistogramDensity.learn(jp.java.util.Arrays.asList(weighted_values),
+                                                               bayesServerAnalysis().HistogramDensityOptions())
+        density = create_histogram(pd.Series(np.append(self.values, [np.nan, np.inf])))
+
+        for x in np.linspace(-4, 8, 49):
+            self.assertAlmostEqual(density.cdf(float(x)), per_row.cdf(float(x)), places=12)
+
+    def test_constant_series(self):
+        histogram = Histogram.from_values(np.full(20, 3.0))
+
+        self.assertEqual(histogram.cdf(np.array([2.0, 3.0, 4.0])).tolist(), [0.0, 1.0, 1.0])
+
+    def test_as_probability(self):
+        series = pd.Series([1.0, np.nan, 2.0, 3.0, 2.5], name='x')
+        df = as_probability(series)
+
+        self.assertTrue(np.isnan(df['cdf'].iloc[1]))
+        self.assertTrue((np.diff(df['cdf'].dropna().values[[0, 1, 3, 2]]) >= 0).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import sqlite3
+import tempfile
+import shutil
+import os
+import bayesianpy.jni
+from bayesianpy.reader import JdbcConnectionPool
+
+
+class JdbcConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        bayesianpy.jni.attach()
+        self.folder = tempfile.mkdtemp()
+        path = os.path.join(self.folder, "pool.db")
+        with sqlite3.connect(path) as conn:
+            conn.execute("create table t (ix integer)")
+            conn.executemany("insert into t values (?)", [(i,) for i in range(10)])
+
+        self.pool = JdbcConnectionPool("jdbc:sqlite:{}".format(path), max_size=2, max_statements=2, timeout=0.1)
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_reuses_connections_and_statements(self):
+        connection = self.pool.borrow()
+        statement = self.pool.prepare(connection, "select * from t")
+        self.pool.release(connection)
+
+        connection = self.pool.borrow()
+        self.assertIs(self.pool.prepare(connection, "select * from t"), statement)
+
+        result_set = statement.executeQuery()
+        rows = 0
+        while result_set.next():
+            rows += 1
+        result_set.close()
+        self.pool.release(connection)
+
+        self.assertEqual(rows, 10)
+
+    def test_closes_evicted_statements(self):
+        connection = self.pool.borrow()
+        first = self.pool.prepare(connection, "select * from t where ix < 5")
+        self.pool.prepare(connection, "select * from t where ix >= 5")
+        self.pool.prepare(connection, "select * from t where ix = 1")
+
+        self.assertTrue(first.isClosed())
+        self.assertEqual(self.pool.statistics()[0]['evictions'], 1)
+        self.pool.release(connection)
+
+    def test_statements_are_kept_per_connection(self):
+        first = self.pool.borrow()
+        second = self.pool.borrow()
+
+        self.assertIsNot(self.pool.prepare(first, "select * from t"), self.pool.prepare(second, "select * from t"))
+
+        self.pool.release(first)
+        self.pool.release(second)
+
+    def test_limits_open_connections(self):
+        first = self.pool.borrow()
+        second = self.pool.borrow()
+
+        with self.assertRaises(RuntimeError):
+            self.pool.borrow()
+
+        self.pool.release(second)
+        self.assertIs(self.pool.borrow(), second)
+        self.pool.release(first)
+        self.pool.release(second)
+
+
+if __name__ == "__main__":
+    unittest.main()
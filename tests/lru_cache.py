@@ -0,0 +1,81 @@
+import unittest
+import time
+from bayesianpy.cache import LruCache
+
+
+class LruCacheTestCase(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LruCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_evicts_by_weight(self):
+        cache = LruCache(max_size=None, max_weight=10)
+        cache.put('a', 'x', weight=6)
+        cache.put('b', 'y', weight=6)
+
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.stats()['weight'], 6)
+
+    def test_get_or_create_only_creates_once(self):
+        cache = LruCache()
+        calls = []
+        for i in range(3):
+            cache.get_or_create('a', lambda: calls.append(1) or len(calls))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_expires_after_ttl(self):
+        cache = LruCache(ttl=0.01)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_on_evict_is_called_for_evicted_entries(self):
+        evicted = []
+        cache = LruCache(max_size=1, on_evict=lambda key, value: evicted.append((key, value)))
+        cache.put('a', 1)
+        cache.put('b', 2)
+
+        self.assertEqual(evicted, [('a', 1)])
+
+    def test_on_evict_is_called_for_replaced_and_invalidated_entries(self):
+        evicted = []
+        cache = LruCache(on_evict=lambda key, value: evicted.append((key, value)))
+        cache.put('a', 1)
+        cache.put('a', 1)
+        cache.put('a', 2)
+        cache.put('b', 3)
+        cache.put('c', 4)
+        cache.invalidate('b')
+        cache.invalidate()
+
+        self.assertEqual(evicted, [('a', 1), ('b', 3), ('a', 2), ('c', 4)])
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['weight'], 0)
+
+    def test_expired_entries_are_not_contained(self):
+        evicted = []
+        cache = LruCache(ttl=0.01, on_evict=lambda key, value: evicted.append((key, value)))
+        cache.put('a', 1)
+        self.assertIn('a', cache)
+        time.sleep(0.02)
+
+        self.assertNotIn('a', cache)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(evicted, [('a', 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import threading
+import pandas as pd
+import bayesianpy.jni
+import bayesianpy.network
+from bayesianpy.jni import jp
+from bayesianpy.network import Builder as builder
+
+
+class NetworkCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        bayesianpy.jni.attach()
+        network = bayesianpy.network.create_network()
+        builder.create_discrete_variable(network, pd.DataFrame({'a': ['x', 'y']}), 'a')
+        self.serialised = bayesianpy.network.serialise(network)
+
+    def tearDown(self):
+        bayesianpy.network.get_network_cache().invalidate()
+
+    def test_networks_are_cached_per_thread(self):
+        network = bayesianpy.network.create_network_from_serialised(self.serialised)
+        self.assertIs(bayesianpy.network.create_network_from_serialised(self.serialised), network)
+
+        networks = []
+
+        def create():
+            bayesianpy.jni.attach_thread()
+            try:
+                networks.append(bayesianpy.network.create_network_from_serialised(self.serialised))
+            finally:
+                # an attached thread keeps the JVM from shutting down.
+                jp.detachThreadFromJVM()
+
+        thread = threading.Thread(target=create)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(len(networks), 1)
+        self.assertIsNot(networks[0], network)
+
+
+if __name__ == "__main__":
+    unittest.main()
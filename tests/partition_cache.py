@@ -0,0 +1,62 @@
+import unittest
+import threading
+from unittest import mock
+import pandas as pd
+from bayesianpy.reader import PartitionCache
+
+
+class PartitionCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.computed = []
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def _compute(self, partition):
+        self.computed.append(partition)
+        return pd.DataFrame({'p': [partition] * 100})
+
+    def test_spills_beyond_the_memory_budget(self):
+        self.cache = PartitionCache(memory_budget=0)
+        self.cache.get(0, self._compute)
+
+        pd.testing.assert_frame_equal(self.cache.get(0, self._compute), self._compute(0))
+        self.assertEqual(self.cache.stats()['spilled'], 1)
+        self.assertEqual((self.cache.stats()['hits'], self.cache.stats()['misses']), (1, 1))
+
+    def test_pickles_outside_of_the_lock(self):
+        self.cache = PartitionCache(memory_budget=0)
+        free = []
+        to_pickle = pd.DataFrame.to_pickle
+
+        def check(df, path):
+            acquired = self.cache._lock.acquire(blocking=False)
+            if acquired:
+                self.cache._lock.release()
+            free.append(acquired)
+            to_pickle(df, path)
+
+        with mock.patch.object(pd.DataFrame, 'to_pickle', check):
+            self.cache.get(0, self._compute)
+
+        self.assertEqual(free, [True])
+        self.assertEqual(self.cache.stats()['spilled'], 1)
+
+    def test_counts_from_several_threads(self):
+        self.cache = PartitionCache(memory_budget=0)
+        threads = [threading.Thread(target=lambda: [self.cache.get(p, self._compute) for p in range(5)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 20)
+        self.assertEqual(stats['misses'], len(self.computed))
+        self.assertEqual(stats['spilled'], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import threading
+import time
+import pandas as pd
+from bayesianpy.reader import PartitionPrefetcher
+
+
+class PartitionPrefetcherTestCase(unittest.TestCase):
+
+    def test_holds_at_most_depth_partitions_ahead(self):
+        lock = threading.Lock()
+        counts = {'computed': 0, 'read': 0, 'held': 0}
+
+        def compute(partition):
+            with lock:
+                counts['computed'] += 1
+                # the partitions computed, or being computed, that the reader hasn't finished with.
+                counts['held'] = max(counts['held'], counts['computed'] - counts['read'])
+
+            return pd.DataFrame({'p': [partition]})
+
+        prefetcher = PartitionPrefetcher(compute, list(range(10)), depth=2)
+        partitions = []
+        for partition, df in prefetcher:
+            time.sleep(0.01)
+            partitions.append(int(df['p'].iloc[0]))
+            with lock:
+                counts['read'] += 1
+        prefetcher.close()
+
+        self.assertEqual(partitions, list(range(10)))
+        self.assertEqual(counts['held'], 3)
+
+    def test_errors_are_raised_in_the_reader(self):
+        def compute(partition):
+            if partition == 1:
+                raise ValueError("partition {}".format(partition))
+            return pd.DataFrame({'p': [partition]})
+
+        prefetcher = PartitionPrefetcher(compute, [0, 1, 2], depth=1)
+        with self.assertRaises(ValueError):
+            list(prefetcher)
+        prefetcher.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
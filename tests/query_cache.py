@@ -0,0 +1,91 @@
+import unittest
+import numpy as np
+import bayesianpy.jni
+import bayesianpy.network
+from bayesianpy.jni import bayesServer
+from bayesianpy.model import QueryBase, QueryStateProbability, QueryResultCache, InferenceEngine, Evidence, Query
+
+
+class QueryWithWeights(QueryBase):
+    def __init__(self, weights, scale=1.0):
+        self._weights = weights
+
+
+class QuerySignatureTestCase(unittest.TestCase):
+
+    def test_arrays_are_hashed_in_full(self):
+        weights = np.zeros(5000)
+        other = weights.copy()
+        other[2500] = 1
+
+        self.assertEqual(QueryWithWeights(weights).signature(), QueryWithWeights(weights.copy()).signature())
+        self.assertNotEqual(QueryWithWeights(weights).signature(), QueryWithWeights(other).signature())
+        self.assertNotEqual(QueryWithWeights(weights).signature(),
+                            QueryWithWeights(weights.astype(np.float32)).signature())
+
+    def test_defaults_and_nan(self):
+        self.assertEqual(QueryWithWeights([1, 2]).signature(), QueryWithWeights([1, 2], scale=1.0).signature())
+        self.assertEqual(QueryWithWeights(float('nan')).signature(), QueryWithWeights(float('nan')).signature())
+        self.assertNotEqual(QueryWithWeights([1, 2]).signature(), QueryWithWeights((1, 2)).signature())
+
+
+class QueryCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        bayesianpy.jni.attach()
+        self.network = bayesServer().Network()
+        a = self._add_node('a')
+        b = self._add_node('b')
+        bayesianpy.network.Builder.create_link(self.network, a, b)
+        self._set_distributions(0.3, 0.9)
+
+        self.cache = QueryResultCache(max_size=10)
+        engine = InferenceEngine(self.network).create_engine()
+        self.evidence = Evidence(self.network, engine)
+        self.query = Query(self.network, engine, None, cache=self.cache, evidence=self.evidence)
+
+    def _add_node(self, name):
+        variable = bayesServer().Variable(name, ['x', 'y'])
+        node = bayesServer().Node(variable)
+        self.network.getNodes().add(node)
+        return node
+
+    def _set_distributions(self, p_a, p_b_given_a):
+        variables = self.network.getVariables()
+        a, b = variables.get('a'), variables.get('b')
+
+        table = a.getNode().newDistribution().getTable()
+        table.set(p_a, [a.getStates().get('x')])
+        table.set(1 - p_a, [a.getStates().get('y')])
+        a.getNode().setDistribution(table)
+
+        table = b.getNode().newDistribution().getTable()
+        for a_state, p in (('x', p_b_given_a), ('y', 1 - p_b_given_a)):
+            table.set(p, [a.getStates().get(a_state), b.getStates().get('x')])
+            table.set(1 - p, [a.getStates().get(a_state), b.getStates().get('y')])
+        b.getNode().setDistribution(table)
+
+    def _probability(self, evidence):
+        self.evidence.apply(evidence)
+        return self.query.execute([QueryStateProbability('b', target_state_name='x')])[0]['b_probability']
+
+    def test_hits_and_misses(self):
+        first = self._probability({'a': 'x'})
+        self.assertEqual(self._probability({'a': 'x'}), first)
+        self.assertNotEqual(self._probability({'a': 'y'}), first)
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_changing_the_network_invalidates(self):
+        before = self._probability({'a': 'x'})
+
+        self._set_distributions(0.3, 0.2)
+        bayesianpy.network.bump_network_version(self.network)
+
+        self.assertNotEqual(self._probability({'a': 'x'}), before)
+        self.assertEqual(self.cache.stats()['hits'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
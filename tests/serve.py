@@ -0,0 +1,114 @@
+import unittest
+import asyncio
+import io
+import os
+import socket
+import tempfile
+import shutil
+import threading
+import time
+from bayesianpy.serve import frame, read_frame, encode, decode, query_spec, CODEC_JSON, CODEC_MSGPACK, \
+    FRAME_HEADER, LatencyRecorder, ModelServer, Client
+
+
+class FramingTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        codecs = [CODEC_JSON]
+        try:
+            import msgpack
+            codecs.append(CODEC_MSGPACK)
+        except ImportError:
+            pass
+
+        message = {'id': 1, 'evidence': {'a': ['x', None], 'b': [1.5, 2.0]}}
+        for codec in codecs:
+            self.assertEqual(decode(encode(message, codec), codec), message)
+            self.assertEqual(read_frame(io.BytesIO(frame(message, codec) * 2)), (message, codec))
+
+    def test_closed_stream(self):
+        self.assertEqual(read_frame(io.BytesIO(b'')), (None, None))
+        self.assertEqual(read_frame(io.BytesIO(frame({'id': 1}, CODEC_JSON)[:-1])), (None, None))
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            encode({}, 7)
+
+    def test_query_spec(self):
+        self.assertEqual(query_spec('QueryMeanVariance', 'age'),
+                         {'type': 'QueryMeanVariance', 'args': ['age'], 'kwargs': {}})
+        with self.assertRaises(ValueError):
+            query_spec('dict')
+
+
+class LatencyRecorderTestCase(unittest.TestCase):
+
+    def test_percentiles(self):
+        recorder = LatencyRecorder(window=100)
+        self.assertEqual(recorder.percentiles(), {'count': 0})
+
+        for i in range(1, 201):
+            recorder.record(i / 1000)
+
+        stats = recorder.percentiles()
+        # only the most recent 100 are kept.
+        self.assertEqual(stats['count'], 200)
+        self.assertAlmostEqual(stats['p50_ms'], 150.5)
+        self.assertAlmostEqual(stats['max_ms'], 200)
+
+
+class ClientTestCase(unittest.TestCase):
+    # exercises the protocol end to end, without running any inference (so without a JVM).
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "serve.sock")
+        self.loop = asyncio.new_event_loop()
+        self.server = ModelServer({'model': object()}, workers=1)
+
+        async def run():
+            await self.server.start()
+            try:
+                await self.server.serve_unix(self.path)
+            finally:
+                await self.server.stop()
+
+        def serve():
+            try:
+                self.loop.run_until_complete(self.task)
+            except asyncio.CancelledError:
+                pass
+
+        self.task = self.loop.create_task(run())
+        self.thread = threading.Thread(target=serve)
+        self.thread.start()
+        while not os.path.exists(self.path):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join(timeout=5)
+        self.loop.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_commands(self):
+        with Client(self.path, codec=CODEC_JSON) as client:
+            self.assertEqual(client.networks(), ['model'])
+            with self.assertRaises(ValueError):
+                client.query('other', {'a': ['x']}, [query_spec('QueryMeanVariance', 'a')])
+
+            # the stats request itself isn't counted until it's answered.
+            self.assertEqual(client.stats()['latency']['count'], 2)
+
+    def test_undecodable_request(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            sock.sendall(FRAME_HEADER.pack(3, CODEC_JSON) + b'{{{')
+            response, _ = read_frame(sock.makefile('rb'))
+
+        self.assertIsNone(response['id'])
+        self.assertIn("Could not decode", response['error'])
+
+
+if __name__ == "__main__":
+    unittest.main()
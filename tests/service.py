@@ -0,0 +1,74 @@
+import unittest
+import asyncio
+import threading
+from bayesianpy.service import AsyncInferenceService
+
+
+class FakeService(AsyncInferenceService):
+    # answers with the evidence, without running any inference (so without a JVM).
+
+    def __init__(self, barrier: threading.Barrier=None, **kwargs):
+        super().__init__(object(), **kwargs)
+        self.barrier = barrier
+        self.chunks = []
+
+    def _run(self, batch):
+        self.chunks.append((threading.get_ident(), [request.evidence['a'] for request in batch]))
+        if self.barrier is not None:
+            # only passes if the chunks of a batch are run at the same time.
+            self.barrier.wait(timeout=5)
+
+        return [{'a': request.evidence['a']} for request in batch]
+
+
+class AsyncInferenceServiceTestCase(unittest.TestCase):
+
+    def _run(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_batches_are_split_across_workers(self):
+        service = FakeService(barrier=threading.Barrier(2), max_batch_size=8, max_wait=1.0, workers=2)
+
+        async def run():
+            async with service:
+                return await asyncio.gather(*[service.query({'a': i}, []) for i in range(8)])
+
+        self.assertEqual(self._run(run()), [{'a': i} for i in range(8)])
+        self.assertEqual(service.get_statistics()['batches'], 1)
+        self.assertEqual(sorted(len(evidence) for _, evidence in service.chunks), [4, 4])
+        self.assertEqual(len(set(thread for thread, _ in service.chunks)), 2)
+
+    def test_stop_runs_the_batch_being_gathered(self):
+        service = FakeService(max_batch_size=8, max_wait=10.0, workers=2)
+
+        async def run():
+            await service.start()
+            queries = [asyncio.ensure_future(service.query({'a': i}, [])) for i in range(3)]
+            await asyncio.sleep(0.05)
+            await service.stop()
+            return await asyncio.gather(*queries)
+
+        self.assertEqual(self._run(run()), [{'a': 0}, {'a': 1}, {'a': 2}])
+
+    def test_cancelled_requests_are_not_run(self):
+        service = FakeService(max_batch_size=8, max_wait=0.2, workers=2)
+
+        async def run():
+            async with service:
+                cancelled = asyncio.ensure_future(service.query({'a': 0}, []))
+                kept = asyncio.ensure_future(service.query({'a': 1}, []))
+                await asyncio.sleep(0.05)
+                cancelled.cancel()
+                return await kept
+
+        self.assertEqual(self._run(run()), {'a': 1})
+        self.assertEqual([evidence for _, evidence in service.chunks], [[1]])
+        self.assertEqual(service.get_statistics()['requests'], 1)
+
+    def test_query_before_start(self):
+        with self.assertRaises(RuntimeError):
+            self._run(FakeService().query({'a': 0}, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
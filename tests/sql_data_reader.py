@@ -0,0 +1,58 @@
+import unittest
+import sqlite3
+import tempfile
+import shutil
+import os
+import bayesianpy.jni
+from bayesianpy.jni import jp
+from bayesianpy.reader import CreateSqlDataReaderCommand, get_connection_pool, close_connection_pools
+
+
+class CreateSqlDataReaderCommandTestCase(unittest.TestCase):
+
+    def setUp(self):
+        bayesianpy.jni.attach()
+        self.folder = tempfile.mkdtemp()
+        path = os.path.join(self.folder, "reader.db")
+        with sqlite3.connect(path) as conn:
+            conn.execute("create table t (ix integer)")
+            conn.executemany("insert into t values (?)", [(i,) for i in range(10)])
+
+        self.url = "jdbc:sqlite:{}".format(path)
+
+    def tearDown(self):
+        close_connection_pools()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _read(self, command: CreateSqlDataReaderCommand):
+        # go through the Java interfaces, as BayesServer's evidence readers do.
+        data_reader_command = jp.JObject(command.create(None), jp.JClass("com.bayesserver.data.DataReaderCommand"))
+        reader = jp.JObject(data_reader_command.executeReader(), jp.JClass("com.bayesserver.data.DataReader"))
+        values = []
+        try:
+            while reader.read():
+                values.append(int(reader.getInt(reader.getColumnIndex("ix"))))
+        finally:
+            reader.close()
+
+        return values
+
+    def test_streaming_with_a_fetch_size(self):
+        command = CreateSqlDataReaderCommand(self.url, "select ix from t order by ix", fetch_size=3, streaming=True)
+
+        self.assertEqual(self._read(command), list(range(10)))
+        connection = get_connection_pool(self.url).borrow()
+        # the read only transaction was ended, and the connection went back to the pool.
+        self.assertFalse(connection.getAutoCommit())
+        get_connection_pool(self.url).release(connection)
+
+    def test_pages(self):
+        command = CreateSqlDataReaderCommand(self.url, ["select ix from t where ix between 0 and 4 order by ix",
+                                                        "select ix from t where ix between 5 and 9 order by ix"],
+                                             fetch_size=2)
+
+        self.assertEqual(self._read(command), list(range(10)))
+
+
+if __name__ == "__main__":
+    unittest.main()
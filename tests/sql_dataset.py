@@ -0,0 +1,101 @@
+import unittest
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import shutil
+import numpy as np
+import pandas as pd
+from bayesianpy.data import SqlDataSet, DefaultDataSet, DatasetCache
+
+
+class SqlDataSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        df = pd.DataFrame({'x': np.arange(1000, dtype=float)}, index=pd.RangeIndex(1000, name='ix'))
+        self.dataset = DefaultDataSet(df, db_folder=self.folder)
+
+    def tearDown(self):
+        self.dataset.cleanup()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _read_ix(self, query):
+        with sqlite3.connect(self.dataset._get_db_path()) as conn:
+            return [row[0] for row in conn.execute(query.replace("t.*", "t.ix").replace("select *", "select ix"))]
+
+    def test_to_ranges(self):
+        self.assertEqual(SqlDataSet._to_ranges(np.array([1, 2, 3, 7, 8, 10])), [(1, 3), (7, 8), (10, 10)])
+        self.assertEqual(SqlDataSet._to_ranges(np.array([], dtype=int)), [])
+
+    def test_contiguous_indices_are_read_with_between(self):
+        self.dataset.write()
+        query = self.dataset.create_query([5, 3, 4, 20, 21])
+
+        self.assertIn("between 3 and 5", query)
+        self.assertEqual(self._read_ix(query), [3, 4, 5, 20, 21])
+
+    def test_empty_subset(self):
+        self.dataset.write()
+        query = self.dataset.create_query([])
+
+        self.assertEqual(self._read_ix(query), [])
+
+    def test_scattered_indices_are_joined_on(self):
+        self.dataset.write()
+        indices = list(range(0, 1000, 3))
+        query = self.dataset.create_query(indices)
+        subset_table = query.split(" inner join ")[1].split(" ")[0]
+
+        self.assertLessEqual(len(subset_table), 31)
+        self.assertEqual(self._read_ix(query), indices)
+
+    def test_subset_tables_are_dropped(self):
+        self.dataset = DefaultDataSet(self.dataset.data, db_folder=self.folder, cleanup=False)
+        self.dataset.write()
+        self.dataset.create_query(list(range(0, 1000, 3)))
+        self.dataset.cleanup()
+
+        with sqlite3.connect(self.dataset._get_db_path()) as conn:
+            self.assertEqual(conn.execute("select count(*) from sqlite_master where type='table'").fetchone()[0], 1)
+
+    def test_shared_db_is_not_written_to(self):
+        self.dataset = DefaultDataSet(self.dataset.data, db_folder=self.folder, content_addressed=True)
+        self.dataset.write()
+        indices = list(range(0, 1000, 3))
+        command = self.dataset.create_subset_data_reader_command(indices)
+
+        with sqlite3.connect(command._conn[len("jdbc:sqlite:"):]) as conn:
+            self.assertEqual([row[0] for row in conn.execute(command._queries[0].replace("select *", "select ix"))],
+                             indices)
+        with sqlite3.connect(self.dataset._get_db_path()) as conn:
+            self.assertEqual(conn.execute("select count(*) from sqlite_master where type='table'").fetchone()[0], 1)
+        with self.assertRaises(ValueError):
+            self.dataset.create_query(indices)
+
+    def test_subsets_are_hashed_by_their_own_content(self):
+        self.dataset = DefaultDataSet(self.dataset.data, db_folder=self.folder, content_addressed=True)
+        subset = self.dataset.subset(list(range(10)))
+        subset.write()
+        try:
+            self.assertNotEqual(subset.uuid, self.dataset.uuid)
+            self.assertFalse(os.path.exists(self.dataset._get_db_path()))
+        finally:
+            subset.cleanup()
+
+    def test_references_of_dead_processes_are_dropped(self):
+        cache = DatasetCache(os.path.join(self.folder, "cache"), max_bytes=0)
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        with open(cache.get_path("dead"), 'w') as fh:
+            fh.write("x")
+        cache._write_manifest({'dead': {'refs': {str(process.pid): 1}, 'size': 1, 'last_used': 0}})
+
+        cache.acquire("live", lambda path: open(path, 'w').close())
+
+        self.assertFalse(os.path.exists(cache.get_path("dead")))
+        self.assertEqual(cache._read_manifest()['live']['refs'], {str(os.getpid()): 1})
+
+if __name__ == "__main__":
+    unittest.main()
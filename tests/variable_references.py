@@ -0,0 +1,47 @@
+import unittest
+import pandas as pd
+import bayesianpy.jni
+import bayesianpy.network
+from bayesianpy.network import Builder as builder
+
+
+class VariableReferencesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        bayesianpy.jni.attach()
+        self.df = pd.DataFrame({'a': [1.0, 2.0], 'b': ['x', 'y'], 'c': [0.5, 0.1]})
+        self.network = bayesianpy.network.create_network()
+        builder.create_continuous_variable(self.network, 'a')
+        builder.create_discrete_variable(self.network, self.df, 'b')
+
+    def _names(self, references):
+        return sorted(str(reference.getColumn()) for reference in references)
+
+    def test_memoised_per_network_and_schema(self):
+        references = bayesianpy.network.create_variable_references(self.network, self.df)
+
+        self.assertEqual(self._names(references), ['a', 'b'])
+        self.assertIs(bayesianpy.network.create_variable_references(self.network, self.df)[0], references[0])
+        self.assertEqual(self._names(bayesianpy.network.create_variable_references(self.network, self.df[['a']])),
+                         ['a'])
+
+    def test_changing_the_network_drops_the_references(self):
+        version = bayesianpy.network.get_network_version(self.network)
+        bayesianpy.network.create_variable_references(self.network, self.df)
+        builder.create_continuous_variable(self.network, 'c')
+
+        self.assertNotEqual(bayesianpy.network.get_network_version(self.network), version)
+        self.assertEqual(self._names(bayesianpy.network.create_variable_references(self.network, self.df)),
+                         ['a', 'b', 'c'])
+
+    def test_copies_have_their_own_references(self):
+        references = bayesianpy.network.create_variable_references(self.network, self.df)
+        copy = self.network.copy()
+
+        self.assertIsNot(bayesianpy.network.create_variable_references(copy, self.df)[0], references[0])
+        self.assertNotEqual(bayesianpy.network.get_network_version(copy),
+                            bayesianpy.network.get_network_version(self.network))
+
+
+if __name__ == "__main__":
+    unittest.main()